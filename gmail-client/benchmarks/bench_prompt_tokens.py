@@ -0,0 +1,85 @@
+"""
+Prompt tokens spent on one fetch_recent_emails result: the old
+`Tool ... returned: {str(result)}` message versus compact_result.
+
+Results come from the gmail server's own tool, called in-process over MCP
+memory streams against FakeGmail mailboxes of growing size (paging disabled,
+so the raw size grows with the mailbox), plus the batch response fixture.
+
+    cd gmail-client && python -m benchmarks.bench_prompt_tokens --budget 2000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+GMAIL_ROOT = Path(__file__).resolve().parents[2] / "gmail"
+sys.path.insert(0, str(GMAIL_ROOT))
+os.environ.setdefault("GMAIL_CACHE_URL", "")
+
+import httpx
+from mcp.shared.memory import create_connected_server_and_client_session
+from mcp.types import CallToolResult, TextContent
+
+from app.gmail_api import extract_email_content, parse_gmail_batch_response
+from app.main import mcp
+from app.model import FetchRecentEmailsResponse
+from app.transport import AsyncTransport, set_transport
+from tests.fake_gmail import FakeGmail
+
+from compaction import CHARS_PER_TOKEN, ENCODING, compact_result, count_tokens, exact_token_counts
+
+FIXTURE = GMAIL_ROOT / "tests" / "fixtures" / "mock_batch_response.json"
+
+
+def fixture_result() -> CallToolResult:
+    data = json.loads(FIXTURE.read_text())
+    response = SimpleNamespace(headers=data["headers"], text=data["response_text"])
+    records = extract_email_content(parse_gmail_batch_response(response))
+    text = FetchRecentEmailsResponse.from_records(records, total=len(records)).model_dump_json(indent=2)
+    return CallToolResult(content=[TextContent(type="text", text=text)])
+
+
+async def mailbox_result(threads: int, messages_per_thread: int) -> CallToolResult:
+    fake = FakeGmail(num_threads=threads, messages_per_thread=messages_per_thread)
+    set_transport(AsyncTransport(httpx.AsyncClient(transport=httpx.MockTransport(fake.httpx_handler))))
+    async with create_connected_server_and_client_session(mcp._mcp_server) as session:
+        return await session.call_tool("fetch_recent_emails", {
+            "access_token": "token", "max_threads": threads, "max_bytes": 10 ** 8,
+        })
+
+
+def report(name: str, result: CallToolResult, budget: int):
+    raw = count_tokens(f"Tool fetch_recent_emails returned: {str(result)}")
+    compact = count_tokens(compact_result(result, token_budget=10 ** 9))
+    budgeted = count_tokens(compact_result(result, token_budget=budget))
+    print(f"{name:>16}: repr={raw:8d}  compact={compact:7d} ({raw / max(compact, 1):4.1f}x)  "
+          f"budget {budget}={budgeted:6d}")
+
+
+async def run(sizes, messages_per_thread: int, budget: int):
+    if exact_token_counts():
+        print(f"Tokens counted with tiktoken {ENCODING}")
+    else:
+        print(f"Tokens ESTIMATED as characters / {CHARS_PER_TOKEN}: tiktoken or its {ENCODING} data is unavailable")
+    report("fixture", fixture_result(), budget)
+    for threads in sizes:
+        report(f"{threads} threads", await mailbox_result(threads, messages_per_thread), budget)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200, 500])
+    parser.add_argument("--messages-per-thread", type=int, default=3)
+    parser.add_argument("--budget", type=int, default=2000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.sizes, args.messages_per_thread, args.budget))
+
+
+if __name__ == "__main__":
+    main()
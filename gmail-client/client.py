@@ -1,13 +1,14 @@
-from mcpclient import MCPClient
+from mcpclient import DEFAULT_MAX_STEPS, MCPClient
 
-import asyncio, sys
+import asyncio, os, sys
 
 async def main():
     if len(sys.argv) < 2:
-        print("Usage: python client.py <path_to_server_script>")
+        print("Usage: python client.py <path_to_server_script | server_url>")
         sys.exit(1)
 
-    client = MCPClient()
+    client = MCPClient(max_steps=int(os.environ.get("MCP_MAX_STEPS", DEFAULT_MAX_STEPS)),
+                       digest_path=os.environ.get("MCP_DIGEST_CACHE", "digest_cache.json"))
     try:
         await client.connect_to_server(sys.argv[1])
         await client.chat_loop()
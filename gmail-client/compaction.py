@@ -0,0 +1,182 @@
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Tool results larger than this are cut down before they go back to the LLM.
+DEFAULT_TOKEN_BUDGET = 2000
+DEFAULT_SNIPPET_CHARS = 120
+# Token estimate used when tiktoken is not installed.
+CHARS_PER_TOKEN = 4
+ENCODING = "o200k_base"
+
+OMITTED_NOTE = ("[{} more threads omitted to fit the token budget; "
+                "use next_cursor or narrow the request to see them]")
+
+_REPLY_PREFIX = re.compile(r"^\s*((re|fwd?|aw|wg)\s*:\s*)+", re.IGNORECASE)
+_encoding = None
+
+def _get_encoding():
+    """
+    The tiktoken encoding, loaded on first use; False when it is unavailable.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(ENCODING)
+        except Exception:
+            _encoding = False
+    return _encoding
+
+def exact_token_counts() -> bool:
+    """
+    Whether count_tokens uses tiktoken rather than the character estimate.
+    """
+    return bool(_get_encoding())
+
+def count_tokens(text: str) -> int:
+    """
+    Tokens in `text` for the model's encoding, or an estimate without tiktoken.
+    """
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def truncate(text: Optional[str], limit: int) -> str:
+    text = " ".join((text or "").split())
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return text[:max(limit - 1, 0)].rstrip() + "…"
+
+def base_subject(subject: Optional[str]) -> str:
+    return _REPLY_PREFIX.sub("", subject or "").strip()
+
+def tool_payloads(result) -> List:
+    """
+    The result's content, with JSON text parsed.
+    """
+    if result.structuredContent is not None:
+        return [result.structuredContent]
+    payloads = []
+    for content in result.content:
+        if content.type != "text":
+            payloads.append(f"[{content.type} content]")
+            continue
+        try:
+            payloads.append(json.loads(content.text))
+        except ValueError:
+            payloads.append(content.text)
+    return payloads
+
+def group_threads(emails: List[Dict]) -> Dict[Tuple, List[Dict]]:
+    """
+    Emails by (account, thread_id), in the order the threads first appear.
+    """
+    threads: Dict[Tuple, List[Dict]] = {}
+    for email in emails:
+        key = (email.get("account"), email.get("thread_id") or email.get("id"))
+        threads.setdefault(key, []).append(email)
+    return threads
+
+def compact_emails(payload: Dict, snippet_chars: int,
+                   digests: Optional[Dict[Tuple, str]] = None) -> Tuple[List[str], List[str]]:
+    """
+    An email listing as header lines (summary, aliases for repeated senders)
+    and one text block per thread, in the order the server returned them.
+    Threads with an entry in `digests` are given as that summary instead of
+    message by message.
+    """
+    digests = digests or {}
+    emails = payload.get("emails", [])
+    counts: Dict[str, int] = {}
+    for email in emails:
+        sender = email.get("from_") or "unknown"
+        counts[sender] = counts.get(sender, 0) + 1
+    aliases = {sender: f"s{index}" for index, sender in
+               enumerate((s for s, n in counts.items() if n > 1), start=1)}
+
+    summary = [f"emails={len(emails)}"]
+    for key in ("total", "source", "next_cursor"):
+        if payload.get(key) is not None:
+            summary.append(f"{key}={payload[key]}")
+    header = [" ".join(summary)]
+    if payload.get("errors"):
+        header.append("errors: " + "; ".join(f"{e['account']}: {e['error']}" for e in payload["errors"]))
+    if payload.get("dropped_thread_ids"):
+        header.append(f"unavailable threads: {json.dumps(payload['dropped_thread_ids'])}")
+    if aliases:
+        header.append("senders: " + "; ".join(f"{alias}={sender}" for sender, alias in aliases.items()))
+
+    blocks = []
+    for (account, thread_id), messages in group_threads(emails).items():
+        subject = base_subject(messages[0].get("subject"))
+        block = [f"thread {thread_id}" + (f" [{account}]" if account else "") + f': "{subject}"']
+        if (account, thread_id) in digests:
+            block.append(f"- summary of {len(messages)} messages: {digests[account, thread_id]}")
+            blocks.append("\n".join(block))
+            continue
+        for message in messages:
+            sender = message.get("from_") or "unknown"
+            line = f"- {aliases.get(sender, sender)}: {truncate(message.get('snippet'), snippet_chars)}"
+            if base_subject(message.get("subject")) != subject:
+                line += f' (subject: "{message.get("subject")}")'
+            block.append(line)
+            if message.get("body"):
+                block.append(f"  body: {truncate(message['body'], snippet_chars * 4)}")
+        blocks.append("\n".join(block))
+    return header, blocks
+
+def fit_lines(header: List[str], blocks: List[str], token_budget: int) -> str:
+    """
+    Header plus as many whole blocks as fit in `token_budget`, noting what was left out.
+    """
+    def fill(budget: int) -> List[str]:
+        used = count_tokens("\n".join(header))
+        kept = []
+        for block in blocks:
+            cost = count_tokens(block) + 1
+            if used + cost > budget:
+                break
+            kept.append(block)
+            used += cost
+        return kept
+
+    kept = fill(token_budget)
+    if len(kept) < len(blocks):
+        # Leave room for the note about what was cut.
+        kept = fill(token_budget - count_tokens(OMITTED_NOTE.format(len(blocks))) - 1)
+        kept.append(OMITTED_NOTE.format(len(blocks) - len(kept)))
+    return "\n".join(header + kept)
+
+def truncate_tokens(text: str, token_budget: int) -> str:
+    if count_tokens(text) <= token_budget:
+        return text
+    limit = token_budget * CHARS_PER_TOKEN
+    while limit > 0 and count_tokens(text[:limit]) > token_budget:
+        limit = limit * 3 // 4
+    return text[:limit] + "…[truncated]"
+
+def compact_result(result, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                   snippet_chars: int = DEFAULT_SNIPPET_CHARS,
+                   digests: Optional[Dict[Tuple, str]] = None) -> str:
+    """
+    A compact text form of a CallToolResult for the LLM, within `token_budget` tokens.
+
+    Email listings are grouped by thread with repeated senders aliased and
+    snippets truncated, or replaced by the thread's summary from `digests`;
+    other JSON is re-encoded without whitespace.
+    """
+    parts = []
+    for payload in tool_payloads(result):
+        if isinstance(payload, dict) and isinstance(payload.get("emails"), list):
+            header, blocks = compact_emails(payload, snippet_chars, digests)
+            parts.append(fit_lines(header, blocks, token_budget))
+        elif isinstance(payload, str):
+            parts.append(payload)
+        else:
+            parts.append(json.dumps(payload, separators=(",", ":"), ensure_ascii=False))
+    text = "\n".join(parts)
+    if result.isError:
+        text = "Error: " + text
+    return truncate_tokens(text, token_budget)
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from compaction import count_tokens, group_threads, tool_payloads
+
+# Threads shorter than this (tokens of their raw JSON) go to the LLM as they
+# are; summarizing them would cost more than it saves.
+DIGEST_MIN_TOKENS = 200
+MAX_CONCURRENT_DIGESTS = 4
+
+# Called with the previous digest (None for a new thread) and the messages it
+# does not cover yet; returns the updated digest.
+Summarizer = Callable[[Optional[str], List[Dict]], Awaitable[str]]
+
+@dataclass
+class Digest:
+    # The thread's Gmail historyId when the digest was written.
+    history_id: str
+    message_ids: List[str]
+    text: str
+
+class DigestCache:
+    """
+    LLM digests of email threads keyed by (account, thread_id), reused while
+    the thread's Gmail historyId is unchanged.
+
+    A thread that only gained messages has its digest extended with the new
+    ones instead of being summarized again from the start. With `path`, the
+    digests are kept on disk across runs.
+    """
+
+    def __init__(self, summarize: Summarizer, path: Optional[str] = None,
+                 min_tokens: int = DIGEST_MIN_TOKENS,
+                 max_concurrency: int = MAX_CONCURRENT_DIGESTS):
+        self.summarize = summarize
+        self.path = path
+        self.min_tokens = min_tokens
+        self.digests: Dict[Tuple, Digest] = self._load()
+        self.hits = 0
+        self.extended = 0
+        self.summarized = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def _load(self) -> Dict[Tuple, Digest]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        # The file is only a cache: start empty rather than fail on one that is
+        # corrupt or from an older format.
+        try:
+            with open(self.path) as file:
+                entries = json.load(file)
+            return {(entry.pop("account"), entry.pop("thread_id")): Digest(**entry) for entry in entries}
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            return {}
+
+    def save(self):
+        if not self.path:
+            return
+        entries = [{"account": account, "thread_id": thread_id, **asdict(digest)}
+                   for (account, thread_id), digest in self.digests.items()]
+        # Write then rename, so an interrupted save never leaves a torn file.
+        with open(self.path + ".tmp", "w") as file:
+            json.dump(entries, file)
+        os.replace(self.path + ".tmp", self.path)
+
+    async def digest(self, key: Tuple, history_id: str, messages: List[Dict]) -> str:
+        """
+        The digest of a thread as listed now, calling the summarizer only for
+        what the cached digest does not cover.
+        """
+        cached = self.digests.get(key)
+        ids = [message["id"] for message in messages]
+        # Same historyId: nothing changed, though this listing may show more
+        # of the thread. Older historyId: reusable if no message was removed.
+        if cached is not None and (cached.history_id == history_id
+                                   or set(cached.message_ids) <= set(ids)):
+            new = [message for message in messages if message["id"] not in cached.message_ids]
+            if not new:
+                self.hits += 1
+                text = cached.text
+            else:
+                async with self._semaphore:
+                    text = await self.summarize(cached.text, new)
+                self.extended += 1
+            message_ids = cached.message_ids + [message["id"] for message in new]
+        else:
+            async with self._semaphore:
+                text = await self.summarize(None, messages)
+            self.summarized += 1
+            message_ids = ids
+        self.digests[key] = Digest(history_id, message_ids, text)
+        return text
+
+    async def digest_result(self, result) -> Dict[Tuple, str]:
+        """
+        Digests of the long threads in an email listing tool result, keyed
+        like compaction.group_threads. Threads without a history_id (older
+        servers) are left out.
+        """
+        if result.isError:
+            return {}
+        pending = {}
+        for payload in tool_payloads(result):
+            if not isinstance(payload, dict) or not isinstance(payload.get("emails"), list):
+                continue
+            for key, messages in group_threads(payload["emails"]).items():
+                history_id = messages[0].get("history_id")
+                if history_id is None or count_tokens(json.dumps(messages)) < self.min_tokens:
+                    continue
+                pending[key] = (history_id, messages)
+        if not pending:
+            return {}
+        texts = await asyncio.gather(*(self.digest(key, history_id, messages)
+                                       for key, (history_id, messages) in pending.items()))
+        self.save()
+        return dict(zip(pending, texts))
+
+    def stats(self) -> Dict:
+        return {"threads": len(self.digests), "hits": self.hits,
+                "extended": self.extended, "summarized": self.summarized}
@@ -1,63 +1,167 @@
-import json
+import asyncio
 import os.path
+from datetime import datetime, timezone
+from typing import Callable, Optional
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.errors import HttpError
 
 TOKEN_PATH = "creds/token.json"
 CREDENTIALS_PATH = "creds/credentials.json"
 
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 
-def get_access_token():
+# Refresh this many seconds before the access token expires, so calls made
+# while a refresh is in flight still carry a valid token.
+REFRESH_MARGIN = 300
+# How long to wait before retrying a failed background refresh.
+RETRY_DELAY = 30
+
+def load_credentials(token_path: str = TOKEN_PATH,
+                     credentials_path: str = CREDENTIALS_PATH) -> Credentials:
     """
-    OAuth flow to get the access token for the Gmail API.
-    
+    OAuth flow to get credentials for the Gmail API.
+
     Raises:
         FileNotFoundError: If the credentials file is not found.
-        HttpError: If an error occurs with the Gmail API.
-        
+
     Returns:
-        str: The access token for the Gmail API.
+        Credentials: Valid credentials, refreshed or newly authorized if needed.
     """
     creds = None
     # The file token.json stores the user's access and refresh tokens, and is
     # created automatically when the authorization flow completes for the first
     # time.
-    
+
     # Check if the user provided GCP credentials file or not.
-    if not os.path.exists(CREDENTIALS_PATH):
-        raise FileNotFoundError("Credentials not found on path: " + CREDENTIALS_PATH)
-    
+    if not os.path.exists(credentials_path):
+        raise FileNotFoundError("Credentials not found on path: " + credentials_path)
+
     # Check if the user has a token generated or not.
-    if os.path.exists(TOKEN_PATH):
-        creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
-    
+    if os.path.exists(token_path):
+        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
+
     # If there are no (valid) credentials available, let the user log in.
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
         else:
             flow = InstalledAppFlow.from_client_secrets_file(
-                CREDENTIALS_PATH, SCOPES
+                credentials_path, SCOPES
             )
             creds = flow.run_local_server(port=0)
         # Save the credentials for the next run
-        with open(TOKEN_PATH, "w") as token:
-            token.write(creds.to_json())
-
-    try:
-    # Call the Gmail API
-        with open(TOKEN_PATH, 'r') as f:
-            data  = json.load(f)
-        
-        token = data['token']
-        return token
-    except HttpError as error:
-        raise HttpError(f"An error occurred with the Gmail API: {error}")
-    
+        save_credentials(creds, token_path)
+    return creds
+
+def save_credentials(creds: Credentials, token_path: str = TOKEN_PATH):
+    with open(token_path, "w") as token:
+        token.write(creds.to_json())
+
+def get_access_token() -> str:
+    """
+    The access token for the Gmail API, from the credentials on disk.
+    """
+    return load_credentials().token
+
+def _utcnow() -> datetime:
+    # google-auth keeps expiry as a naive UTC datetime.
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class CredentialManager:
+    """
+    Keeps the Gmail credentials in memory and refreshes them shortly before
+    they expire, in the background once `start` is called.
+
+    Concurrent callers share one refresh instead of each hitting the token endpoint.
+    """
+
+    def __init__(self, creds: Credentials, token_path: Optional[str] = TOKEN_PATH,
+                 refresh_margin: float = REFRESH_MARGIN,
+                 request_factory: Callable[[], Request] = Request,
+                 clock: Callable[[], datetime] = _utcnow):
+        self.creds = creds
+        self.token_path = token_path
+        self.refresh_margin = refresh_margin
+        self.request_factory = request_factory
+        self.clock = clock
+        self.refreshes = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_files(cls, token_path: str = TOKEN_PATH,
+                   credentials_path: str = CREDENTIALS_PATH, **kwargs) -> "CredentialManager":
+        return cls(load_credentials(token_path, credentials_path), token_path=token_path, **kwargs)
+
+    def seconds_left(self) -> float:
+        """
+        Seconds until the access token expires; infinite if it has no expiry.
+        """
+        if self.creds.expiry is None:
+            return float("inf")
+        return (self.creds.expiry - self.clock()).total_seconds()
+
+    def needs_refresh(self) -> bool:
+        return not self.creds.token or self.seconds_left() <= self.refresh_margin
+
+    async def get_token(self) -> str:
+        """
+        A valid access token, refreshing first if it is about to expire.
+        """
+        if self.needs_refresh():
+            await self.refresh()
+        return self.creds.token
+
+    async def refresh(self, force: bool = False):
+        """
+        Refresh the credentials unless another caller already did while we waited.
+        """
+        async with self._lock:
+            if not force and not self.needs_refresh():
+                return
+            # google-auth refreshes with blocking I/O; keep the event loop free.
+            await asyncio.to_thread(self._refresh_and_save)
+            self.refreshes += 1
+
+    def _refresh_and_save(self):
+        self.creds.refresh(self.request_factory())
+        if self.token_path:
+            save_credentials(self.creds, self.token_path)
+
+    def start(self):
+        """
+        Refresh in the background for as long as the manager is open.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            delay = self.seconds_left() - self.refresh_margin
+            if delay == float("inf"):
+                return
+            await asyncio.sleep(max(delay, 0))
+            try:
+                await self.refresh()
+            except Exception:
+                # get_token retries on demand; try again in the background later.
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            if self.needs_refresh():
+                # The new token lives shorter than the margin; do not spin.
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
 # Main entry point to test the function
 if __name__ == "__main__":
     print(get_access_token())
@@ -1,27 +1,123 @@
-import asyncio, json
-from typing import Optional
+import asyncio, json, sys, time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
 from contextlib import AsyncExitStack
 
-from gmail_credentials import get_access_token
+from compaction import DEFAULT_TOKEN_BUDGET, compact_result, truncate
+from digests import DigestCache
+from gmail_credentials import CredentialManager
 
-from mcp import ClientSession, StdioServerParameters
+from mcp import ClientSession, StdioServerParameters, types
+from mcp.client.sse import sse_client
 from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
 
-from openai import OpenAI
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
 load_dotenv()
 
+MODEL = "gpt-4o-mini"
+# Model turns per query before giving up on a final answer.
+DEFAULT_MAX_STEPS = 8
+
+# Arguments the client fills in itself; they are hidden from the LLM.
+INJECTED_ARGUMENTS = {"access_token"}
+# Arguments only a server-to-server caller can supply (this client holds one
+# account's token); tools taking them are not offered to the LLM, which would
+# otherwise have to invent the values.
+SERVER_ONLY_ARGUMENTS = {"access_tokens"}
+
+DIGEST_INSTRUCTIONS = (
+    "Summarize this email thread in at most three sentences for an assistant "
+    "answering questions about the inbox. Keep names, dates, amounts and open "
+    "requests. If a previous summary is given, update it with the new messages."
+)
+# Longest message body passed to the summarizer, in characters.
+DIGEST_BODY_CHARS = 2000
+
+@dataclass
+class StepTiming:
+    step: int
+    llm_seconds: float
+    tool_calls: int = 0
+    tool_seconds: float = 0.0
+    # Until the first streamed text token; None if the turn produced no text.
+    first_token_seconds: Optional[float] = None
+
+    def __str__(self) -> str:
+        text = f"step {self.step}: llm {self.llm_seconds:.2f}s"
+        if self.first_token_seconds is not None:
+            text += f" (first token {self.first_token_seconds:.2f}s)"
+        if self.tool_calls:
+            text += f", {self.tool_calls} tool calls {self.tool_seconds:.2f}s"
+        return text
+
+def write_to_terminal(text: str):
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+def tool_parameters(tool) -> dict:
+    """
+    The tool's input schema without injected arguments, so the LLM can pass
+    the rest (e.g. a pagination cursor).
+    """
+    schema = tool.inputSchema or {}
+    properties = {
+        name: prop for name, prop in schema.get("properties", {}).items()
+        if name not in INJECTED_ARGUMENTS
+    }
+    required = [name for name in schema.get("required", []) if name not in INJECTED_ARGUMENTS]
+    return {"type": "object", "properties": properties, "required": required}
+
+def is_offered(tool) -> bool:
+    """
+    Whether the LLM may call `tool`: it must not need server-only arguments.
+    """
+    return not SERVER_ONLY_ARGUMENTS.intersection((tool.inputSchema or {}).get("properties", {}))
+
 class MCPClient:
-    def __init__(self):
+    def __init__(self, llm: Optional[AsyncOpenAI] = None,
+                 credentials: Optional[CredentialManager] = None,
+                 max_steps: int = DEFAULT_MAX_STEPS,
+                 output: Callable[[str], None] = write_to_terminal,
+                 result_token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 digest_path: Optional[str] = None):
         self.session: Optional[ClientSession] = None
         self.exit_stack = AsyncExitStack()
-        self.openAI = OpenAI()
-        self.access_token = get_access_token()
+        self.openAI = llm or AsyncOpenAI()
+        self.credentials = credentials or CredentialManager.from_files()
+        self.max_steps = max_steps
+        # Each tool result is compacted to at most this many tokens for the LLM.
+        self.result_token_budget = result_token_budget
+        # Receives model text as it streams in, and tool call notices.
+        self.output = output
+        self.step_timings: List[StepTiming] = []
+        # Tool schemas in LLM format, until the server says its tools changed.
+        self.tools: Optional[List[dict]] = None
+        # Long threads reach the LLM as cached digests, reused until they change.
+        self.digests = DigestCache(self.summarize_thread, path=digest_path)
     
-    async def connect_to_server(self, server_script_path: str):
+    async def connect_to_server(self, server: str):
+        """
+        Connect to the MCP server: attach to a running server if `server` is
+        an http(s) URL (ending in /sse for the SSE transport), otherwise spawn
+        the server script over stdio.
+        """
+        if server.startswith(("http://", "https://")):
+            await self.attach_to_server(server)
+        else:
+            await self.spawn_server(server)
+        
+        await self.session.initialize()
+        self.credentials.start()
+        
+        tools = await self.list_tools()
+        print("\nConnected to Gmail MCP Server with tools", [tool["name"] for tool in tools])
+        
+    async def spawn_server(self, server_script_path: str):
         """
-        Connect to the MCP server.
+        Start a private server process and talk to it over stdio.
         """
         server_params = StdioServerParameters(
             command="python",
@@ -32,15 +128,29 @@ class MCPClient:
         # Get the file descriptor for the MCP server and make a session.
         stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
         self.stdio, self.write = stdio_transport
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
+        self.session = await self.exit_stack.enter_async_context(
+            ClientSession(self.stdio, self.write, message_handler=self.handle_message)
+        )
         
-        await self.session.initialize()
+    async def attach_to_server(self, url: str):
+        """
+        Open a session on a warm server started with --transport streamable-http or sse.
+        """
+        if url.rstrip("/").endswith("/sse"):
+            self.stdio, self.write = await self.exit_stack.enter_async_context(sse_client(url))
+        else:
+            self.stdio, self.write, _ = await self.exit_stack.enter_async_context(streamablehttp_client(url))
+        self.session = await self.exit_stack.enter_async_context(
+            ClientSession(self.stdio, self.write, message_handler=self.handle_message)
+        )
         
-        # List available tools
-        response = await self.session.list_tools()
-        tools = response.tools
-        print(tools)
-        print("\nConnected to Gmail MCP Server with tools", [tool.name for tool in tools])
+    async def handle_message(self, message):
+        """
+        Drop the cached tool schemas when the server announces a tools change.
+        """
+        if isinstance(message, types.ServerNotification) and \
+                isinstance(message.root, types.ToolListChangedNotification):
+            self.tools = None
         
     async def chat_loop(self):
         """
@@ -51,13 +161,16 @@ class MCPClient:
 
         while True:
             try:
-                query = input("\nQuery: ").strip()
+                # Read in a thread so background work (token refresh) keeps running.
+                query = (await asyncio.to_thread(input, "\nQuery: ")).strip()
 
                 if query.lower() == 'quit':
                     break
 
-                response = await self.process_query(query)
-                print("\n" + response)
+                print()
+                # The answer is streamed to the terminal as it is generated.
+                await self.process_query(query)
+                print("\n\n" + "; ".join(map(str, self.step_timings)))
 
             except Exception as e:
                 print(f"\nError: {str(e)}")
@@ -66,11 +179,96 @@ class MCPClient:
         """
         Clean up resources
         """
+        await self.credentials.aclose()
         await self.exit_stack.aclose()
         
+    async def list_tools(self) -> List[dict]:
+        """
+        The server's tools in the Responses API function-tool format, fetched
+        once and reused until the server reports that its tools changed.
+        """
+        if self.tools is None:
+            response = await self.session.list_tools()
+            self.tools = [{
+                "type": "function",
+                "name": tool.name,
+                "description": tool.description,
+                "parameters": tool_parameters(tool)
+            } for tool in response.tools if is_offered(tool)]
+        return self.tools
+
+    async def create_response(self, messages: list, tools: List[dict]):
+        """
+        Stream one model turn, passing text to `output` as it arrives.
+        Returns the completed response and the time to its first text token.
+        """
+        started = time.perf_counter()
+        first_token = None
+        response = None
+        stream = await self.openAI.responses.create(
+            model=MODEL,
+            input=messages,
+            tools=tools,
+            stream=True
+        )
+        async for event in stream:
+            if event.type == "response.output_text.delta":
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                self.output(event.delta)
+            elif event.type == "response.completed":
+                response = event.response
+            elif event.type == "response.failed":
+                raise RuntimeError(f"Model response failed: {event.response.error}")
+            elif event.type == "response.incomplete":
+                raise RuntimeError(f"Model response incomplete: {event.response.incomplete_details}")
+            elif event.type == "error":
+                raise RuntimeError(f"Model stream error: {event.message}")
+        if response is None:
+            raise RuntimeError("Model stream ended without a completed response")
+        return response, first_token
+
+    async def summarize_thread(self, previous: Optional[str], messages: List[dict]) -> str:
+        """
+        Ask the model for a thread digest, or to extend `previous` with new messages.
+        """
+        lines = [f"Previous summary: {previous}", "New messages:"] if previous else []
+        for message in messages:
+            lines.append(f"From: {message.get('from_')}\nSubject: {message.get('subject')}\n"
+                         f"{truncate(message.get('body') or message.get('snippet'), DIGEST_BODY_CHARS)}")
+        response = await self.openAI.responses.create(
+            model=MODEL,
+            instructions=DIGEST_INSTRUCTIONS,
+            input="\n\n".join(lines)
+        )
+        return response.output_text.strip()
+
+    async def call_tool(self, call) -> dict:
+        """
+        Run one function call from the model and wrap the result as its output item.
+        """
+        try:
+            tool_args = json.loads(call.arguments or "{}")
+            # Inject access_token automatically - LLM never sees this
+            tool_args["access_token"] = await self.credentials.get_token()
+            result = await self.session.call_tool(call.name, tool_args)
+            try:
+                digests = await self.digests.digest_result(result)
+            except Exception:
+                # Digests only shrink the result; without them the threads go in as they are.
+                digests = None
+            output = compact_result(result, self.result_token_budget, digests=digests)
+        except Exception as e:
+            # Let the model see the failure and decide what to do next.
+            output = f"Error: {str(e)}"
+        return {"type": "function_call_output", "call_id": call.call_id, "output": output}
+
     async def process_query(self, query: str) -> str:
         """
-        Process a query using Claude and available tools
+        Answer a query, letting the model call tools until it replies without any.
+
+        All tool calls from one model turn run concurrently on the session.
+        Stops after `max_steps` model turns.
         """
         messages = [
             {
@@ -78,67 +276,34 @@ class MCPClient:
                 "content": query
             }
         ]
+        available_tools = await self.list_tools()
 
-        # List available tools
-        response = await self.session.list_tools()
-        available_tools = [{
-            "type": "function",
-            "name": tool.name,
-            "description": tool.description,
-            "parameters": {
-                "type": "object",
-                "properties": {}
-            }
-        } for tool in response.tools]
-
-        # Initial GPT API call to get the tools needed for the query.
-        response = self.openAI.responses.create(
-            model="gpt-4o-mini",
-            input=messages,
-            tools=available_tools
-        )
-
-        print(response)
-        # Process response and handle tool calls
         final_text = []
+        self.step_timings = []
+        for step in range(1, self.max_steps + 1):
+            started = time.perf_counter()
+            response, first_token = await self.create_response(messages, available_tools)
+            llm_seconds = time.perf_counter() - started
 
-        assistant_message_content = []
-        if response.output_text:
-            final_text.append(response.output_text)
-            assistant_message_content.append(response.output_text)
-        elif response.output:
-            next_step = None
-            
-            for item in response.output:
-                if item.type == 'function_call':
-                    next_step = item
-                
-            if next_step is None:
-                return
-                        
-            tool_name = next_step.name
-            tool_args = json.loads(next_step.arguments)
-            # Inject access_token automatically - LLM never sees this
-            tool_args["access_token"] = self.access_token
-
-            # Execute tool call
-            result = await self.session.call_tool(tool_name, tool_args)
-            final_text.append(f"[Calling tool {tool_name}]")
+            calls = [item for item in response.output if item.type == "function_call"]
+            if response.output_text:
+                final_text.append(response.output_text)
+            if not calls:
+                self.step_timings.append(StepTiming(step, llm_seconds, first_token_seconds=first_token))
+                break
 
-            # Don't include the function call object - just send the tool result as text
-            # The API already knows what tool was called
-            messages.append({
-                "role": "user",
-                "content": f"Tool {tool_name} returned: {str(result)}"
-            })
-
-            # Get next response from OpenAI
-            response = self.openAI.responses.create(
-                model="gpt-4o-mini",
-                input=messages,
-                tools=available_tools
+            # The function calls go back to the model with their outputs.
+            messages.extend(response.output)
+            for call in calls:
+                final_text.append(f"[Calling tool {call.name}]")
+                self.output(f"\n[Calling tool {call.name}]\n")
+            started = time.perf_counter()
+            messages.extend(await asyncio.gather(*(self.call_tool(call) for call in calls)))
+            self.step_timings.append(
+                StepTiming(step, llm_seconds, len(calls), time.perf_counter() - started, first_token)
             )
+        else:
+            final_text.append(f"[Stopped after {self.max_steps} steps]")
+            self.output(f"\n{final_text[-1]}")
 
-            final_text.append(response.output_text)
-
-        return "\n".join(final_text)
\ No newline at end of file
+        return "\n".join(final_text)
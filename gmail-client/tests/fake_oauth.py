@@ -0,0 +1,68 @@
+"""
+A local fake of Google's OAuth token endpoint, served over real HTTP so the
+google-auth refresh path runs unmodified.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from urllib.parse import parse_qs
+
+
+class FakeTokenEndpoint:
+    """
+    Answers refresh_token grants with a new access token each time.
+
+    `faults` holds HTTP statuses to answer the next grants with, and `latency`
+    delays every answer so concurrent refreshes overlap.
+    """
+
+    def __init__(self, expires_in: int = 3600, latency: float = 0.0):
+        self.expires_in = expires_in
+        self.latency = latency
+        self.grants: List[dict] = []
+        self.faults: List[int] = []
+        self._lock = threading.Lock()
+
+    def grant(self, body: bytes):
+        form = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.grants.append(form)
+            if self.faults:
+                return self.faults.pop(0), {"error": "invalid_grant"}
+            count = len(self.grants)
+        if form.get("grant_type") != "refresh_token":
+            return 400, {"error": "unsupported_grant_type"}
+        return 200, {"access_token": f"token-{count}", "expires_in": self.expires_in,
+                     "token_type": "Bearer", "scope": form.get("scope", "")}
+
+
+def serve(fake: FakeTokenEndpoint, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Serve `fake` at /token on a background thread. The caller is responsible
+    for calling `shutdown()` on the returned server.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            status, payload = fake.grant(body) if self.path == "/token" else (404, {})
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+
+    server = Server((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
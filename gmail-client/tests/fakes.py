@@ -0,0 +1,80 @@
+"""
+In-process fakes for client tests: a scripted LLM and an MCP server wired to
+a ClientSession over memory streams.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import AsyncIterator, Dict, List
+
+import anyio
+from mcp import ClientSession
+from mcp.server.fastmcp import FastMCP
+from mcp.shared.memory import create_client_server_memory_streams
+
+
+def function_call(name: str, call_id: str, **arguments) -> SimpleNamespace:
+    return SimpleNamespace(type="function_call", name=name, call_id=call_id,
+                           arguments=json.dumps(arguments))
+
+
+def reply(text: str = "", calls: List[SimpleNamespace] = ()) -> SimpleNamespace:
+    """
+    A Responses API response with optional text and function calls.
+    """
+    output = list(calls)
+    if text:
+        output.append(SimpleNamespace(type="message", content=[SimpleNamespace(text=text)]))
+    return SimpleNamespace(output=output, output_text=text)
+
+
+class FakeLLM:
+    """
+    Streams scripted replies for responses.create, in order, and records each
+    request. Reply text is streamed word by word, `token_delay` seconds apart;
+    a scripted list of events is streamed as given.
+
+    Unstreamed requests are thread digests: each is recorded in `summaries`
+    and answered "digest <n>".
+    """
+
+    def __init__(self, replies: List[SimpleNamespace], token_delay: float = 0.0):
+        self.replies = list(replies)
+        self.token_delay = token_delay
+        self.requests: List[Dict] = []
+        self.summaries: List[Dict] = []
+        self.responses = self
+
+    async def create(self, **request):
+        if not request.get("stream"):
+            self.summaries.append(request)
+            return reply(f"digest {len(self.summaries)}")
+        self.requests.append({**request, "input": list(request["input"])})
+        return self._events(self.replies.pop(0))
+
+    async def _events(self, response: SimpleNamespace):
+        if isinstance(response, list):
+            for event in response:
+                yield event
+            return
+        for word in response.output_text.split(" ") if response.output_text else []:
+            await asyncio.sleep(self.token_delay)
+            yield SimpleNamespace(type="response.output_text.delta", delta=word + " ")
+        yield SimpleNamespace(type="response.completed", response=response)
+
+
+@asynccontextmanager
+async def connect(server: FastMCP, **session_kwargs) -> AsyncIterator[ClientSession]:
+    """
+    An initialized ClientSession talking to `server` over memory streams.
+    """
+    lowlevel = server._mcp_server
+    async with create_client_server_memory_streams() as (client_streams, server_streams):
+        async with anyio.create_task_group() as tasks:
+            tasks.start_soon(lowlevel.run, server_streams[0], server_streams[1],
+                             lowlevel.create_initialization_options())
+            async with ClientSession(*client_streams, **session_kwargs) as session:
+                await session.initialize()
+                yield session
+            tasks.cancel_scope.cancel()
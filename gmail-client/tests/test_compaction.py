@@ -0,0 +1,139 @@
+import json
+
+from mcp.types import CallToolResult, TextContent
+
+import compaction
+from compaction import compact_result, count_tokens
+
+
+def tool_result(payload, is_error: bool = False) -> CallToolResult:
+    text = payload if isinstance(payload, str) else json.dumps(payload, indent=2)
+    return CallToolResult(content=[TextContent(type="text", text=text)], isError=is_error)
+
+
+def listing(threads: int, messages_per_thread: int = 2, snippet: str = "Short note") -> dict:
+    emails = []
+    for t in range(threads):
+        for m in range(messages_per_thread):
+            emails.append({
+                "id": f"thread_{t}_msg_{m}", "thread_id": f"thread_{t}",
+                "snippet": f"{snippet} {t}.{m}",
+                "from_": f"Sender {m} <sender{m}@example.com>",
+                "subject": ("Re: " * m) + f"Subject {t}",
+            })
+    return {"emails": emails, "total": len(emails), "next_cursor": "abc"}
+
+
+def test_listing_is_grouped_by_thread_with_sender_aliases():
+    """
+    Test that threads are grouped, repeated senders aliased and reply prefixes folded.
+    """
+    # Act
+    text = compact_result(tool_result(listing(threads=2)))
+
+    # Assert
+    assert text.splitlines() == [
+        "emails=4 total=4 next_cursor=abc",
+        "senders: s1=Sender 0 <sender0@example.com>; s2=Sender 1 <sender1@example.com>",
+        'thread thread_0: "Subject 0"',
+        "- s1: Short note 0.0",
+        "- s2: Short note 0.1",
+        'thread thread_1: "Subject 1"',
+        "- s1: Short note 1.0",
+        "- s2: Short note 1.1",
+    ]
+
+
+def test_single_senders_stay_inline_and_snippets_are_truncated():
+    """
+    Test that one-off senders are not aliased and long snippets are cut.
+    """
+    # Arrange
+    payload = listing(threads=1, messages_per_thread=1, snippet="word " * 100)
+
+    # Act
+    text = compact_result(tool_result(payload), snippet_chars=30)
+
+    # Assert
+    line = text.splitlines()[-1]
+    assert line.startswith("- Sender 0 <sender0@example.com>: word word")
+    assert line.endswith("…") and len(line) < 80
+    assert "senders:" not in text
+
+
+def test_listing_is_cut_to_the_token_budget():
+    """
+    Test that whole threads are dropped past the budget, with a note saying so.
+    """
+    # Arrange
+    payload = listing(threads=200)
+
+    # Act
+    text = compact_result(tool_result(payload), token_budget=300)
+
+    # Assert
+    assert count_tokens(text) <= 300
+    assert text.splitlines()[0] == "emails=400 total=400 next_cursor=abc"
+    kept = sum(1 for line in text.splitlines() if line.startswith("thread "))
+    assert 0 < kept < 200
+    assert text.endswith(f"[{200 - kept} more threads omitted to fit the token budget; "
+                         "use next_cursor or narrow the request to see them]")
+
+
+def test_compact_form_is_much_smaller_than_the_repr():
+    """
+    Test the saving against the old str(CallToolResult) prompt.
+    """
+    # Arrange
+    result = tool_result(listing(threads=20))
+
+    # Act
+    compact = compact_result(result)
+
+    # Assert
+    assert count_tokens(compact) * 3 < count_tokens(str(result))
+
+
+def test_other_results_are_minified_and_errors_flagged():
+    """
+    Test that non-listing JSON loses its whitespace and tool errors keep their text.
+    """
+    # Act
+    stats = compact_result(tool_result({"response_cache": {"hits": 3, "misses": 1}}))
+    error = compact_result(tool_result("Invalid cursor: 'x'", is_error=True))
+    huge = compact_result(tool_result("x " * 10_000), token_budget=50)
+
+    # Assert
+    assert stats == '{"response_cache":{"hits":3,"misses":1}}'
+    assert error == "Error: Invalid cursor: 'x'"
+    assert count_tokens(huge) <= 55 and huge.endswith("…[truncated]")
+
+
+def test_token_count_falls_back_to_an_estimate(monkeypatch):
+    """
+    Test the character-based estimate used when tiktoken is not installed.
+    """
+    # Arrange
+    monkeypatch.setattr(compaction, "_encoding", False)
+
+    # Act / Assert
+    assert count_tokens("") == 0
+    assert count_tokens("abcdefgh") == 2
+    assert count_tokens("abcdefghi") == 3
+
+
+def test_many_account_listing_keeps_accounts_apart():
+    """
+    Test that the same thread ID in two accounts stays two threads.
+    """
+    # Arrange
+    emails = [{"account": account, "id": "m1", "thread_id": "t1", "snippet": "Hi",
+               "from_": "x@example.com", "subject": "Hello"} for account in ("a@example.com", "b@example.com")]
+
+    # Act
+    text = compact_result(tool_result({"emails": emails, "errors": [{"account": "account[2]", "error": "401"}]}))
+
+    # Assert
+    assert 'thread t1 [a@example.com]: "Hello"' in text
+    assert 'thread t1 [b@example.com]: "Hello"' in text
+    assert "errors: account[2]: 401" in text
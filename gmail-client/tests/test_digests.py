@@ -0,0 +1,211 @@
+import json
+from typing import Dict, List, Optional
+
+from google.oauth2.credentials import Credentials
+from mcp.server.fastmcp import FastMCP
+from mcp.types import CallToolResult, TextContent
+
+from digests import DigestCache
+from gmail_credentials import CredentialManager
+from mcpclient import MCPClient
+from tests.fakes import FakeLLM, connect, function_call, reply
+
+LONG = "Please review the attached contract before Friday. " * 10
+
+
+def message(thread_id: str, index: int, history_id: str) -> Dict:
+    return {"id": f"{thread_id}_msg_{index}", "thread_id": thread_id, "history_id": history_id,
+            "from_": f"Sender {index} <sender{index}@example.com>", "subject": "Contract",
+            "snippet": LONG}
+
+
+def listing(threads: Dict[str, List[Dict]]) -> CallToolResult:
+    emails = [email for messages in threads.values() for email in messages]
+    return CallToolResult(content=[TextContent(type="text", text=json.dumps({"emails": emails}))])
+
+
+class CountingSummarizer:
+    """
+    Records what each call was asked to summarize.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, previous: Optional[str], messages: List[Dict]) -> str:
+        self.calls.append((previous, [m["id"] for m in messages]))
+        return f"digest {len(self.calls)}"
+
+
+def mailbox(history_id: str = "100", messages_per_thread: int = 2) -> Dict[str, List[Dict]]:
+    return {thread_id: [message(thread_id, i, history_id) for i in range(messages_per_thread)]
+            for thread_id in ("t1", "t2")}
+
+
+async def test_unchanged_threads_are_summarized_once():
+    """
+    Test that a repeat listing with the same historyIds makes no LLM calls.
+    """
+    # Arrange
+    summarize = CountingSummarizer()
+    cache = DigestCache(summarize)
+    await cache.digest_result(listing(mailbox()))
+
+    # Act
+    digests = await cache.digest_result(listing(mailbox()))
+
+    # Assert
+    assert len(summarize.calls) == 2
+    assert digests == {(None, "t1"): "digest 1", (None, "t2"): "digest 2"}
+    assert cache.stats() == {"threads": 2, "hits": 2, "extended": 0, "summarized": 2}
+
+
+async def test_new_messages_extend_the_previous_digest():
+    """
+    Test that only the new message of a changed thread is sent, with the old digest.
+    """
+    # Arrange
+    summarize = CountingSummarizer()
+    cache = DigestCache(summarize)
+    threads = mailbox()
+    await cache.digest_result(listing(threads))
+    threads["t1"] = [dict(m, history_id="105") for m in threads["t1"]] + [message("t1", 2, "105")]
+
+    # Act
+    digests = await cache.digest_result(listing(threads))
+
+    # Assert
+    assert summarize.calls[2] == ("digest 1", ["t1_msg_2"])
+    assert digests[None, "t1"] == "digest 3"
+    assert digests[None, "t2"] == "digest 2"
+    assert cache.digests[None, "t1"].history_id == "105"
+
+
+async def test_removed_message_resummarizes_the_thread():
+    """
+    Test that a thread that lost a message is summarized again from scratch.
+    """
+    # Arrange
+    summarize = CountingSummarizer()
+    cache = DigestCache(summarize)
+    threads = mailbox(messages_per_thread=3)
+    await cache.digest_result(listing(threads))
+    threads["t1"] = [dict(m, history_id="105") for m in threads["t1"][1:]]
+
+    # Act
+    await cache.digest_result(listing(threads))
+
+    # Assert
+    assert summarize.calls[2] == (None, ["t1_msg_1", "t1_msg_2"])
+
+
+async def test_short_threads_and_old_servers_are_not_summarized():
+    """
+    Test that threads below min_tokens or without a history_id are left alone.
+    """
+    # Arrange
+    summarize = CountingSummarizer()
+    cache = DigestCache(summarize, min_tokens=10_000)
+    no_history = [{k: v for k, v in m.items() if k != "history_id"} for m in mailbox()["t1"]]
+
+    # Act
+    short = await cache.digest_result(listing(mailbox()))
+    old = await DigestCache(summarize).digest_result(listing({"t1": no_history}))
+
+    # Assert
+    assert short == {} and old == {}
+    assert summarize.calls == []
+
+
+async def test_digests_persist_across_runs(tmp_path):
+    """
+    Test that a new cache on the same path reuses the saved digests.
+    """
+    # Arrange
+    path = str(tmp_path / "digests.json")
+    await DigestCache(CountingSummarizer(), path=path).digest_result(listing(mailbox()))
+    summarize = CountingSummarizer()
+
+    # Act
+    digests = await DigestCache(summarize, path=path).digest_result(listing(mailbox()))
+
+    # Assert
+    assert summarize.calls == []
+    assert digests[None, "t2"] == "digest 2"
+
+
+def test_unreadable_digest_file_starts_an_empty_cache(tmp_path):
+    # Arrange
+    path = tmp_path / "digests.json"
+    path.write_text('[{"account": null, "thread_id": "t1", "hist')
+
+    # Act
+    cache = DigestCache(CountingSummarizer(), path=str(path))
+
+    # Assert
+    assert cache.digests == {}
+
+
+async def test_repeated_query_reuses_digests_in_the_prompt():
+    """
+    Test that asking twice costs no digest calls the second time and the
+    model sees the digests instead of the messages.
+    """
+    # Arrange
+    server = FastMCP("gmail")
+
+    @server.tool()
+    async def fetch_recent_emails(access_token: str):
+        return {"emails": [m for messages in mailbox().values() for m in messages]}
+
+    llm = FakeLLM([
+        reply(calls=[function_call("fetch_recent_emails", "c1")]), reply("Two contracts."),
+        reply(calls=[function_call("fetch_recent_emails", "c2")]), reply("Still two."),
+    ])
+    client = MCPClient(llm=llm, credentials=CredentialManager(Credentials(token="token"), token_path=None),
+                       output=lambda text: None)
+
+    # Act
+    async with connect(server) as session:
+        client.session = session
+        await client.process_query("What happened today?")
+        first = len(llm.summaries)
+        await client.process_query("What happened today?")
+
+    # Assert
+    assert first == 2 and len(llm.summaries) == 2
+    assert "Sender 0" in llm.summaries[0]["input"]
+    output = llm.requests[3]["input"][-1]["output"]
+    assert "- summary of 2 messages: digest" in output
+    assert LONG.strip() not in output
+
+
+async def test_failing_summarizer_still_returns_the_tool_result():
+    """
+    Test that a digest error falls back to the undigested result instead of
+    replacing it with the error.
+    """
+    # Arrange
+    server = FastMCP("gmail")
+
+    @server.tool()
+    async def fetch_recent_emails(access_token: str):
+        return {"emails": [m for messages in mailbox().values() for m in messages]}
+
+    async def failing_summarize(previous, messages):
+        raise RuntimeError("rate limited")
+
+    llm = FakeLLM([reply(calls=[function_call("fetch_recent_emails", "c1")]), reply("Two contracts.")])
+    client = MCPClient(llm=llm, credentials=CredentialManager(Credentials(token="token"), token_path=None),
+                       output=lambda text: None)
+    client.digests.summarize = failing_summarize
+
+    # Act
+    async with connect(server) as session:
+        client.session = session
+        await client.process_query("What happened today?")
+
+    # Assert
+    output = llm.requests[1]["input"][-1]["output"]
+    assert not output.startswith("Error")
+    assert 'thread t1: "Contract"' in output and "summary of" not in output
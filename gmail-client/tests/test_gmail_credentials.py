@@ -0,0 +1,124 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
+
+from gmail_credentials import SCOPES, CredentialManager
+from tests.fake_oauth import FakeTokenEndpoint, serve
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@pytest.fixture
+def token_endpoint():
+    """
+    A fake token endpoint on a local port; yields the fake and its token URI.
+    """
+    fake = FakeTokenEndpoint()
+    server = serve(fake)
+    yield fake, f"http://127.0.0.1:{server.server_address[1]}/token"
+    server.shutdown()
+
+
+def make_manager(token_uri: str, tmp_path, expires_in: float, **kwargs) -> CredentialManager:
+    creds = Credentials(
+        token="initial", refresh_token="refresh", token_uri=token_uri,
+        client_id="client", client_secret="secret", scopes=SCOPES,
+        expiry=utcnow() + timedelta(seconds=expires_in),
+    )
+    return CredentialManager(creds, token_path=str(tmp_path / "token.json"), **kwargs)
+
+
+async def test_fresh_token_is_served_from_memory(token_endpoint, tmp_path):
+    """
+    Test that a token far from expiry is returned without contacting the endpoint.
+    """
+    # Arrange
+    fake, token_uri = token_endpoint
+    manager = make_manager(token_uri, tmp_path, expires_in=3600)
+
+    # Act
+    tokens = [await manager.get_token() for _ in range(5)]
+
+    # Assert
+    assert tokens == ["initial"] * 5
+    assert fake.grants == []
+
+
+async def test_expiring_token_is_refreshed_and_saved(token_endpoint, tmp_path):
+    """
+    Test that a token inside the refresh margin is refreshed and written to disk.
+    """
+    # Arrange
+    fake, token_uri = token_endpoint
+    manager = make_manager(token_uri, tmp_path, expires_in=60, refresh_margin=300)
+
+    # Act
+    token = await manager.get_token()
+
+    # Assert
+    assert token == "token-1"
+    assert fake.grants[0]["refresh_token"] == "refresh"
+    assert manager.seconds_left() > 3000
+    assert json.loads((tmp_path / "token.json").read_text())["token"] == "token-1"
+
+
+async def test_concurrent_callers_share_one_refresh(token_endpoint, tmp_path):
+    """
+    Test that simultaneous get_token calls on an expired token refresh only once.
+    """
+    # Arrange
+    fake, token_uri = token_endpoint
+    fake.latency = 0.1
+    manager = make_manager(token_uri, tmp_path, expires_in=-10)
+
+    # Act
+    tokens = await asyncio.gather(*[manager.get_token() for _ in range(10)])
+
+    # Assert
+    assert set(tokens) == {"token-1"}
+    assert len(fake.grants) == 1
+    assert manager.refreshes == 1
+
+
+async def test_background_refresh_runs_before_expiry(token_endpoint, tmp_path):
+    """
+    Test that start() refreshes ahead of expiry without any caller waiting on it.
+    """
+    # Arrange
+    fake, token_uri = token_endpoint
+    manager = make_manager(token_uri, tmp_path, expires_in=300.2, refresh_margin=300)
+
+    # Act
+    manager.start()
+    for _ in range(100):
+        if manager.refreshes:
+            break
+        await asyncio.sleep(0.05)
+    await manager.aclose()
+
+    # Assert
+    assert manager.refreshes == 1
+    assert manager.creds.token == "token-1"
+    assert await manager.get_token() == "token-1"
+    assert len(fake.grants) == 1
+
+
+async def test_failed_refresh_raises_and_is_retried(token_endpoint, tmp_path):
+    """
+    Test that a rejected refresh surfaces to the caller and the next call retries.
+    """
+    # Arrange
+    fake, token_uri = token_endpoint
+    fake.faults.append(400)
+    manager = make_manager(token_uri, tmp_path, expires_in=-10)
+
+    # Act / Assert
+    with pytest.raises(RefreshError):
+        await manager.get_token()
+    assert await manager.get_token() == "token-2"
@@ -0,0 +1,213 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from google.oauth2.credentials import Credentials
+from mcp.server.fastmcp import Context, FastMCP
+
+from gmail_credentials import CredentialManager
+from mcpclient import MCPClient
+from tests.fakes import FakeLLM, connect, function_call, reply
+
+TOOL_DELAY = 0.2
+
+
+@pytest.fixture
+def server():
+    """
+    A fake Gmail MCP server whose tools take TOOL_DELAY seconds each.
+    """
+    server = FastMCP("gmail")
+    server.calls = []
+
+    @server.tool()
+    async def fetch_recent_emails(access_token: str, max_threads: int = 20):
+        server.calls.append(("fetch_recent_emails", access_token, max_threads))
+        await asyncio.sleep(TOOL_DELAY)
+        return {"emails": [{"id": "m1", "subject": "Hello"}]}
+
+    @server.tool()
+    async def enable_stats(access_token: str, ctx: Context):
+        # Registers another tool and tells connected clients, as a plugin reload would.
+        server.add_tool(lambda: {"cache_hits": 1}, name="server_stats")
+        await ctx.session.send_tool_list_changed()
+        return "ok"
+
+    @server.tool()
+    async def fetch_recent_emails_many(access_tokens: list[str]):
+        return {"emails": []}
+
+    @server.tool()
+    async def search_emails(access_token: str, sender: str):
+        server.calls.append(("search_emails", access_token, sender))
+        await asyncio.sleep(TOOL_DELAY)
+        if sender == "nobody":
+            raise ValueError("no such sender")
+        return {"emails": [{"id": "m2", "from_": sender}]}
+
+    return server
+
+
+def make_client(llm: FakeLLM, **kwargs) -> MCPClient:
+    client = MCPClient(llm=llm, credentials=CredentialManager(Credentials(token="token"), token_path=None),
+                       output=lambda text: client.printed.append(text), **kwargs)
+    client.printed = []
+    return client
+
+
+async def test_tool_calls_in_one_turn_run_concurrently(server):
+    """
+    Test that every function call of a turn runs, at the same time, and all outputs go back.
+    """
+    # Arrange
+    llm = FakeLLM([
+        reply(calls=[function_call("fetch_recent_emails", "c1", max_threads=5),
+                     function_call("search_emails", "c2", sender="bob"),
+                     function_call("search_emails", "c3", sender="alice")]),
+        reply("Three results."),
+    ])
+    client = make_client(llm)
+
+    # Act
+    async with connect(server) as client.session:
+        started = time.perf_counter()
+        answer = await client.process_query("What's new?")
+        elapsed = time.perf_counter() - started
+
+    # Assert
+    assert answer.endswith("Three results.")
+    assert len(server.calls) == 3
+    assert all(token == "token" for _, token, _ in server.calls)
+    assert elapsed < 2 * TOOL_DELAY
+    second_input = llm.requests[1]["input"]
+    outputs = [item for item in second_input if isinstance(item, dict)
+               and item.get("type") == "function_call_output"]
+    assert [item["call_id"] for item in outputs] == ["c1", "c2", "c3"]
+    assert "m2" in outputs[1]["output"] and "alice" in outputs[2]["output"]
+    assert "access_token" not in str(llm.requests[0]["tools"])
+
+
+async def test_agent_loop_runs_until_model_answers(server):
+    """
+    Test that the loop feeds results back for several rounds and times each step.
+    """
+    # Arrange
+    llm = FakeLLM([
+        reply(calls=[function_call("fetch_recent_emails", "c1")]),
+        reply(calls=[function_call("search_emails", "c2", sender="nobody")]),
+        reply("Nothing from that sender."),
+    ])
+    client = make_client(llm)
+
+    # Act
+    async with connect(server) as client.session:
+        answer = await client.process_query("Any mail from nobody?")
+
+    # Assert
+    assert answer.splitlines() == ["[Calling tool fetch_recent_emails]",
+                                   "[Calling tool search_emails]",
+                                   "Nothing from that sender."]
+    assert len(llm.requests) == 3
+    error_output = llm.requests[2]["input"][-1]
+    assert error_output["call_id"] == "c2" and "no such sender" in error_output["output"]
+    assert [(t.step, t.tool_calls) for t in client.step_timings] == [(1, 1), (2, 1), (3, 0)]
+    assert client.step_timings[0].tool_seconds >= TOOL_DELAY
+
+
+async def test_agent_loop_stops_at_max_steps(server):
+    """
+    Test that a model that keeps calling tools is cut off after max_steps turns.
+    """
+    # Arrange
+    llm = FakeLLM([reply(calls=[function_call("fetch_recent_emails", f"c{i}")]) for i in range(5)])
+    client = make_client(llm, max_steps=2)
+
+    # Act
+    async with connect(server) as client.session:
+        answer = await client.process_query("Loop forever")
+
+    # Assert
+    assert len(llm.requests) == 2
+    assert answer.endswith("[Stopped after 2 steps]")
+
+
+async def test_answer_is_streamed_as_it_arrives(server):
+    """
+    Test that text reaches the output token by token, with time to first token recorded.
+    """
+    # Arrange
+    llm = FakeLLM([reply("You have one new email from Bob.")], token_delay=0.02)
+    client = make_client(llm)
+
+    # Act
+    async with connect(server) as client.session:
+        answer = await client.process_query("What's new?")
+
+    # Assert
+    assert answer == "You have one new email from Bob."
+    assert len(client.printed) == 7
+    assert "".join(client.printed).strip() == answer
+    timing = client.step_timings[0]
+    assert timing.first_token_seconds < timing.llm_seconds / 3
+
+
+async def test_tool_schemas_are_cached_until_the_server_changes_them(server, mocker):
+    """
+    Test that tools are listed once per session and again after a tools/list_changed notification.
+    """
+    # Arrange
+    llm = FakeLLM([reply("Hi."), reply(calls=[function_call("enable_stats", "c1")]), reply("Done."),
+                   reply("Hi again.")])
+    client = make_client(llm)
+
+    # Act
+    async with connect(server, message_handler=client.handle_message) as client.session:
+        list_tools = mocker.spy(client.session, "list_tools")
+        for query in ("Hello", "Enable stats", "Hello"):
+            await client.process_query(query)
+
+    # Assert
+    assert list_tools.call_count == 2
+    names = [[tool["name"] for tool in request["tools"]] for request in llm.requests]
+    assert "server_stats" not in names[0] and names[0] == names[1] == names[2]
+    assert "server_stats" in names[3]
+
+
+async def test_tools_needing_several_tokens_are_not_offered(server):
+    """
+    Test that the multi-account tool is hidden: the LLM has no tokens to pass it.
+    """
+    # Arrange
+    client = make_client(FakeLLM([]))
+
+    # Act
+    async with connect(server) as client.session:
+        tools = await client.list_tools()
+
+    # Assert
+    names = {tool["name"] for tool in tools}
+    assert "fetch_recent_emails_many" not in names
+    assert {"fetch_recent_emails", "search_emails"} <= names
+    assert all("access_token" not in tool["parameters"]["properties"] for tool in tools)
+
+
+@pytest.mark.parametrize("events, message", [
+    ([SimpleNamespace(type="error", message="overloaded")], "Model stream error: overloaded"),
+    ([SimpleNamespace(type="response.incomplete",
+                      response=SimpleNamespace(error=None, incomplete_details="reason='max_output_tokens'"))],
+     "Model response incomplete: reason='max_output_tokens'"),
+    ([SimpleNamespace(type="response.output_text.delta", delta="Hel")],
+     "Model stream ended without a completed response"),
+])
+async def test_failed_model_streams_raise_clear_errors(server, events, message):
+    """
+    Test that a stream ending in an error, or without a completed response, is reported.
+    """
+    # Arrange
+    client = make_client(FakeLLM([events]))
+
+    # Act & Assert
+    async with connect(server) as client.session:
+        with pytest.raises(RuntimeError, match=message):
+            await client.process_query("What's new?")
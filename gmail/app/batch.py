@@ -0,0 +1,271 @@
+import json
+import uuid
+from dataclasses import dataclass, field
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+
+def _breaks_line(text: str) -> bool:
+    """
+    Whether `text` would end a header line early, letting a sub-request inject headers.
+    """
+    return "\n" in text or "\r" in text
+
+
+def new_boundary() -> str:
+    """
+    A random multipart boundary, so concurrent batches never share one.
+    """
+    return f"batch_{uuid.uuid4().hex}"
+
+
+class BatchRequest:
+    """
+    Builder for a multipart/mixed batch request.
+
+    Each sub-request is encoded once, when it is added; the body is produced by
+    joining the encoded parts. The Content-ID given to each sub-request comes
+    back as BatchPart.request_id on its response.
+    """
+
+    def __init__(self, boundary: Optional[str] = None):
+        self.boundary = boundary or new_boundary()
+        self.content_ids: List[str] = []
+        self._parts: List[bytes] = []
+
+    def __len__(self) -> int:
+        return len(self._parts)
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/mixed; boundary={self.boundary}"
+
+    def add(self, method: str, path: str, content_id: Optional[str] = None,
+            body: Union[bytes, str, Dict, None] = None,
+            headers: Optional[Dict[str, str]] = None) -> str:
+        """
+        Add a sub-request and return its Content-ID (`item-<n>` by default).
+        `path` is relative to the API host, query string included. Dict bodies
+        are sent as JSON.
+        """
+        content_id = content_id or f"item-{len(self._parts) + 1}"
+        if _breaks_line(f"{method}{path}{content_id}") or " " in path or ">" in content_id:
+            raise ValueError(f"Invalid batch sub-request: {method} {path!r}")
+        if path[:1] != "/":
+            raise ValueError(f"Batch sub-request paths must start with '/': {path!r}")
+
+        extra = ""
+        if headers or body is not None:
+            headers = dict(headers or {})
+            if isinstance(body, dict):
+                body = json.dumps(body, separators=(",", ":"))
+                headers.setdefault("Content-Type", "application/json")
+            if isinstance(body, str):
+                body = body.encode()
+            if body is not None:
+                headers["Content-Length"] = str(len(body))
+            extra = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+            if any(_breaks_line(f"{name}{value}") for name, value in headers.items()):
+                raise ValueError(f"Invalid batch sub-request headers: {headers!r}")
+
+        self._parts.append(
+            f"--{self.boundary}\r\n"
+            "Content-Type: application/http\r\n"
+            f"Content-ID: <{content_id}>\r\n\r\n"
+            f"{method.upper()} {path} HTTP/1.1\r\n{extra}\r\n".encode() + (body or b"")
+        )
+        self.content_ids.append(content_id)
+        return content_id
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        """
+        Yield the body one part at a time, e.g. for a chunked upload.
+        """
+        for index, part in enumerate(self._parts):
+            yield part if index == 0 else b"\r\n" + part
+        yield f"\r\n--{self.boundary}--\r\n".encode()
+
+    def to_bytes(self) -> bytes:
+        return b"".join(self.iter_bytes())
+
+
+@dataclass
+class BatchPart:
+    """
+    One sub-response of a multipart/mixed batch response.
+    """
+    content_id: Optional[str]
+    status: int
+    headers: Dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+
+    @property
+    def request_id(self) -> Optional[str]:
+        """
+        The Content-ID of the sub-request this part answers. Gmail echoes
+        `<foo>` back as `<response-foo>`.
+        """
+        if self.content_id is None:
+            return None
+        return self.content_id.removeprefix("response-")
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+    def json(self):
+        return json.loads(self.body)
+
+
+def _read_headers(data: bytes, pos: int) -> Tuple[Dict[str, str], int]:
+    """
+    Read `Name: value` lines starting at `pos` up to the next blank line.
+    Returns lower-cased header names and the offset just past the blank line.
+    """
+    headers = {}
+    while pos < len(data):
+        eol = data.find(b"\n", pos)
+        end = len(data) if eol < 0 else eol
+        line = data[pos:end].rstrip(b"\r")
+        pos = end + 1
+        if not line:
+            break
+        name, _, value = line.partition(b":")
+        headers[name.strip().lower().decode("latin-1")] = value.strip().decode("latin-1")
+    return headers, pos
+
+
+def parse_part(data: bytes) -> BatchPart:
+    """
+    Parse one batch part: MIME headers, then an embedded HTTP response
+    (status line, headers, body).
+    """
+    part_headers, pos = _read_headers(data, 0)
+
+    content_id = part_headers.get("content-id")
+    if content_id is not None:
+        content_id = content_id.strip("<>")
+
+    # Skip any blank lines before the status line.
+    while data.startswith(b"\n", pos) or data.startswith(b"\r\n", pos):
+        pos = data.find(b"\n", pos) + 1
+
+    eol = data.find(b"\n", pos)
+    status_line = data[pos:len(data) if eol < 0 else eol].strip()
+    try:
+        status = int(status_line.split()[1])
+    except (IndexError, ValueError):
+        status = 0
+    if eol < 0:
+        return BatchPart(content_id, status)
+
+    headers, pos = _read_headers(data, eol + 1)
+    end = len(data)
+    while end > pos and data[end - 1] in b" \t\r\n":
+        end -= 1
+    return BatchPart(content_id, status, headers, data[pos:end])
+
+
+class BatchResponseParser:
+    """
+    Incremental multipart/mixed parser.
+
+    Feed it response bytes as they arrive; each call returns the parts completed
+    so far. Only the part currently being received is buffered, so peak memory is
+    bounded by the largest single part rather than the whole response.
+    """
+
+    def __init__(self, boundary: str):
+        self._delimiter = b"--" + boundary.encode("latin-1")
+        self._buffer = bytearray()
+        self._scan_from = 0
+        self._in_part = False
+        self.done = False
+
+    def _find_delimiter(self) -> int:
+        buffer = self._buffer
+        pos = self._scan_from
+        while True:
+            index = buffer.find(self._delimiter, pos)
+            if index < 0:
+                # Re-scan the tail next time in case a delimiter straddles chunks.
+                self._scan_from = max(0, len(buffer) - len(self._delimiter))
+                return -1
+            if index == 0 or buffer[index - 1] == 0x0A:
+                return index
+            pos = index + 1
+
+    def _take_part(self, end: int) -> BatchPart:
+        # The line break before a delimiter belongs to the delimiter.
+        if self._buffer[max(0, end - 2):end] == b"\r\n":
+            end -= 2
+        elif self._buffer[max(0, end - 1):end] == b"\n":
+            end -= 1
+        with memoryview(self._buffer) as view:
+            data = bytes(view[:end])
+        return parse_part(data)
+
+    def feed(self, data: bytes) -> List[BatchPart]:
+        if self.done:
+            return []
+        self._buffer += data
+
+        parts = []
+        while True:
+            index = self._find_delimiter()
+            if index < 0:
+                break
+            after = index + len(self._delimiter)
+            closing = self._buffer[after:after + 2] == b"--"
+            eol = self._buffer.find(b"\n", after)
+            if eol < 0 and not closing:
+                # Wait for the rest of the delimiter line.
+                break
+
+            if self._in_part:
+                parts.append(self._take_part(index))
+            if closing:
+                self.done = True
+                self._buffer.clear()
+                break
+
+            del self._buffer[:eol + 1]
+            self._scan_from = 0
+            self._in_part = True
+        return parts
+
+    def close(self) -> List[BatchPart]:
+        """
+        Flush a final part if the stream ended without a closing delimiter.
+        """
+        parts = []
+        if not self.done and self._in_part:
+            # A delimiter cut off at end of stream still terminates the part.
+            index = self._find_delimiter()
+            end = len(self._buffer) if index < 0 else index
+            if self._buffer[:end].strip():
+                parts.append(self._take_part(end))
+        self.done = True
+        self._buffer.clear()
+        return parts
+
+
+def iter_batch_parts(chunks: Iterable[bytes], boundary: str) -> Iterator[BatchPart]:
+    """
+    Yield batch parts from an iterable of byte chunks.
+    """
+    parser = BatchResponseParser(boundary)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+async def aiter_batch_parts(chunks: AsyncIterable[bytes], boundary: str) -> AsyncIterator[BatchPart]:
+    """
+    Yield batch parts from an async iterable of byte chunks, as each part completes.
+    """
+    parser = BatchResponseParser(boundary)
+    async for chunk in chunks:
+        for part in parser.feed(chunk):
+            yield part
+    for part in parser.close():
+        yield part
@@ -1,28 +1,154 @@
-import requests, time, json, re
-from typing import List, Dict
-from .model import EmailPreview
+import asyncio, re, os, time
+from urllib.parse import urlencode
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Dict, Optional, Tuple
+from .batch import BatchPart, BatchRequest, aiter_batch_parts, iter_batch_parts
+from .headers import decode_words, message_headers
+from .metrics import metrics
+from .mime import lazy_body
+from .model import EmailRecord
+from .ratelimit import DEFAULT_REQUESTS_PER_SECOND, current_limiter, get_limiter
+from .scheduler import QUOTA_UNITS, get_scheduler, is_retryable, parse_retry_after
 
-BASE_URL = "https://gmail.googleapis.com/gmail/v1"
-BATCH_BASE_URL = "https://gmail.googleapis.com/batch/gmail/v1"
+# GMAIL_API_ROOT lets tests and benchmarks point the client at a local stub server.
+API_ROOT = os.environ.get("GMAIL_API_ROOT", "https://gmail.googleapis.com")
+BASE_URL = f"{API_ROOT}/gmail/v1"
+BATCH_BASE_URL = f"{API_ROOT}/batch/gmail/v1"
 
-def get_recent_thread_ids(access_token: str, max_results: int = 30) -> Dict:
+RECENT_QUERY = "newer_than:1d"
+# threads.list returns at most 500 results per page.
+MAX_PAGE_SIZE = 500
+# Gmail rejects batch requests with more than 100 sub-requests.
+MAX_BATCH_SIZE = 100
+# How many batch requests a single fetch may have in flight at once.
+MAX_CONCURRENT_BATCHES = 4
+# How many accounts a multi-account fetch works on at once.
+MAX_CONCURRENT_ACCOUNTS = 8
+
+class IncompleteFetch(Exception):
+    """
+    Some threads could not be fetched, even after retrying.
+    """
+
+    def __init__(self, thread_ids: List[str]):
+        super().__init__(f"{len(thread_ids)} threads could not be fetched: {', '.join(thread_ids)}")
+        self.thread_ids = thread_ids
+
+# access token -> account email, so the profile is looked up once per token.
+_accounts: Dict[str, str] = {}
+MAX_CACHED_ACCOUNTS = 1024
+
+# "metadata" fetches only what EmailPreview needs; "headers" keeps every header
+# (for the archive); "full" also returns MIME bodies.
+FETCH_MODES = ("metadata", "headers", "full")
+METADATA_HEADERS = ("From", "Subject")
+METADATA_FIELDS = "id,historyId,messages(id,threadId,labelIds,snippet,internalDate,payload/headers)"
+
+def thread_query(fetch_mode: str = "metadata") -> str:
+    """
+    Query string for a threads.get call in the given fetch mode.
+    """
+    if fetch_mode not in FETCH_MODES:
+        raise ValueError(f"Unknown fetch mode {fetch_mode!r}, expected one of {FETCH_MODES}")
+    if fetch_mode == "full":
+        return "format=full"
+    params = [("format", "metadata")]
+    if fetch_mode == "metadata":
+        params += [("metadataHeaders", name) for name in METADATA_HEADERS]
+    params.append(("fields", METADATA_FIELDS))
+    return urlencode(params, safe=",()/")
+
+def _requests():
+    """
+    The `requests` module, imported on first use: only the blocking helpers
+    need it, and it is the heaviest import the server would otherwise pay at startup.
+    """
+    import requests
+    return requests
+
+def __getattr__(name: str):
+    # Keep `gmail_api.requests` resolvable (e.g. as a mock.patch target).
+    if name == "requests":
+        return _requests()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _next_page_size(max_results: Optional[int], collected: int) -> int:
+    if max_results is None:
+        return MAX_PAGE_SIZE
+    return min(max_results - collected, MAX_PAGE_SIZE)
+
+def chunked(items: List, size: int) -> Iterator[List]:
+    """
+    Split `items` into consecutive lists of at most `size` elements.
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+async def get_profile_async(access_token: str) -> Dict:
+    """
+    users.getProfile: the account's email address and current historyId.
+    """
+    response = await get_scheduler().request(
+        access_token, "GET", f"{BASE_URL}/users/me/profile", QUOTA_UNITS["getProfile"],
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    response.raise_for_status()
+    return response.json()
+
+async def get_account_async(access_token: str) -> str:
+    """
+    The email address of the account `access_token` belongs to.
+    """
+    if access_token not in _accounts:
+        if len(_accounts) >= MAX_CACHED_ACCOUNTS:
+            _accounts.clear()
+        _accounts[access_token] = (await get_profile_async(access_token))["emailAddress"]
+    return _accounts[access_token]
+
+async def watch_async(access_token: str, topic_name: str,
+                      label_ids: Tuple[str, ...] = ("INBOX",)) -> Dict:
+    """
+    users.watch: publish changes to these labels to the Pub/Sub topic
+    `topic_name`. Returns the current historyId and the expiration (ms since
+    the epoch) after which the watch must be renewed.
+    """
+    response = await get_scheduler().request(
+        access_token, "POST", f"{BASE_URL}/users/me/watch", QUOTA_UNITS["watch"],
+        headers={"Authorization": f"Bearer {access_token}"},
+        json={"topicName": topic_name, "labelIds": list(label_ids)},
+    )
+    response.raise_for_status()
+    return response.json()
+
+def get_recent_thread_ids(access_token: str, max_results: Optional[int] = 30) -> Dict:
     """
     List thread IDs for threads with messages in the last 24 hours.
+    Follows nextPageToken until `max_results` threads are collected
+    (or every page has been read when `max_results` is None).
     """
     url = f"{BASE_URL}/users/me/threads"
     headers = {"Authorization": f"Bearer {access_token}"}
-    params = {
-        "q": "newer_than:1d",
-        "maxResults": max_results
-    }
 
-    response = requests.get(url, headers=headers, params=params)
-    response.raise_for_status()
-    
-    data = response.json()
-    return data['threads']
+    threads = []
+    page_token = None
+    while max_results is None or len(threads) < max_results:
+        params = {
+            "q": RECENT_QUERY,
+            "maxResults": _next_page_size(max_results, len(threads))
+        }
+        if page_token:
+            params["pageToken"] = page_token
 
-def batch_get_threads(access_token: str, headers: Dict, batch_body: str) -> Dict:
+        response = _requests().get(url, headers=headers, params=params)
+        response.raise_for_status()
+        
+        data = response.json()
+        threads.extend(data.get('threads', []))
+        page_token = data.get('nextPageToken')
+        if not page_token:
+            break
+    return threads
+
+def batch_get_threads(access_token: str, headers: Dict, batch_body: bytes) -> Dict:
     """
     Get detailed info for a specific thread (all messages).
     """
@@ -30,41 +156,286 @@ def batch_get_threads(access_token: str, headers: Dict, batch_body: str) -> Dict
 
     # You can choose "format" like "full" or "metadata"; default returns full payload.
 
-    response = requests.post(url, headers=headers, data=batch_body)
+    response = _requests().post(url, headers=headers, data=batch_body)
     response.raise_for_status()
     return response
 
-def get_all_threads(access_token: str, max_threads: int = 30) -> Dict:
+def get_all_threads(access_token: str, max_threads: Optional[int] = 30,
+                    fetch_mode: str = "metadata") -> Dict:
     """
     Fetch recent threads (last 24h) including all messages per thread.
+    Threads are requested in batches of at most MAX_BATCH_SIZE.
     """
     threads = get_recent_thread_ids(access_token, max_threads)
-    
-    boundary = f"batch_{int(time.time() * 1000)}"
-    
-    batch_body = ""
-    for index, thread in enumerate(threads, start=1):
-        batch_body += f"--{boundary}\n"
-        batch_body += f"Content-Type: application/http\n"
-        batch_body += f"Content-ID: <request-{index}>\n\n"
-        batch_body += (
-            f"GET /gmail/v1/users/me/threads/{thread.get('id')}"
-            f"?format=full HTTP/1.1\n\n"
-        )
-    
-    batch_body += f"--{boundary}--\n"
-    
+
+    emails = []
+    for chunk in chunked(threads, MAX_BATCH_SIZE):
+        headers, batch_body = build_threads_batch(access_token, chunk, fetch_mode)
+        
+        data = batch_get_threads(access_token, headers, batch_body)   
+        
+        emails.extend(extract_email_content(parse_gmail_batch_response(data)))
+
+    return emails
+
+def build_threads_batch(access_token: str, threads: List[Dict],
+                        fetch_mode: str = "metadata") -> Tuple[Dict, bytes]:
+    """
+    Build the request headers and multipart body for a batch of threads.get calls.
+    Each sub-request's Content-ID is its thread ID.
+    """
+    query = thread_query(fetch_mode)
+    batch = BatchRequest()
+    for thread in threads:
+        batch.add("GET", f"/gmail/v1/users/me/threads/{thread['id']}?{query}",
+                  content_id=thread["id"])
+
     headers = {
         "Authorization": f"Bearer {access_token}",
-        "Content-Type": f"multipart/mixed; boundary={boundary}",
+        "Content-Type": batch.content_type,
     }
-    
-    data = batch_get_threads(access_token, headers, batch_body)   
-    
-    threads = parse_gmail_batch_response(data)
-    emails = extract_email_content(threads)
+    return headers, batch.to_bytes()
 
-    return emails
+async def iter_recent_thread_pages_async(access_token: str, max_results: Optional[int] = 30,
+                                         query: str = RECENT_QUERY) -> AsyncIterator[List[Dict]]:
+    """
+    Yield pages of thread IDs matching the Gmail search `query` (recent
+    threads by default) as they arrive, following nextPageToken.
+    """
+    url = f"{BASE_URL}/users/me/threads"
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    collected = 0
+    page_token = None
+    while max_results is None or collected < max_results:
+        params = {
+            "q": query,
+            "maxResults": _next_page_size(max_results, collected)
+        }
+        if page_token:
+            params["pageToken"] = page_token
+
+        with metrics.stage("list"):
+            response = await get_scheduler().request(access_token, "GET", url, QUOTA_UNITS["threads.list"],
+                                                     headers=headers, params=params)
+        response.raise_for_status()
+        metrics.inc("bytes_received", len(response.content), kind="list")
+
+        data = response.json()
+        page = data.get('threads', [])
+        collected += len(page)
+        if page:
+            yield page
+        page_token = data.get('nextPageToken')
+        if not page_token:
+            break
+
+async def get_recent_thread_ids_async(access_token: str, max_results: Optional[int] = 30,
+                                      query: str = RECENT_QUERY) -> List[Dict]:
+    """
+    Async version of get_recent_thread_ids using the shared connection pool.
+    """
+    threads = []
+    async for page in iter_recent_thread_pages_async(access_token, max_results, query):
+        threads.extend(page)
+    return threads
+
+async def _fetch_in_batches(access_token: str, pages: AsyncIterator[List[Dict]],
+                            handle: Callable[[Dict], List], fetch_mode: str,
+                            batch_size: int, max_concurrency: int,
+                            dropped: Optional[List[str]] = None) -> List:
+    """
+    Fetch the threads listed in `pages` with batched threads.get calls.
+
+    Batches are dispatched as soon as enough thread IDs have arrived, with at
+    most `max_concurrency` batch requests in flight. `handle` turns each raw
+    thread into result items as it is parsed, so only one raw thread is held at
+    a time. Results keep listing order.
+
+    Parts of a batch that fail with a rate limit or server error are retried
+    on their own with backoff. Threads that are gone (404) are left out. IDs of
+    threads that still could not be fetched are appended to `dropped`, or
+    raised as IncompleteFetch when no `dropped` list is given.
+    """
+    if not 0 < batch_size <= MAX_BATCH_SIZE:
+        raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+    thread_query(fetch_mode)
+
+    limit = asyncio.Semaphore(max_concurrency)
+    scheduler = get_scheduler()
+    failures: List[str] = []
+
+    async def fetch_batch(chunk: List[Dict]) -> List:
+        results: Dict[str, List] = {}
+        pending = [thread["id"] for thread in chunk]
+        async with limit:
+            for attempt in range(scheduler.policy.max_attempts):
+                with metrics.stage("batch_build"):
+                    headers, batch_body = build_threads_batch(
+                        access_token, [{"id": thread_id} for thread_id in pending], fetch_mode
+                    )
+                metrics.inc("bytes_sent", len(batch_body), kind="batch")
+                unanswered = set(pending)
+                retry, retry_after = [], None
+                async for part in stream_batch_parts_async(access_token, headers, batch_body,
+                                                           len(pending)):
+                    thread_id = part.request_id
+                    if part.ok:
+                        try:
+                            with metrics.stage("decode"):
+                                thread = part.json()
+                        except ValueError:
+                            thread = None
+                        if thread is not None:
+                            # Fall back to the thread's own ID if the Content-ID was not echoed.
+                            if thread_id not in unanswered:
+                                thread_id = thread.get("id")
+                            if thread_id in unanswered:
+                                unanswered.discard(thread_id)
+                                with metrics.stage("extract"):
+                                    results[thread_id] = handle(thread)
+                            continue
+                    if thread_id not in unanswered:
+                        continue
+                    unanswered.discard(thread_id)
+                    metrics.inc("api_errors", status=part.status, scope="part")
+                    if part.status == 404:
+                        continue
+                    if is_retryable(part.status, part.body):
+                        retry.append(thread_id)
+                        wait = parse_retry_after(part.headers.get("retry-after"))
+                        if wait is not None:
+                            retry_after = max(retry_after or 0.0, wait)
+                        continue
+                    failures.append(thread_id)
+                # Parts missing from the response are retried too.
+                retry.extend(thread_id for thread_id in pending if thread_id in unanswered)
+                if not retry:
+                    break
+                if attempt + 1 == scheduler.policy.max_attempts:
+                    failures.extend(retry)
+                    break
+                await scheduler.backoff(attempt, retry_after)
+                pending = retry
+        return [item for thread in chunk for item in results.get(thread["id"], [])]
+
+    tasks = []
+    pending: List[Dict] = []
+    try:
+        async for page in pages:
+            pending.extend(page)
+            while len(pending) >= batch_size:
+                chunk, pending = pending[:batch_size], pending[batch_size:]
+                tasks.append(asyncio.create_task(fetch_batch(chunk)))
+        if pending:
+            tasks.append(asyncio.create_task(fetch_batch(pending)))
+
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    if failures:
+        if dropped is None:
+            raise IncompleteFetch(failures)
+        dropped.extend(failures)
+    return [item for batch in results for item in batch]
+
+async def get_all_threads_async(access_token: str, max_threads: Optional[int] = 30,
+                                fetch_mode: str = "metadata",
+                                batch_size: int = MAX_BATCH_SIZE,
+                                max_concurrency: int = MAX_CONCURRENT_BATCHES,
+                                dropped: Optional[List[str]] = None,
+                                include_body: bool = False) -> List[EmailRecord]:
+    """
+    Async version of get_all_threads. Concurrent callers share pooled keep-alive
+    connections instead of opening a new TLS session per request.
+
+    Pass a `dropped` list to get partial results, with the IDs of threads that
+    failed after retrying appended to it; otherwise those raise IncompleteFetch.
+    `include_body` attaches lazily decoded bodies and needs fetch_mode="full".
+    """
+    if include_body and fetch_mode != "full":
+        raise ValueError("include_body needs fetch_mode='full'")
+    return await _fetch_in_batches(
+        access_token,
+        iter_recent_thread_pages_async(access_token, max_threads),
+        lambda thread: extract_email_content([thread], include_body),
+        fetch_mode, batch_size, max_concurrency, dropped,
+    )
+
+async def get_threads_async(access_token: str, thread_ids: List[str],
+                            fetch_mode: str = "metadata",
+                            batch_size: int = MAX_BATCH_SIZE,
+                            max_concurrency: int = MAX_CONCURRENT_BATCHES) -> List[Dict]:
+    """
+    Fetch the given threads as raw thread objects. Threads that no longer exist
+    are left out.
+    """
+    async def pages():
+        yield [{"id": thread_id} for thread_id in thread_ids]
+
+    return await _fetch_in_batches(
+        access_token, pages(), lambda thread: [thread],
+        fetch_mode, batch_size, max_concurrency,
+    )
+
+async def get_many_accounts_async(
+        access_tokens: List[str], max_threads: Optional[int] = 30, fetch_mode: str = "metadata",
+        max_concurrency: int = MAX_CONCURRENT_ACCOUNTS,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+        load: Optional[Callable[[str], Awaitable[List[EmailRecord]]]] = None,
+) -> Tuple[List[Tuple[str, EmailRecord]], Dict[str, str]]:
+    """
+    Fetch recent emails from several accounts concurrently.
+
+    At most `max_concurrency` accounts are fetched at once, and each account's
+    Gmail requests are throttled to `requests_per_second`. An account that
+    fails does not fail the others: its error is reported instead.
+
+    `load` fetches one account's records (get_all_threads_async by default).
+    Tokens that resolve to an account already being fetched (a refreshed or
+    second token for the same mailbox) are skipped, so every account appears
+    once. Returns (account, record) pairs from every account, newest first,
+    and a map of account to error message. Accounts whose profile lookup
+    fails are labelled by position, e.g. "account[2]".
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+    if load is None:
+        async def load(access_token: str) -> List[EmailRecord]:
+            return await get_all_threads_async(access_token, max_threads=max_threads,
+                                               fetch_mode=fetch_mode)
+
+    limit = asyncio.Semaphore(max_concurrency)
+    claimed = set()
+
+    async def fetch_account(index: int, access_token: str):
+        # Each gathered coroutine runs in its own task and context, so the
+        # limiter applies to this account's requests only.
+        current_limiter.set(get_limiter(access_token, requests_per_second))
+        account = f"account[{index}]"
+        async with limit:
+            try:
+                account = await get_account_async(access_token)
+                if account in claimed:
+                    return account, [], None
+                claimed.add(account)
+                return account, await load(access_token), None
+            except Exception as error:
+                return account, [], f"{type(error).__name__}: {error}"
+
+    results = await asyncio.gather(*(
+        fetch_account(index, access_token)
+        for index, access_token in enumerate(dict.fromkeys(access_tokens))
+    ))
+
+    emails = [(account, record) for account, records, _ in results for record in records]
+    # Stable sort: messages without a date keep their order, after dated ones.
+    emails.sort(key=lambda item: -(item[1].internal_date or 0))
+    errors = {account: error for account, _, error in results if error is not None}
+    return emails, errors
 
 def parse_gmail_batch_response(response) -> List[Dict]:
     """
@@ -74,60 +445,111 @@ def parse_gmail_batch_response(response) -> List[Dict]:
     content_type = response.headers.get("Content-Type", "")
     boundary = extract_boundary(content_type)
 
-    raw = response.text
-    parts = raw.split(f"--{boundary}")
-
-    threads = []
+    parts = iter_batch_parts([response.text.encode()], boundary)
+    return list(threads_from_parts(parts))
 
+def threads_from_parts(parts: Iterable[BatchPart]) -> Iterator[Dict]:
+    """
+    Decode successful batch parts into thread objects, skipping failed requests.
+    """
     for part in parts:
-        part = part.strip()
-
-        if not part or part == "--":
+        if part.status != 200:
             continue
-
-        # Each part contains a full HTTP response
-        if "HTTP/1.1 200" not in part:
-            continue  # skip failed requests
-
-        # JSON starts after the first empty line following headers
         try:
-            json_start = part.index("{")
-            json_body = part[json_start:]
-            thread = json.loads(json_body)
-            threads.append(thread)
-        except Exception:
+            yield part.json()
+        except ValueError:
             continue
 
-    return threads
+async def stream_batch_parts_async(access_token: str, headers: Dict, batch_body: bytes,
+                                   num_requests: int) -> AsyncIterator[BatchPart]:
+    """
+    Send a batch of `num_requests` threads.get calls and yield each part of the
+    response as it arrives, without holding the whole multipart body in memory.
+    The batch itself is retried while Gmail rate-limits or fails it outright.
+
+    Records the "batch_http" stage (sending, including retries, plus waiting
+    for response bytes) and the "parse" stage (splitting the multipart body)
+    separately, although the two interleave.
+    """
+    started = time.perf_counter()
+    # Until the response headers arrive, then waiting for body chunks.
+    connecting = 0.0
+    waiting = 0.0
+    parsing = 0.0
+    received = 0
+
+    async def timed_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        nonlocal waiting, received
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                waiting += time.perf_counter() - start
+            received += len(chunk)
+            yield chunk
+
+    try:
+        async with get_scheduler().stream(
+            access_token, "POST", BATCH_BASE_URL, num_requests * QUOTA_UNITS["threads.get"],
+            headers=headers, content=batch_body,
+        ) as response:
+            connecting = time.perf_counter() - started
+            response.raise_for_status()
+            boundary = extract_boundary(response.headers.get("Content-Type", ""))
+            parts = aiter_batch_parts(timed_chunks(response.aiter_bytes().__aiter__()), boundary)
+            while True:
+                start = time.perf_counter()
+                try:
+                    part = await parts.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    parsing += time.perf_counter() - start
+                yield part
+    finally:
+        metrics.observe("batch_http", (connecting or time.perf_counter() - started) + waiting)
+        # Time inside the parser, minus what it spent waiting for the network.
+        metrics.observe("parse", max(parsing - waiting, 0.0))
+        metrics.inc("bytes_received", received, kind="batch")
 
 def extract_boundary(content_type: str) -> str:
     match = re.search(r'boundary=([^\s;]+)', content_type)
     if not match:
         raise ValueError("Boundary not found in Content-Type")
-    return match.group(1)
+    return match.group(1).strip('"')
 
-def extract_email_content(threads: List[Dict]) -> List[Dict]:
+def extract_email_content(threads: List[Dict], include_body: bool = False) -> List[EmailRecord]:
+    """
+    Previews of every message in `threads`. With `include_body`, each record
+    also carries a LazyBody, decoded only if it is read.
+    """
     emails = []
     for thread in threads:
         for message in thread['messages']:
             from_email, subject = extract_from_and_subject(message)
-            emails.append(EmailPreview(
+            emails.append(EmailRecord(
                 id=message['id'],
                 thread_id=message['threadId'],
                 snippet=message['snippet'],
                 from_=from_email,
-                subject=subject
+                subject=subject,
+                internal_date=int(message['internalDate']) if 'internalDate' in message else None,
+                history_id=thread.get('historyId'),
+                body=lazy_body(message) if include_body else None
             ))
     return emails
 
 def extract_headers(message: dict) -> dict:
+    """
+    Every header of the message by exact name. Prefer `message_headers` when
+    only a few are needed.
+    """
     headers = message.get("payload", {}).get("headers", [])
     return {h["name"]: h["value"] for h in headers}
 
 def extract_from_and_subject(message: dict) -> tuple[str | None, str | None]:
-    header_map = extract_headers(message)
-
-    from_email = header_map.get("From")
-    subject = header_map.get("Subject")
-
-    return from_email, subject
\ No newline at end of file
+    from_email, subject = message_headers(message, METADATA_HEADERS)
+    return decode_words(from_email), decode_words(subject)
\ No newline at end of file
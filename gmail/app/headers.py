@@ -0,0 +1,69 @@
+from email.header import decode_header, make_header
+from email.errors import HeaderParseError
+from email.utils import parseaddr
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+
+class Address(NamedTuple):
+    name: Optional[str]
+    address: Optional[str]
+
+
+@lru_cache(maxsize=64)
+def _lookup(names: Tuple[str, ...]) -> Tuple[Dict[str, int], FrozenSet[int]]:
+    """
+    Index of each requested name by its lowercase form, plus the set of name
+    lengths, so most headers are rejected without lowercasing them.
+    """
+    return {name.lower(): index for index, name in enumerate(names)}, frozenset(map(len, names))
+
+
+def find_headers(headers: List[Dict], names: Tuple[str, ...]) -> List[Optional[str]]:
+    """
+    Values of the requested headers, in the order of `names`; None for missing ones.
+
+    Names match case-insensitively and the first occurrence wins. The scan
+    stops as soon as every requested header has been seen.
+    """
+    index_of, lengths = _lookup(names)
+    values: List[Optional[str]] = [None] * len(names)
+    remaining = len(index_of)
+    for header in headers:
+        name = header["name"]
+        if len(name) not in lengths:
+            continue
+        index = index_of.get(name.lower())
+        if index is None or values[index] is not None:
+            continue
+        values[index] = header["value"]
+        remaining -= 1
+        if not remaining:
+            break
+    return values
+
+
+def message_headers(message: Dict, names: Tuple[str, ...]) -> List[Optional[str]]:
+    return find_headers(message.get("payload", {}).get("headers", []), names)
+
+
+def decode_words(value: Optional[str]) -> Optional[str]:
+    """
+    Decode RFC 2047 encoded-words (`=?UTF-8?B?...?=`); other values are returned as is.
+    """
+    if value is None or "=?" not in value:
+        return value
+    try:
+        return str(make_header(decode_header(value)))
+    except (HeaderParseError, LookupError, UnicodeDecodeError):
+        return value
+
+
+def parse_address(value: Optional[str]) -> Address:
+    """
+    Split a From-style header into display name and address.
+    """
+    if not value:
+        return Address(None, None)
+    name, address = parseaddr(decode_words(value))
+    return Address(name or None, address or None)
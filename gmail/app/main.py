@@ -1,38 +1,341 @@
-import logging
-from .gmail_api import get_all_threads
-from .model import FetchRecentEmailsResponse
+import argparse, logging, os, time
+from typing import Dict, List, Optional, Tuple
+from .gmail_api import (MAX_CONCURRENT_ACCOUNTS, RECENT_QUERY, IncompleteFetch,
+                        get_account_async, get_all_threads_async, get_many_accounts_async)
+from .metrics import metrics
+from .model import (AccountEmailPreview, AccountError, EmailRecord, FetchManyAccountsResponse,
+                    FetchRecentEmailsResponse, SearchEmailsResponse)
+from .prefetch import aclose_prefetchers, add_change_listener, get_prefetcher, parse_push
+from .pagination import DEFAULT_BODY_CHARS, DEFAULT_MAX_BYTES, DEFAULT_SNIPPET_CHARS, page_start, paginate
+from .ratelimit import DEFAULT_REQUESTS_PER_SECOND
+from .response_cache import ResponseCache
+from .scheduler import get_scheduler
+from .search import DAY_MS, DEFAULT_MAX_RESULTS, DEFAULT_SEARCH_DAYS, parse_date, search_emails as run_search
+from .store import SearchQuery, get_store
+from .sync import mark_stale, sync_recent_emails
+from .transport import aclose_transport
 
+import anyio
 from mcp.server.fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import Response
 
 mcp = FastMCP("gmail")
 
-logging.basicConfig(
-    level=logging.INFO,
-    format=f"%(asctime)s - %(levelname)s - %(message)s",
-    filename="gmail_mcp_server.log",
-    filemode="a"
-)
+TRANSPORTS = ("stdio", "sse", "streamable-http")
+# Default transport when --transport is not given.
+TRANSPORT_ENV = "GMAIL_MCP_TRANSPORT"
+# Pub/Sub push subscriptions for users.watch POST here (HTTP transports only).
+PUSH_PATH = "/gmail/push"
+# If set, push requests must carry ?token=<value>.
+PUSH_TOKEN_ENV = "GMAIL_PUSH_TOKEN"
+# Prometheus/OpenMetrics scrape endpoint (HTTP transports only).
+METRICS_PATH = "/metrics"
+
+LOG_FILE = "gmail_mcp_server.log"
 
 logger = logging.getLogger(__name__)
 
+# Repeated identical tool calls within the TTL are answered from memory.
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("GMAIL_RESPONSE_CACHE_SIZE", 256)),
+    ttl=float(os.environ.get("GMAIL_RESPONSE_CACHE_TTL", 30)),
+)
+metrics.register("response_cache", lambda: response_cache.stats())
+metrics.register("scheduler", lambda: get_scheduler().stats())
+
+def forget_responses(account: str):
+    """
+    Drop the account's cached tool responses once its mailbox has changed.
+    """
+    response_cache.invalidate(lambda key: key[0] == account)
+
+add_change_listener(forget_responses)
+
+async def load_recent_emails(access_token: str, max_threads: int, fetch_mode: str,
+                             include_body: bool = False) -> Tuple[List[EmailRecord], List[str]]:
+    """
+    Recent emails plus the IDs of threads that could not be fetched.
+    """
+    # Previews are served from the local cache, kept in sync through Gmail history.
+    store = get_store() if fetch_mode == "metadata" and not include_body else None
+    if store is not None:
+        # Accounts kept warm by the prefetch worker are answered without calling Gmail.
+        prefetcher = get_prefetcher(store)
+        if prefetcher is not None and prefetcher.accounts:
+            account = await get_account_async(access_token)
+            warm = await prefetcher.recent_messages(access_token, account, max_threads)
+            if warm is not None:
+                metrics.inc("recent_loads", source="prefetch")
+                return warm, []
+        try:
+            emails = await sync_recent_emails(access_token, store, max_threads=max_threads)
+            metrics.inc("recent_loads", source="store")
+            return emails, []
+        except IncompleteFetch as error:
+            # The cache is left untouched; answer this call with a direct fetch.
+            logger.warning(f"Cache sync incomplete, fetching directly: {error}")
+    dropped: List[str] = []
+    emails = await get_all_threads_async(access_token, max_threads=max_threads,
+                                         fetch_mode=fetch_mode, dropped=dropped,
+                                         include_body=include_body)
+    metrics.inc("recent_loads", source="gmail")
+    return emails, dropped
+
+async def cached_recent_emails(access_token: str, max_threads: int, fetch_mode: str,
+                               include_body: bool = False) -> Tuple[List[EmailRecord], List[str]]:
+    async def load():
+        return await load_recent_emails(access_token, max_threads, fetch_mode, include_body)
+
+    if not response_cache.enabled:
+        return await load()
+    account = await get_account_async(access_token)
+    key = (account, RECENT_QUERY, max_threads, fetch_mode, include_body)
+    emails, dropped = await response_cache.get_or_load(key, load)
+    if dropped:
+        # Share a partial result with concurrent callers, but do not keep it.
+        response_cache.invalidate(lambda cached: cached == key)
+    return emails, dropped
+
 @mcp.tool()
-def fetch_recent_emails(access_token: str):
+async def fetch_recent_emails(access_token: str, max_threads: int = 20,
+                              fetch_mode: str = "metadata", cursor: Optional[str] = None,
+                              max_bytes: int = DEFAULT_MAX_BYTES,
+                              max_tokens: Optional[int] = None,
+                              snippet_chars: int = DEFAULT_SNIPPET_CHARS,
+                              include_body: bool = False,
+                              body_chars: int = DEFAULT_BODY_CHARS):
     """
-    Fetches the recent emails from the user's inbox.
+    Fetches the recent emails from the user's inbox, one page at a time.
     
     Args:
         access_token: The access token for the user's Gmail API.
+        max_threads: The maximum number of recent threads to fetch.
+        fetch_mode: "metadata" for sender, subject and snippet only, or "full"
+            to also download message bodies.
+        cursor: The next_cursor from a previous call, to fetch the following page.
+        max_bytes: Approximate size limit of one page, in bytes of compact JSON.
+        max_tokens: Optional size limit of one page, in LLM tokens (estimated).
+        snippet_chars: Snippets longer than this are truncated.
+        include_body: Also return each message's text (implies fetch_mode "full").
+        body_chars: Bodies longer than this are truncated.
     """
-    emails = get_all_threads(access_token, max_threads=20)
+    if include_body:
+        fetch_mode = "full"
+    emails, dropped = await cached_recent_emails(access_token, max_threads, fetch_mode,
+                                                 include_body)
+    with metrics.stage("serialize"):
+        page, next_cursor = paginate(emails, cursor, max_bytes=max_bytes,
+                                     max_tokens=max_tokens, snippet_chars=snippet_chars,
+                                     body_chars=body_chars)
+        response = FetchRecentEmailsResponse.from_records(page, next_cursor=next_cursor, total=len(emails),
+                                                          dropped_thread_ids=dropped)
+    logger.info(f"Fetched {len(emails)} emails, returning {len(page)}")
+    return response
     
-    logger.info(f"Fetched {len(emails)} emails")
-    return FetchRecentEmailsResponse(
-        emails=emails
+@mcp.tool()
+async def fetch_recent_emails_many(access_tokens: List[str], max_threads: int = 20,
+                                   fetch_mode: str = "metadata",
+                                   max_concurrency: int = MAX_CONCURRENT_ACCOUNTS,
+                                   requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+                                   cursor: Optional[str] = None,
+                                   max_bytes: int = DEFAULT_MAX_BYTES,
+                                   max_tokens: Optional[int] = None,
+                                   snippet_chars: int = DEFAULT_SNIPPET_CHARS):
+    """
+    Fetches the recent emails from several inboxes at once, merged newest
+    first, one page at a time. Accounts that fail are listed under errors;
+    the others are still returned. Tokens for the same account are fetched once.
+    For server-to-server callers that hold the tokens; chat clients do not
+    offer this tool to their model.
+    
+    Args:
+        access_tokens: One Gmail API access token per account.
+        max_threads: The maximum number of recent threads to fetch per account.
+        fetch_mode: "metadata" or "full", as for fetch_recent_emails.
+        max_concurrency: How many accounts to fetch at the same time.
+        requests_per_second: Gmail request rate limit for each account.
+        cursor: The next_cursor from a previous call, to fetch the following page.
+        max_bytes: Approximate size limit of one page, in bytes of compact JSON.
+        max_tokens: Optional size limit of one page, in LLM tokens (estimated).
+        snippet_chars: Snippets longer than this are truncated.
+    """
+    dropped: Dict[str, List[str]] = {}
+
+    async def load(access_token: str):
+        emails, dropped_ids = await cached_recent_emails(access_token, max_threads, fetch_mode)
+        if dropped_ids:
+            dropped[await get_account_async(access_token)] = dropped_ids
+        return emails
+
+    emails, errors = await get_many_accounts_async(
+        access_tokens, max_concurrency=max_concurrency,
+        requests_per_second=requests_per_second, load=load,
+    )
+    records = [record for _, record in emails]
+    # Each email also carries "account":"...", counted against the budget.
+    account_bytes = max((len(account.encode()) + 13 for account, _ in emails), default=0)
+    start = page_start(records, cursor)
+    page, next_cursor = paginate(records, cursor, max_bytes=max_bytes, max_tokens=max_tokens,
+                                 snippet_chars=snippet_chars, extra_bytes=account_bytes)
+    logger.info(f"Fetched {len(emails)} emails from {len(access_tokens)} accounts, "
+                f"{len(errors)} failed, returning {len(page)}")
+    return FetchManyAccountsResponse(
+        emails=[
+            AccountEmailPreview(account=account, id=record.id, thread_id=record.thread_id,
+                                snippet=record.snippet, from_=record.from_,
+                                subject=record.subject, history_id=record.history_id)
+            for (account, _), record in zip(emails[start:], page)
+        ],
+        next_cursor=next_cursor,
+        total=len(emails),
+        errors=[AccountError(account=account, error=error) for account, error in errors.items()],
+        dropped_thread_ids=dropped,
     )
     
-def main():
-    logger.info("Starting Gmail MCP server")
-    mcp.run(transport="stdio")
+@mcp.tool()
+async def search_emails(access_token: str, query: Optional[str] = None,
+                        sender: Optional[str] = None, subject: Optional[str] = None,
+                        after: Optional[str] = None, before: Optional[str] = None,
+                        newer_than_days: int = DEFAULT_SEARCH_DAYS,
+                        max_results: int = DEFAULT_MAX_RESULTS, cursor: Optional[str] = None,
+                        max_bytes: int = DEFAULT_MAX_BYTES,
+                        max_tokens: Optional[int] = None,
+                        snippet_chars: int = DEFAULT_SNIPPET_CHARS):
+    """
+    Searches the user's emails by keywords, sender, subject and date, newest first.
+    Recent mail is searched in the local cache; older ranges are searched in Gmail.
+    
+    Args:
+        access_token: The access token for the user's Gmail API.
+        query: Words that must all appear in the sender, subject or snippet.
+        sender: Part of the sender's name or address.
+        subject: Part of the subject.
+        after: Only emails received on or after this date (YYYY-MM-DD).
+        before: Only emails received before this date (YYYY-MM-DD).
+        newer_than_days: Only emails from the last this many days; ignored if after is given.
+        max_results: The maximum number of emails to return across all pages.
+        cursor: The next_cursor from a previous call, to fetch the following page.
+        max_bytes: Approximate size limit of one page, in bytes of compact JSON.
+        max_tokens: Optional size limit of one page, in LLM tokens (estimated).
+        snippet_chars: Snippets longer than this are truncated.
+    """
+    since_ms = parse_date(after)
+    if since_ms is None and newer_than_days:
+        since_ms = int(time.time() * 1000) - newer_than_days * DAY_MS
+    search_query = SearchQuery(text=query, sender=sender, subject=subject,
+                               since_ms=since_ms, until_ms=parse_date(before))
+    emails, source = await run_search(access_token, get_store(), search_query, max_results)
+    page, next_cursor = paginate(emails, cursor, max_bytes=max_bytes,
+                                 max_tokens=max_tokens, snippet_chars=snippet_chars)
+    logger.info(f"Search matched {len(emails)} emails from {source}, returning {len(page)}")
+    return SearchEmailsResponse.from_records(page, next_cursor=next_cursor,
+                                             total=len(emails), source=source)
+    
+@mcp.tool()
+async def prefetch_recent_emails(access_token: str, max_threads: int = 20):
+    """
+    Keeps the user's recent emails synced in the background, so later
+    fetch_recent_emails calls for up to max_threads threads (metadata mode)
+    answer immediately. Call again with a new access token when the old one expires.
+    
+    Args:
+        access_token: The access token for the user's Gmail API.
+        max_threads: The number of recent threads to keep synced.
+    """
+    prefetcher = get_prefetcher()
+    if prefetcher is None:
+        raise ValueError("Prefetching needs the message cache; set GMAIL_CACHE_URL")
+    account = await prefetcher.register(access_token, max_threads)
+    logger.info(f"Prefetching {max_threads} threads for {account}")
+    return {"account": account, "interval_seconds": prefetcher.interval,
+            "push": prefetcher.topic is not None}
+    
+@mcp.custom_route(PUSH_PATH, methods=["POST"])
+async def gmail_push(request: Request) -> Response:
+    """
+    Receives Gmail's Pub/Sub push notifications and resyncs the account.
+    """
+    expected = os.environ.get(PUSH_TOKEN_ENV)
+    if expected and request.query_params.get("token") != expected:
+        return Response(status_code=403)
+    try:
+        account, history_id = parse_push(await request.body())
+    except ValueError:
+        return Response(status_code=400)
+    forget_responses(account)
+    mark_stale(account)
+    prefetcher = get_prefetcher()
+    known = prefetcher is not None and prefetcher.notify(account)
+    logger.info(f"Push for {account} at history {history_id}, registered={known}")
+    # Acknowledge unknown accounts too, or Pub/Sub keeps redelivering.
+    return Response(status_code=204)
+    
+@mcp.tool()
+def server_stats():
+    """
+    Returns cache hit/miss counters, Gmail retry/quota usage, prefetch status
+    and per-stage fetch latencies for monitoring the Gmail server.
+    """
+    prefetcher = get_prefetcher()
+    return {"response_cache": response_cache.stats(), "gmail": get_scheduler().stats(),
+            "prefetch": prefetcher.stats() if prefetcher is not None else None,
+            "pipeline": metrics.snapshot()}
+    
+@mcp.custom_route(METRICS_PATH, methods=["GET"])
+async def metrics_endpoint(request: Request) -> Response:
+    """
+    Stage latencies, byte and error counters in the OpenMetrics text format.
+    """
+    return Response(metrics.render_openmetrics(),
+                    media_type="application/openmetrics-text; version=1.0.0; charset=utf-8")
+    
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Gmail MCP server")
+    parser.add_argument("--transport", choices=TRANSPORTS,
+                        default=os.environ.get(TRANSPORT_ENV, "stdio"),
+                        help="stdio serves one client; sse and streamable-http keep one "
+                             "warm process for many clients")
+    parser.add_argument("--host", default=mcp.settings.host)
+    parser.add_argument("--port", type=int, default=mcp.settings.port)
+    return parser.parse_args(argv)
+    
+def configure_logging():
+    """
+    Also log to LOG_FILE. Done when the server starts rather than on import,
+    and added next to the console handler FastMCP installs.
+    """
+    handler = logging.FileHandler(LOG_FILE, mode="a")
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    
+async def serve(transport: str):
+    """
+    Run the server on `transport` until it stops, then stop the prefetch
+    workers and close pooled Gmail connections. FastMCP's lifespan hook runs
+    per session over HTTP, so process-wide shutdown lives here instead.
+    """
+    run = {"stdio": mcp.run_stdio_async, "sse": mcp.run_sse_async,
+           "streamable-http": mcp.run_streamable_http_async}[transport]
+    try:
+        await run()
+    finally:
+        await aclose_prefetchers()
+        await aclose_transport()
+    
+def main(argv: Optional[List[str]] = None):
+    """
+    Run the server. Over HTTP, every client session shares this process's
+    response cache, message store, Gmail connection pool and quota tracking.
+    """
+    args = parse_args(argv)
+    configure_logging()
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    logger.info(f"Starting Gmail MCP server on {args.transport}")
+    anyio.run(serve, args.transport)
     logger.info("Gmail MCP server stopped")
     
 if __name__ == "__main__":
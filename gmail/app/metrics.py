@@ -0,0 +1,172 @@
+import bisect
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Set to 1 to also record each stage as an OpenTelemetry span (needs opentelemetry-api,
+# plus an SDK and exporter configured by the host to see them).
+TRACING_ENV = "GMAIL_OTEL_TRACING"
+PREFIX = "gmail"
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Cumulative latency histogram with fixed buckets, as Prometheus keeps them.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One count per bucket plus the +Inf bucket; not cumulative until rendered.
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-quantile (the max for the +Inf bucket).
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative(self) -> Iterator[Tuple[str, int]]:
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            yield repr(bound), seen
+        yield "+Inf", self.count
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Metrics:
+    """
+    Per-stage latency histograms and event counters for the fetch pipeline.
+
+    Stages are timed with `stage()`; counters (bytes, errors, cache results)
+    are bumped with `inc()`. Components that already keep their own stats
+    (the response cache, the scheduler) are read at export time through
+    `register()`. `snapshot()` feeds the server_stats tool and
+    `render_openmetrics()` the /metrics endpoint.
+    """
+
+    def __init__(self, tracing: Optional[bool] = None):
+        self.stages: Dict[str, Histogram] = {}
+        self.counters: Counter = Counter()
+        self._collectors: Dict[str, Callable[[], Dict]] = {}
+        if tracing is None:
+            tracing = os.environ.get(TRACING_ENV, "") not in ("", "0")
+        self._tracer = self._load_tracer() if tracing else None
+
+    @staticmethod
+    def _load_tracer():
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            logger.warning(f"{TRACING_ENV} is set but opentelemetry-api is not installed")
+            return None
+        return trace.get_tracer(__name__)
+
+    def observe(self, stage: str, seconds: float):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.observe(seconds)
+
+    @contextmanager
+    def stage(self, name: str, **attributes):
+        """
+        Time the block as one observation of `name`, inside a span when tracing.
+        """
+        span = (nullcontext() if self._tracer is None
+                else self._tracer.start_as_current_span(name, attributes=attributes))
+        with span:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.observe(name, time.perf_counter() - start)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        self.counters[name, _labels(labels)] += value
+
+    def register(self, name: str, collect: Callable[[], Dict]):
+        """
+        Export the numeric values of `collect()` as gauges named <name>_<key>.
+        """
+        self._collectors[name] = collect
+
+    def reset(self):
+        self.stages.clear()
+        self.counters.clear()
+
+    def snapshot(self) -> Dict:
+        stages = {
+            name: {"count": h.count, "total_ms": round(h.sum * 1000, 3),
+                   "mean_ms": round(h.sum / h.count * 1000, 3) if h.count else 0.0,
+                   "p95_ms": round(h.quantile(0.95) * 1000, 3), "max_ms": round(h.max * 1000, 3)}
+            for name, h in sorted(self.stages.items())
+        }
+        counters: Dict[str, Dict[str, float]] = {}
+        for (name, labels), value in sorted(self.counters.items()):
+            key = ",".join(f"{k}={v}" for k, v in labels) or "total"
+            counters.setdefault(name, {})[key] = value
+        return {"stages": stages, "counters": counters}
+
+    def render_openmetrics(self) -> str:
+        lines: List[str] = []
+        name = f"{PREFIX}_stage_seconds"
+        lines += [f"# TYPE {name} histogram", f"# HELP {name} Time spent per fetch pipeline stage."]
+        for stage, histogram in sorted(self.stages.items()):
+            labels = (("stage", stage),)
+            for bound, count in histogram.cumulative():
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', bound),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        by_name: Dict[str, List] = {}
+        for (counter, labels), value in sorted(self.counters.items()):
+            by_name.setdefault(counter, []).append((labels, value))
+        for counter, samples in by_name.items():
+            lines.append(f"# TYPE {PREFIX}_{counter} counter")
+            lines += [f"{PREFIX}_{counter}_total{_format_labels(labels)} {value}" for labels, value in samples]
+
+        for collector, collect in sorted(self._collectors.items()):
+            for key, value in sorted(collect().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines += [f"# TYPE {PREFIX}_{collector}_{key} gauge",
+                              f"{PREFIX}_{collector}_{key} {value}"]
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
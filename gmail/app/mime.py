@@ -0,0 +1,155 @@
+import base64
+import re
+from html.parser import HTMLParser
+from typing import Dict, Iterator, List, Optional
+
+# Body parts in order of preference. HTML is only used when there is no plain text.
+BODY_MIME_TYPES = ("text/plain", "text/html")
+# Tags whose text is never part of the readable body.
+HIDDEN_TAGS = {"script", "style", "head", "title"}
+# Tags that start a new line in the stripped text.
+BLOCK_TAGS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6",
+              "blockquote", "pre", "table", "ul", "ol", "hr"}
+
+
+def is_attachment(part: Dict) -> bool:
+    """
+    Attachments are told apart by their filename or an attachmentId; their
+    data is never looked at.
+    """
+    if part.get("filename") or part.get("body", {}).get("attachmentId"):
+        return True
+    for header in part.get("headers", []):
+        if header["name"].lower() == "content-disposition":
+            return header["value"].lower().startswith("attachment")
+    return False
+
+
+def iter_leaf_parts(payload: Dict) -> Iterator[Dict]:
+    """
+    Walk `payload.parts` depth first, yielding non-attachment leaf parts.
+    """
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        children = part.get("parts")
+        if children:
+            stack.extend(reversed(children))
+        elif not is_attachment(part):
+            yield part
+
+
+def find_body_part(payload: Dict) -> Optional[Dict]:
+    """
+    The preferred body part of a message payload: the first text/plain part,
+    else the first text/html part. Nothing is decoded.
+    """
+    fallback = None
+    for part in iter_leaf_parts(payload):
+        mime_type = part.get("mimeType", "").lower()
+        if not part.get("body", {}).get("data"):
+            continue
+        if mime_type == BODY_MIME_TYPES[0]:
+            return part
+        if mime_type == BODY_MIME_TYPES[1] and fallback is None:
+            fallback = part
+    return fallback
+
+
+def part_charset(part: Dict) -> str:
+    for header in part.get("headers", []):
+        if header["name"].lower() == "content-type":
+            match = re.search(r'charset="?([\w.:-]+)"?', header["value"], re.IGNORECASE)
+            if match:
+                return match.group(1)
+    return "utf-8"
+
+
+def decode_part(part: Dict) -> str:
+    """
+    Base64url-decode a part's body data into text.
+    """
+    data = part["body"]["data"]
+    raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    try:
+        return raw.decode(part_charset(part), errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+
+class _TextExtractor(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks: List[str] = []
+        self._hidden = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HIDDEN_TAGS:
+            self._hidden += 1
+        elif tag in BLOCK_TAGS:
+            self.chunks.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in HIDDEN_TAGS:
+            self._hidden = max(self._hidden - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self.chunks.append("\n")
+
+    def handle_data(self, data):
+        if not self._hidden:
+            self.chunks.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """
+    Readable text from an HTML body: tags and scripts removed, block elements
+    turned into line breaks, whitespace collapsed.
+    """
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    text = "".join(parser.chunks)
+    lines = (re.sub(r"[ \t\r\f\v]+", " ", line).strip() for line in text.split("\n"))
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def part_text(part: Dict) -> str:
+    text = decode_part(part)
+    if part.get("mimeType", "").lower() == "text/html":
+        return html_to_text(text)
+    return text.strip()
+
+
+class LazyBody:
+    """
+    A message body that is decoded the first time it is read.
+
+    Only the chosen body part is kept, so the rest of the raw message
+    (headers, other parts, attachments) can be freed.
+    """
+
+    __slots__ = ("_part", "_text")
+
+    def __init__(self, part: Dict):
+        self._part = part
+        self._text: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = part_text(self._part)
+            self._part = None
+        return self._text
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def lazy_body(message: Dict) -> Optional[LazyBody]:
+    """
+    A LazyBody for the message's preferred text part, or None if it has none
+    (e.g. a format=metadata message).
+    """
+    part = find_body_part(message.get("payload", {}))
+    return LazyBody(part) if part is not None else None
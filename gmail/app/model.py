@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
 
 class Tool(BaseModel):
     name: str
@@ -9,12 +9,79 @@ class Tool(BaseModel):
 class FetchRecentEmailsRequest(BaseModel):
     access_token: str
     
+def _is_none(value) -> bool:
+    return value is None
+    
+def _is_empty(value) -> bool:
+    return not value
+    
 class EmailPreview(BaseModel):
+    id: str
+    thread_id: str
+    snippet: str
+    # Null headers are left out of the serialized form to keep tool output small.
+    from_: Optional[str] = Field(exclude_if=_is_none)
+    subject: Optional[str] = Field(exclude_if=_is_none)
+    # The thread's Gmail historyId; it changes whenever the thread does, so
+    # clients can key per-thread caches on (thread_id, history_id).
+    history_id: Optional[str] = Field(default=None, exclude_if=_is_none)
+    # Decoded message text, only when requested.
+    body: Optional[str] = Field(default=None, exclude_if=_is_none)
+    
+class EmailRecord(NamedTuple):
+    """
+    Internal, unvalidated form of EmailPreview built from already-parsed Gmail
+    API data. The fetch pipeline and caches pass these around and validation
+    happens once, when a tool response is built.
+    """
     id: str
     thread_id: str
     snippet: str
     from_: Optional[str]
     subject: Optional[str]
+    # Gmail internalDate (ms since the epoch); used to order merged results.
+    internal_date: Optional[int] = None
+    # The thread's historyId at the time it was fetched.
+    history_id: Optional[str] = None
+    # A str, or a mime.LazyBody that is decoded when first read; None unless
+    # bodies were requested.
+    body: Optional[Any] = None
     
 class FetchRecentEmailsResponse(BaseModel):
-    emails: List[EmailPreview]
\ No newline at end of file
+    emails: List[EmailPreview]
+    # Pass back as `cursor` to fetch the next page; absent on the last page.
+    next_cursor: Optional[str] = Field(default=None, exclude_if=_is_none)
+    # Number of emails across all pages.
+    total: Optional[int] = Field(default=None, exclude_if=_is_none)
+    # Threads that could not be fetched even after retrying.
+    dropped_thread_ids: List[str] = Field(default_factory=list, exclude_if=_is_empty)
+
+    @classmethod
+    def from_records(cls, emails: Iterable, **fields) -> "FetchRecentEmailsResponse":
+        """
+        Validate EmailRecords (or EmailPreviews) into a response in a single pass.
+        """
+        return cls.model_validate({"emails": list(emails), **fields}, from_attributes=True)
+    
+class AccountEmailPreview(EmailPreview):
+    account: str
+    
+class AccountError(BaseModel):
+    account: str
+    error: str
+    
+class FetchManyAccountsResponse(BaseModel):
+    # Emails from every account that succeeded, newest first.
+    emails: List[AccountEmailPreview]
+    # Pass back as `cursor` to fetch the next page; absent on the last page.
+    next_cursor: Optional[str] = Field(default=None, exclude_if=_is_none)
+    # Number of emails across all pages.
+    total: Optional[int] = Field(default=None, exclude_if=_is_none)
+    # Accounts that could not be fetched; their emails are missing from `emails`.
+    errors: List[AccountError] = Field(default_factory=list)
+    # Per account, threads that could not be fetched even after retrying.
+    dropped_thread_ids: Dict[str, List[str]] = Field(default_factory=dict, exclude_if=_is_empty)
+    
+class SearchEmailsResponse(FetchRecentEmailsResponse):
+    # "index" when answered from the local cache, "gmail" when Gmail was searched.
+    source: str
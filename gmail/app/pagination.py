@@ -0,0 +1,99 @@
+import base64
+import json
+from typing import List, Optional, Sequence, Tuple
+
+from .model import EmailRecord
+
+# Default response budget. Roughly 4 bytes of compact JSON per LLM token.
+DEFAULT_MAX_BYTES = 16_000
+BYTES_PER_TOKEN = 4
+DEFAULT_SNIPPET_CHARS = 160
+DEFAULT_BODY_CHARS = 2000
+
+
+def encode_cursor(after_id: str, offset: int) -> str:
+    """
+    Opaque cursor pointing just past the message `after_id` at position `offset`.
+    """
+    raw = json.dumps({"after": after_id, "offset": offset}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        return str(data["after"]), int(data["offset"])
+    except (ValueError, KeyError, TypeError) as error:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from error
+
+
+def truncate(text: str, limit: int) -> str:
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return text[:max(limit - 1, 0)].rstrip() + "…"
+
+
+def compact_size(record: EmailRecord) -> int:
+    """
+    Size in bytes of the record's compact JSON form, nulls dropped.
+    """
+    fields = {k: v for k, v in record._asdict().items() if v is not None}
+    return len(json.dumps(fields, separators=(",", ":"), ensure_ascii=False).encode()) + 1
+
+
+def page_start(records: Sequence[EmailRecord], cursor: Optional[str]) -> int:
+    """
+    Index of the first record after the cursor. Resumes after the same message
+    when it is still present, so new mail arriving between pages does not shift
+    the page; otherwise falls back to the stored offset.
+    """
+    if not cursor:
+        return 0
+    after_id, offset = decode_cursor(cursor)
+    if 0 < offset <= len(records) and records[offset - 1].id == after_id:
+        return offset
+    for index, record in enumerate(records):
+        if record.id == after_id:
+            return index + 1
+    return min(offset, len(records))
+
+
+def paginate(records: Sequence, cursor: Optional[str] = None,
+             max_bytes: Optional[int] = DEFAULT_MAX_BYTES, max_tokens: Optional[int] = None,
+             snippet_chars: int = DEFAULT_SNIPPET_CHARS,
+             body_chars: int = DEFAULT_BODY_CHARS,
+             extra_bytes: int = 0) -> Tuple[List[EmailRecord], Optional[str]]:
+    """
+    Cut the next page from `records` within a byte and/or token budget.
+
+    Snippets are truncated to `snippet_chars` and bodies to `body_chars`; lazy
+    bodies are decoded only for records that are considered for the page. A page always holds at least one
+    record so callers make progress. `extra_bytes` is counted per record for
+    fields the caller adds to each email. Returns the page and the cursor for
+    the following page (None on the last page).
+    """
+    budget = max_bytes
+    if max_tokens is not None:
+        token_bytes = max_tokens * BYTES_PER_TOKEN
+        budget = token_bytes if budget is None else min(budget, token_bytes)
+
+    start = page_start(records, cursor)
+    page: List[EmailRecord] = []
+    used = 0
+    for email in records[start:]:
+        # Pages are cut from EmailRecords; EmailPreviews are accepted too.
+        body = getattr(email, "body", None)
+        record = EmailRecord(email.id, email.thread_id, truncate(email.snippet, snippet_chars),
+                             email.from_, email.subject,
+                             history_id=getattr(email, "history_id", None),
+                             body=None if body is None else truncate(str(body), body_chars))
+        size = compact_size(record) + extra_bytes
+        if budget is not None and page and used + size > budget:
+            break
+        page.append(record)
+        used += size
+
+    end = start + len(page)
+    next_cursor = encode_cursor(page[-1].id, end) if page and end < len(records) else None
+    return page, next_cursor
@@ -0,0 +1,284 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from . import gmail_api
+from .model import EmailRecord
+from .store import MessageStore, get_store
+from .sync import RECENT_WINDOW_MS, sync_recent_emails
+
+PREFETCH_INTERVAL_ENV = "GMAIL_PREFETCH_INTERVAL"
+DEFAULT_PREFETCH_INTERVAL = 60.0
+# Pub/Sub topic for users.watch ("projects/<project>/topics/<topic>"). Without
+# one, registered accounts are only polled every interval.
+PUSH_TOPIC_ENV = "GMAIL_PUSH_TOPIC"
+# Gmail stops publishing 7 days after users.watch; renew a day before that.
+WATCH_RENEW_MS = 24 * 60 * 60 * 1000
+
+logger = logging.getLogger(__name__)
+
+# Called with the account after a background sync that changed its mailbox.
+_change_listeners: List[Callable[[str], None]] = []
+
+
+def add_change_listener(listener: Callable[[str], None]):
+    """
+    Call `listener(account)` whenever a worker sync applies new changes,
+    e.g. to drop responses cached from the old state.
+    """
+    _change_listeners.append(listener)
+
+
+@dataclass
+class Registration:
+    access_token: str
+    max_threads: int
+    # Monotonic time of the last successful sync.
+    synced_at: Optional[float] = None
+    # Bumped by push notifications; the sync that saw the latest one clears `pending`.
+    changes: int = 1
+    synced_changes: int = 0
+    watch_expires_ms: Optional[int] = None
+    # The last users.watch failure; the account is still polled meanwhile.
+    watch_error: Optional[str] = None
+    error: Optional[str] = None
+    # Monotonic time before which a failed account is not retried.
+    retry_at: float = 0.0
+
+    @property
+    def pending(self) -> bool:
+        return self.changes != self.synced_changes
+
+
+def parse_push(body: bytes) -> Tuple[str, Optional[str]]:
+    """
+    The account and historyId of a Pub/Sub push message from Gmail.
+    """
+    try:
+        envelope = json.loads(body)
+        data = json.loads(base64.b64decode(envelope["message"]["data"]))
+        history_id = data.get("historyId")
+        return data["emailAddress"], None if history_id is None else str(history_id)
+    except (ValueError, KeyError, TypeError) as error:
+        raise ValueError(f"Not a Gmail push notification: {error}") from error
+
+
+def push_envelope(account: str, history_id: str) -> bytes:
+    """
+    A Pub/Sub push body as Gmail would send it, for local stubs and tests.
+    """
+    data = json.dumps({"emailAddress": account, "historyId": history_id}).encode()
+    message = {"data": base64.b64encode(data).decode(), "messageId": history_id}
+    return json.dumps({"message": message, "subscription": "local"}).encode()
+
+
+class PrefetchWorker:
+    """
+    Keeps the message store synced for registered accounts in the background,
+    so fetch_recent_emails can answer them without calling Gmail.
+
+    Accounts are resynced every `interval` seconds and as soon as a push
+    notification for them arrives. With a Pub/Sub `topic`, users.watch is
+    called for each account and renewed before it expires.
+    """
+
+    def __init__(self, store: MessageStore, interval: float = DEFAULT_PREFETCH_INTERVAL,
+                 topic: Optional[str] = None,
+                 max_concurrency: int = gmail_api.MAX_CONCURRENT_ACCOUNTS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.store = store
+        self.interval = interval
+        self.topic = topic
+        self.clock = clock
+        self.accounts: Dict[str, Registration] = {}
+        self.syncs = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def register(self, access_token: str, max_threads: int) -> str:
+        """
+        Start keeping the account's `max_threads` most recent threads warm.
+        Returns the account's email address.
+        """
+        account = await gmail_api.get_account_async(access_token)
+        registration = self.accounts.get(account)
+        if registration is None:
+            self.accounts[account] = Registration(access_token, max_threads)
+        else:
+            self.update_token(account, access_token)
+            if max_threads > registration.max_threads:
+                registration.max_threads = max_threads
+                registration.changes += 1
+        self.start()
+        self._wake.set()
+        return account
+
+    def update_token(self, account: str, access_token: str):
+        """
+        Use a newer access token for the account, retrying it if the old one had failed.
+        """
+        registration = self.accounts.get(account)
+        if registration is not None and registration.access_token != access_token:
+            registration.access_token = access_token
+            if registration.error is not None:
+                registration.error = None
+                registration.retry_at = 0.0
+                self._wake.set()
+
+    def unregister(self, account: str):
+        self.accounts.pop(account, None)
+
+    def notify(self, account: str) -> bool:
+        """
+        Mark the account changed (e.g. from a push notification) and sync it now.
+        Returns False for accounts that are not registered.
+        """
+        registration = self.accounts.get(account)
+        if registration is None:
+            return False
+        registration.changes += 1
+        self._wake.set()
+        return True
+
+    def is_fresh(self, account: str, max_threads: int) -> bool:
+        """
+        Whether the store holds the account's `max_threads` most recent
+        threads, synced within the interval with no change notified since.
+        """
+        registration = self.accounts.get(account)
+        return (registration is not None and registration.error is None
+                and not registration.pending and registration.synced_at is not None
+                and max_threads <= registration.max_threads
+                and self.clock() - registration.synced_at <= self.interval)
+
+    async def recent_messages(self, access_token: str, account: str,
+                        max_threads: int) -> Optional[List[EmailRecord]]:
+        """
+        The account's recent messages from the store if it is fresh, else None.
+        """
+        self.update_token(account, access_token)
+        if not self.is_fresh(account, max_threads):
+            return None
+        since = int(time.time() * 1000) - RECENT_WINDOW_MS
+        return await self.store.recent_messages_async(account, since, max_threads)
+
+    def _due_in(self, registration: Registration) -> float:
+        if registration.error is not None:
+            return registration.retry_at - self.clock()
+        if registration.pending or registration.synced_at is None:
+            return 0.0
+        return registration.synced_at + self.interval - self.clock()
+
+    async def renew_watch(self, account: str, registration: Registration):
+        """
+        Call users.watch if the account has no watch or it expires soon. A
+        failure (e.g. a misconfigured topic) is logged and retried on the next
+        sync; polling goes on without push.
+        """
+        now_ms = int(time.time() * 1000)
+        if not self.topic or (registration.watch_expires_ms is not None
+                              and registration.watch_expires_ms - now_ms >= WATCH_RENEW_MS):
+            return
+        try:
+            watch = await gmail_api.watch_async(registration.access_token, self.topic)
+        except Exception as error:
+            registration.watch_error = str(error)
+            logger.warning(f"users.watch for {account} failed: {error}")
+            return
+        registration.watch_expires_ms = int(watch["expiration"])
+        registration.watch_error = None
+
+    async def sync_account(self, account: str, registration: Registration):
+        # A notification arriving mid-sync leaves the account pending for another pass.
+        changes = registration.changes
+        try:
+            async with self._semaphore:
+                await self.renew_watch(account, registration)
+                before = await self.store.get_sync_state_async(account)
+                await sync_recent_emails(registration.access_token, self.store,
+                                         max_threads=registration.max_threads)
+                after = await self.store.get_sync_state_async(account)
+        except Exception as error:
+            registration.error = str(error)
+            expired = isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 401
+            # An expired token is only retried once a tool call brings a new one.
+            registration.retry_at = float("inf") if expired else self.clock() + self.interval
+            logger.warning(f"Prefetch for {account} failed: {error}")
+            return
+        registration.error = None
+        registration.synced_changes = changes
+        registration.synced_at = self.clock()
+        self.syncs += 1
+        if before is None or after.history_id != before.history_id:
+            for listener in _change_listeners:
+                listener(account)
+
+    async def run(self):
+        while True:
+            self._wake.clear()
+            due = [(account, registration) for account, registration in list(self.accounts.items())
+                   if self._due_in(registration) <= 0]
+            await asyncio.gather(*(self.sync_account(account, registration)
+                                   for account, registration in due))
+            waits = [self._due_in(registration) for registration in self.accounts.values()]
+            timeout = max(min(waits, default=self.interval), 0.0)
+            try:
+                await asyncio.wait_for(self._wake.wait(), None if timeout == float("inf") else timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "accounts": len(self.accounts),
+            "syncs": self.syncs,
+            "failing": sorted(a for a, r in self.accounts.items() if r.error is not None),
+            "watch_failing": sorted(a for a, r in self.accounts.items() if r.watch_error is not None),
+        }
+
+
+_workers: Dict[Optional[MessageStore], Optional[PrefetchWorker]] = {}
+
+
+def get_prefetcher(store: Optional[MessageStore] = None) -> Optional[PrefetchWorker]:
+    """
+    The worker for `store` (default: the process-wide store), or None when
+    the message store is disabled.
+    """
+    store = store or get_store()
+    if store not in _workers:
+        _workers[store] = None if store is None else PrefetchWorker(
+            store,
+            interval=float(os.environ.get(PREFETCH_INTERVAL_ENV, DEFAULT_PREFETCH_INTERVAL)),
+            topic=os.environ.get(PUSH_TOPIC_ENV) or None,
+        )
+    return _workers[store]
+
+
+async def aclose_prefetchers():
+    """
+    Stop every background worker, when the server shuts down.
+    """
+    for worker in _workers.values():
+        if worker is not None:
+            await worker.aclose()
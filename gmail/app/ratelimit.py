@@ -0,0 +1,66 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+# Per-account request rate when fetching many accounts at once. Gmail allows
+# 250 quota units per user per second; a batch or list call costs 5-10 units.
+DEFAULT_REQUESTS_PER_SECOND = 10.0
+DEFAULT_BURST = 10
+
+
+class RateLimiter:
+    """
+    Async token bucket: `rate` tokens per second, holding at most `burst`.
+    """
+
+    def __init__(self, rate: float = DEFAULT_REQUESTS_PER_SECOND, burst: float = DEFAULT_BURST,
+                 clock: Callable[[], float] = time.monotonic):
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate and burst must be positive")
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self._updated = clock()
+        self.waited = 0.0
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, cost: float = 1.0):
+        """
+        Wait until `cost` tokens are available and take them.
+        """
+        # A request costing more than the bucket holds would otherwise wait forever.
+        cost = min(cost, self.burst)
+        while True:
+            self._refill()
+            if self.tokens >= cost:
+                self.tokens -= cost
+                return
+            delay = (cost - self.tokens) / self.rate
+            self.waited += delay
+            await asyncio.sleep(delay)
+
+
+# The limiter for the account the current task is fetching. Set around a fetch
+# so every Gmail request it makes, including those from tasks it spawns, is
+# throttled without threading the limiter through each call.
+current_limiter: ContextVar[Optional[RateLimiter]] = ContextVar("current_limiter", default=None)
+
+# access token -> limiter, so repeated calls for an account share one budget.
+_limiters: Dict[str, RateLimiter] = {}
+MAX_LIMITERS = 1024
+
+
+def get_limiter(access_token: str, rate: float = DEFAULT_REQUESTS_PER_SECOND,
+                burst: float = DEFAULT_BURST) -> RateLimiter:
+    limiter = _limiters.get(access_token)
+    if limiter is None or (limiter.rate, limiter.burst) != (rate, burst):
+        if len(_limiters) >= MAX_LIMITERS:
+            _limiters.clear()
+        limiter = _limiters[access_token] = RateLimiter(rate, burst)
+    return limiter
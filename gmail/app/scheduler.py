@@ -0,0 +1,184 @@
+import asyncio
+import email.utils
+import json
+import os
+import random
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from . import transport
+from .metrics import metrics
+from .ratelimit import RateLimiter
+
+# Quota units Gmail charges per method. A batch costs the sum of its parts.
+QUOTA_UNITS = {
+    "getProfile": 1,
+    "history.list": 2,
+    "threads.list": 10,
+    "threads.get": 10,
+    "watch": 100,
+}
+# Gmail's per-user limit is 250 units per second as a moving average, so short
+# bursts above it are tolerated. Set GMAIL_USER_QUOTA_PER_SECOND=0 to disable.
+USER_QUOTA_ENV = "GMAIL_USER_QUOTA_PER_SECOND"
+DEFAULT_USER_QUOTA_PER_SECOND = 250.0
+QUOTA_BURST_SECONDS = 10
+MAX_TRACKED_USERS = 1024
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Gmail also reports rate limiting as a 403 with one of these reasons.
+RATE_LIMIT_REASONS = frozenset({"rateLimitExceeded", "userRateLimitExceeded"})
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 5
+    base_delay: float = 0.5
+    max_delay: float = 32.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None,
+              rand: Callable[[], float] = random.random) -> float:
+        """
+        Full-jitter exponential backoff before retry number `attempt` (from 0),
+        never shorter than the server's Retry-After.
+        """
+        delay = rand() * min(self.max_delay, self.base_delay * 2 ** attempt)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header, given as seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+def is_retryable(status: int, body: bytes = b"") -> bool:
+    if status in RETRYABLE_STATUSES:
+        return True
+    if status != 403 or not body:
+        return False
+    try:
+        errors = json.loads(body)["error"]["errors"]
+    except (ValueError, KeyError, TypeError):
+        return False
+    return any(error.get("reason") in RATE_LIMIT_REASONS for error in errors)
+
+
+class Scheduler:
+    """
+    Sends Gmail requests within each user's quota and retries rate-limited
+    and transient failures with jittered exponential backoff.
+
+    Callers state what a request costs in quota units; the scheduler waits
+    until the user's budget covers it. Requests that still fail after
+    `policy.max_attempts` are returned to the caller unchanged.
+    """
+
+    def __init__(self, policy: RetryPolicy = RetryPolicy(),
+                 units_per_second: float = DEFAULT_USER_QUOTA_PER_SECOND,
+                 sleep: Callable[[float], Awaitable] = asyncio.sleep):
+        self.policy = policy
+        self.units_per_second = units_per_second
+        self.sleep = sleep
+        self._quotas: Dict[str, RateLimiter] = {}
+        self.units: Counter = Counter()
+        self.retries = 0
+
+    def _quota(self, access_token: str) -> Optional[RateLimiter]:
+        if self.units_per_second <= 0:
+            return None
+        if access_token not in self._quotas:
+            if len(self._quotas) >= MAX_TRACKED_USERS:
+                self._quotas.clear()
+            self._quotas[access_token] = RateLimiter(
+                self.units_per_second, self.units_per_second * QUOTA_BURST_SECONDS
+            )
+        return self._quotas[access_token]
+
+    async def charge(self, access_token: str, units: int):
+        """
+        Wait until the user's quota covers `units`, then record them as spent.
+        """
+        quota = self._quota(access_token)
+        if quota is not None:
+            with metrics.stage("quota_wait"):
+                await quota.acquire(units)
+        if access_token not in self.units and len(self.units) >= MAX_TRACKED_USERS:
+            self.units.clear()
+        self.units[access_token] += units
+
+    async def backoff(self, attempt: int, retry_after: Optional[float] = None):
+        self.retries += 1
+        await self.sleep(self.policy.delay(attempt, retry_after))
+
+    async def request(self, access_token: str, method: str, url: str, units: int,
+                      **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            await self.charge(access_token, units)
+            response = await transport.get_transport().request(method, url, **kwargs)
+            if response.status_code >= 400:
+                metrics.inc("api_errors", status=response.status_code, scope="request")
+            if attempt + 1 >= self.policy.max_attempts or not is_retryable(
+                    response.status_code, response.content):
+                return response
+            await self.backoff(attempt, parse_retry_after(response.headers.get("Retry-After")))
+            attempt += 1
+
+    @asynccontextmanager
+    async def stream(self, access_token: str, method: str, url: str, units: int,
+                     **kwargs) -> AsyncIterator[httpx.Response]:
+        """
+        Like `request`, but the body of the final response is read by the caller.
+        """
+        attempt = 0
+        while True:
+            await self.charge(access_token, units)
+            async with transport.get_transport().stream(method, url, **kwargs) as response:
+                if response.status_code >= 400:
+                    metrics.inc("api_errors", status=response.status_code, scope="request")
+                if attempt + 1 >= self.policy.max_attempts or response.status_code not in (
+                        RETRYABLE_STATUSES | {403}):
+                    yield response
+                    return
+                body = await response.aread()
+                if not is_retryable(response.status_code, body):
+                    yield response
+                    return
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            await self.backoff(attempt, retry_after)
+            attempt += 1
+
+    def stats(self) -> Dict:
+        return {"retries": self.retries, "quota_units": sum(self.units.values())}
+
+
+_schedulers: Dict[str, Scheduler] = {}
+
+
+def get_scheduler() -> Scheduler:
+    """
+    The process-wide scheduler, with the per-user quota from GMAIL_USER_QUOTA_PER_SECOND.
+    """
+    quota = os.environ.get(USER_QUOTA_ENV, str(DEFAULT_USER_QUOTA_PER_SECOND))
+    if quota not in _schedulers:
+        _schedulers[quota] = Scheduler(units_per_second=float(quota))
+    return _schedulers[quota]
@@ -0,0 +1,135 @@
+import math
+import os
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from . import gmail_api
+from .model import EmailRecord
+from .store import MessageStore, SearchQuery
+from .sync import RECENT_WINDOW_MS, full_sync, message_rows, refresh, synced_within
+
+DAY_MS = 24 * 60 * 60 * 1000
+DEFAULT_SEARCH_DAYS = 30
+# Searches reaching further back than this go to Gmail instead of filling the
+# local index with the whole range.
+MAX_BACKFILL_DAYS = 90
+DEFAULT_MAX_RESULTS = 50
+# Searches within this many seconds of the account's last sync skip the
+# history check and are answered from the index alone. Push notifications
+# end the window early.
+FRESHNESS_ENV = "GMAIL_SEARCH_FRESHNESS"
+DEFAULT_FRESHNESS = 30.0
+
+
+def parse_date(value: Optional[str]) -> Optional[int]:
+    """
+    Milliseconds since the epoch for an ISO date or datetime (UTC if no zone is given).
+    """
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError as error:
+        raise ValueError(f"Invalid date {value!r}, expected YYYY-MM-DD") from error
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def gmail_query(query: SearchQuery) -> str:
+    """
+    The Gmail search (`q`) equivalent of `query`.
+    """
+    terms = []
+    if query.sender:
+        terms.append(f'from:"{query.sender}"')
+    if query.subject:
+        terms.append(f'subject:"{query.subject}"')
+    if query.text:
+        terms.append(query.text)
+    if query.since_ms is not None:
+        terms.append(f"after:{query.since_ms // 1000}")
+    if query.until_ms is not None:
+        terms.append(f"before:{math.ceil(query.until_ms / 1000)}")
+    return " ".join(terms)
+
+
+def matches(record: EmailRecord, query: SearchQuery) -> bool:
+    """
+    Whether a message of a matching thread matches the sender, subject and date
+    filters itself. Text terms may match the body, so they are not rechecked.
+    """
+    if query.sender and query.sender.lower() not in (record.from_ or "").lower():
+        return False
+    if query.subject and query.subject.lower() not in (record.subject or "").lower():
+        return False
+    if query.since_ms is not None and (record.internal_date or 0) < query.since_ms:
+        return False
+    if query.until_ms is not None and (record.internal_date or 0) >= query.until_ms:
+        return False
+    return True
+
+
+async def search_gmail(access_token: str, query: SearchQuery, limit: int,
+                       store: Optional[MessageStore] = None,
+                       account: Optional[str] = None) -> List[EmailRecord]:
+    """
+    Answer `query` with a Gmail search. Fetched messages are added to `store`
+    so later searches can find them locally.
+    """
+    listed = await gmail_api.get_recent_thread_ids_async(access_token, limit,
+                                                         query=gmail_query(query))
+    threads = await gmail_api.get_threads_async(access_token, [t["id"] for t in listed])
+    rows = message_rows(threads)
+    if store is not None:
+        await store.add_messages_async(account, rows)
+    records = [EmailRecord(row.id, row.thread_id, row.snippet, row.from_, row.subject,
+                           row.internal_date, row.history_id) for row in rows]
+    records = [record for record in records if matches(record, query)]
+    records.sort(key=lambda record: -(record.internal_date or 0))
+    return records[:limit]
+
+
+async def backfill(access_token: str, store: MessageStore, account: str, since_ms: int):
+    """
+    Cache every thread with mail since `since_ms`, making that range searchable locally.
+    """
+    listed = await gmail_api.get_recent_thread_ids_async(access_token, None,
+                                                         query=f"after:{since_ms // 1000}")
+    threads = await gmail_api.get_threads_async(access_token, [t["id"] for t in listed])
+    await store.add_messages_async(account, message_rows(threads), indexed_since=since_ms)
+
+
+async def search_emails(access_token: str, store: Optional[MessageStore], query: SearchQuery,
+                        limit: int = DEFAULT_MAX_RESULTS) -> Tuple[List[EmailRecord], str]:
+    """
+    Search messages, newest first. Returns the results and where they came
+    from: "index" or "gmail".
+
+    The cache is brought up to date through Gmail history first, unless it
+    was synced within the freshness window. Ranges it does not fully cover
+    yet are backfilled once, after which repeated searches are local queries.
+    Searches without a start date, or reaching back further than
+    MAX_BACKFILL_DAYS, are sent to Gmail.
+    """
+    if store is None:
+        return await search_gmail(access_token, query, limit), "gmail"
+
+    account = await gmail_api.get_account_async(access_token)
+    state = await store.get_sync_state_async(account)
+    freshness = float(os.environ.get(FRESHNESS_ENV, DEFAULT_FRESHNESS))
+    if state is None:
+        await full_sync(access_token, store, account, None)
+    elif not synced_within(store, account, freshness):
+        await refresh(access_token, store, account, state)
+
+    now = int(time.time() * 1000)
+    if query.since_ms is None or query.since_ms < now - MAX_BACKFILL_DAYS * DAY_MS:
+        return await search_gmail(access_token, query, limit, store, account), "gmail"
+
+    state = await store.get_sync_state_async(account)
+    if state.indexed_since is None or query.since_ms < state.indexed_since:
+        await backfill(access_token, store, account,
+                       min(query.since_ms, now - RECENT_WINDOW_MS))
+    return await store.search_async(account, query, limit), "index"
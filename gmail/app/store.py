@@ -0,0 +1,488 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .model import EmailRecord
+
+# Where the message cache lives. "sqlite:///path.db" or "postgresql://..."; set to
+# an empty string to disable caching.
+CACHE_URL_ENV = "GMAIL_CACHE_URL"
+DEFAULT_CACHE_URL = "sqlite:///gmail_cache.db"
+# Connections the Postgres backend keeps open.
+DEFAULT_POOL_SIZE = 4
+# Messages with these labels are hidden from threads.list, so keep them out of the cache too.
+HIDDEN_LABELS = {"TRASH", "SPAM"}
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS sync_state (
+        account TEXT PRIMARY KEY,
+        history_id TEXT NOT NULL,
+        depth BIGINT,
+        indexed_since BIGINT,
+        updated_at DOUBLE PRECISION NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        account TEXT NOT NULL,
+        id TEXT NOT NULL,
+        thread_id TEXT NOT NULL,
+        internal_date BIGINT NOT NULL,
+        from_ TEXT,
+        subject TEXT,
+        snippet TEXT NOT NULL,
+        history_id TEXT,
+        PRIMARY KEY (account, id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS messages_by_date ON messages (account, internal_date)",
+    "CREATE INDEX IF NOT EXISTS messages_by_thread ON messages (account, thread_id)",
+]
+
+# In SQLite, messages gets an explicit integer key for the FTS index to use as
+# its content rowid: the implicit rowids of a table with another primary key
+# can be renumbered by VACUUM, which would silently desync the index.
+SQLITE_SCHEMA = [SCHEMA[0], """
+    CREATE TABLE IF NOT EXISTS messages (
+        pk INTEGER PRIMARY KEY,
+        account TEXT NOT NULL,
+        id TEXT NOT NULL,
+        thread_id TEXT NOT NULL,
+        internal_date BIGINT NOT NULL,
+        from_ TEXT,
+        subject TEXT,
+        snippet TEXT NOT NULL,
+        history_id TEXT,
+        UNIQUE (account, id)
+    )
+    """, *SCHEMA[2:]]
+MESSAGE_COLUMNS = "account, id, thread_id, internal_date, from_, subject, snippet, history_id"
+
+
+# Columns added after the first release, created on open for older databases.
+MIGRATIONS = [
+    ("sync_state", "indexed_since", "BIGINT"),
+    ("messages", "history_id", "TEXT"),
+]
+
+# FTS5 index over the searchable columns, kept in step with `messages` by triggers.
+FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE messages_fts USING fts5("
+    "from_, subject, snippet, content='messages', content_rowid='pk')",
+    "CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts (rowid, from_, subject, snippet) "
+    "VALUES (new.pk, new.from_, new.subject, new.snippet); END",
+    "CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts (messages_fts, rowid, from_, subject, snippet) "
+    "VALUES ('delete', old.pk, old.from_, old.subject, old.snippet); END",
+    "CREATE TRIGGER messages_fts_update AFTER UPDATE ON messages BEGIN "
+    "INSERT INTO messages_fts (messages_fts, rowid, from_, subject, snippet) "
+    "VALUES ('delete', old.pk, old.from_, old.subject, old.snippet); "
+    "INSERT INTO messages_fts (rowid, from_, subject, snippet) "
+    "VALUES (new.pk, new.from_, new.subject, new.snippet); END",
+    # Index whatever was cached before the index existed.
+    "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+]
+
+
+class SyncState(NamedTuple):
+    history_id: str
+    # How many recent threads the last full sync covered; None means all of them.
+    depth: Optional[int]
+    # Every message since this time (ms) is cached, so searches within it can
+    # be answered locally. None when only the most recent threads are cached.
+    indexed_since: Optional[int] = None
+
+
+class SearchQuery(NamedTuple):
+    text: Optional[str] = None
+    sender: Optional[str] = None
+    subject: Optional[str] = None
+    since_ms: Optional[int] = None
+    until_ms: Optional[int] = None
+
+
+class MessageRow(NamedTuple):
+    id: str
+    thread_id: str
+    internal_date: int
+    from_: Optional[str]
+    subject: Optional[str]
+    snippet: str
+    # The thread's historyId when the message was synced.
+    history_id: Optional[str] = None
+
+
+class MessageStore:
+    """
+    Persistent cache of message previews per account, plus the Gmail historyId
+    the cache is synced to.
+
+    Queries are written with `?` placeholders; backends whose driver uses a
+    different paramstyle override `_sql`. Every public method runs in one
+    transaction, rolled back if any statement fails. The `*_async` variants
+    are for the event loop; backends whose driver blocks on the network
+    override `_run` to call them off it.
+    """
+
+    schema = SCHEMA
+
+    def __init__(self):
+        # The connection of the transaction in progress, per thread.
+        self._local = threading.local()
+        with self._transaction():
+            for statement in self.schema:
+                self._execute(statement)
+        for table, column, kind in MIGRATIONS:
+            self._add_column(table, column, kind)
+
+    def _connect(self):
+        """
+        A context manager providing the connection for one transaction.
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Commit the statements run inside the block, or roll them all back if
+        one fails, so a failed statement never leaves the connection unusable.
+        Nested blocks join the outer transaction.
+        """
+        if getattr(self._local, "connection", None) is not None:
+            yield
+            return
+        with self._connect() as connection:
+            self._local.connection = connection
+            try:
+                yield
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+            finally:
+                self._local.connection = None
+
+    async def _run(self, method, *args, **kwargs):
+        return method(*args, **kwargs)
+
+    def _add_column(self, table: str, column: str, kind: str):
+        try:
+            with self._transaction():
+                self._execute(f"SELECT {column} FROM {table} WHERE 1 = 0")
+        except Exception:
+            with self._transaction():
+                self._execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+
+    def _sql(self, query: str) -> str:
+        return query
+
+    def _execute(self, query: str, params: Tuple = ()):
+        cursor = self._local.connection.cursor()
+        cursor.execute(self._sql(query), params)
+        return cursor
+
+    def _executemany(self, query: str, rows: Iterable[Tuple]):
+        cursor = self._local.connection.cursor()
+        cursor.executemany(self._sql(query), list(rows))
+        return cursor
+
+    def get_sync_state(self, account: str) -> Optional[SyncState]:
+        with self._transaction():
+            row = self._execute(
+                "SELECT history_id, depth, indexed_since FROM sync_state WHERE account = ?", (account,)
+            ).fetchone()
+        return SyncState(*row) if row else None
+
+    def set_sync_state(self, account: str, history_id: str, depth: Optional[int],
+                       indexed_since: Optional[int] = None):
+        with self._transaction():
+            self._execute(
+                "INSERT INTO sync_state (account, history_id, depth, indexed_since, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (account) DO UPDATE SET history_id = excluded.history_id, "
+                "depth = excluded.depth, indexed_since = excluded.indexed_since, "
+                "updated_at = excluded.updated_at",
+                (account, history_id, depth, indexed_since, time.time()),
+            )
+
+    def replace_all(self, account: str, rows: List[MessageRow], history_id: str,
+                    depth: Optional[int], indexed_since: Optional[int] = None):
+        """
+        Replace everything cached for `account` after a full sync.
+        """
+        with self._transaction():
+            self._execute("DELETE FROM messages WHERE account = ?", (account,))
+            self._insert(account, rows)
+            self.set_sync_state(account, history_id, depth, indexed_since)
+
+    def add_messages(self, account: str, rows: List[MessageRow],
+                     indexed_since: Optional[int] = None):
+        """
+        Cache `rows` alongside what is already stored, e.g. after a backfill or
+        a search answered by Gmail. `indexed_since` extends the range known to
+        be complete; the sync position is left alone.
+        """
+        with self._transaction():
+            self._insert(account, rows)
+            state = self.get_sync_state(account)
+            if state is not None and indexed_since is not None:
+                if state.indexed_since is None or indexed_since < state.indexed_since:
+                    # Callers only extend the range back past the recent window, so
+                    # every recent thread is cached too (depth None).
+                    self.set_sync_state(account, state.history_id, None, indexed_since)
+
+    def apply_changes(self, account: str, thread_ids: Iterable[str], rows: List[MessageRow],
+                      deleted_ids: Iterable[str], history_id: str):
+        """
+        Replace the cached messages of the changed threads with `rows`, drop
+        deleted messages, and advance the account's historyId.
+        """
+        with self._transaction():
+            self._executemany(
+                "DELETE FROM messages WHERE account = ? AND thread_id = ?",
+                ((account, thread_id) for thread_id in thread_ids),
+            )
+            self._executemany(
+                "DELETE FROM messages WHERE account = ? AND id = ?",
+                ((account, message_id) for message_id in deleted_ids),
+            )
+            self._insert(account, rows)
+            state = self.get_sync_state(account)
+            if state is None:
+                self.set_sync_state(account, history_id, None)
+            else:
+                self.set_sync_state(account, history_id, state.depth, state.indexed_since)
+
+    def _insert(self, account: str, rows: List[MessageRow]):
+        self._executemany(
+            "INSERT INTO messages (account, id, thread_id, internal_date, from_, subject, snippet, "
+            "history_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (account, id) DO UPDATE SET thread_id = excluded.thread_id, "
+            "internal_date = excluded.internal_date, from_ = excluded.from_, "
+            "subject = excluded.subject, snippet = excluded.snippet, "
+            "history_id = excluded.history_id",
+            ((account, *row) for row in rows),
+        )
+
+    def recent_messages(self, account: str, since_ms: int,
+                        max_threads: Optional[int] = None) -> List[EmailRecord]:
+        """
+        Every message of the `max_threads` most recently active threads with
+        mail since `since_ms`, newest thread first. Older messages of those
+        threads are included, as a direct fetch of the same threads returns them.
+        """
+        limit = "" if max_threads is None else f"LIMIT {int(max_threads)}"
+        with self._transaction():
+            rows = self._execute(
+                "WITH recent AS ("
+                "  SELECT thread_id, MAX(internal_date) AS last_date FROM messages"
+                "  WHERE account = ? AND internal_date >= ?"
+                f"  GROUP BY thread_id ORDER BY last_date DESC {limit}"
+                ") "
+                "SELECT m.id, m.thread_id, m.snippet, m.from_, m.subject, m.internal_date, m.history_id "
+                "FROM messages m "
+                "JOIN recent r ON r.thread_id = m.thread_id "
+                "WHERE m.account = ? "
+                "ORDER BY r.last_date DESC, m.internal_date ASC",
+                (account, since_ms, account),
+            ).fetchall()
+        return [EmailRecord(*row) for row in rows]
+
+    def search(self, account: str, query: SearchQuery, limit: int = 50) -> List[EmailRecord]:
+        """
+        Cached messages matching `query`, newest first. Text terms match
+        anywhere in the sender, subject or snippet.
+        """
+        where = ["account = ?"]
+        params: List = [account]
+        for column, value in (("from_", query.sender), ("subject", query.subject)):
+            if value:
+                where.append(f"LOWER({column}) LIKE ?")
+                params.append(f"%{value.lower()}%")
+        for term in (query.text or "").split():
+            where.append("(LOWER(from_) LIKE ? OR LOWER(subject) LIKE ? OR LOWER(snippet) LIKE ?)")
+            params += [f"%{term.lower()}%"] * 3
+        return self._search(where, params, query, limit)
+
+    def _search(self, where: List[str], params: List, query: SearchQuery,
+                limit: int) -> List[EmailRecord]:
+        if query.since_ms is not None:
+            where.append("internal_date >= ?")
+            params.append(query.since_ms)
+        if query.until_ms is not None:
+            where.append("internal_date < ?")
+            params.append(query.until_ms)
+        with self._transaction():
+            rows = self._execute(
+                "SELECT id, thread_id, snippet, from_, subject, internal_date, history_id FROM messages "
+                f"WHERE {' AND '.join(where)} ORDER BY internal_date DESC LIMIT {int(limit)}",
+                tuple(params),
+            ).fetchall()
+        return [EmailRecord(*row) for row in rows]
+
+    async def get_sync_state_async(self, account: str) -> Optional[SyncState]:
+        return await self._run(self.get_sync_state, account)
+
+    async def replace_all_async(self, *args, **kwargs):
+        return await self._run(self.replace_all, *args, **kwargs)
+
+    async def add_messages_async(self, *args, **kwargs):
+        return await self._run(self.add_messages, *args, **kwargs)
+
+    async def apply_changes_async(self, *args, **kwargs):
+        return await self._run(self.apply_changes, *args, **kwargs)
+
+    async def recent_messages_async(self, *args, **kwargs) -> List[EmailRecord]:
+        return await self._run(self.recent_messages, *args, **kwargs)
+
+    async def search_async(self, *args, **kwargs) -> List[EmailRecord]:
+        return await self._run(self.search, *args, **kwargs)
+
+    def close(self):
+        raise NotImplementedError
+
+
+class SQLiteMessageStore(MessageStore):
+    """
+    SQLite backend. Searches use an FTS5 index when SQLite was built with it.
+    """
+
+    schema = SQLITE_SCHEMA
+
+    def __init__(self, path: str):
+        # Local and quick, so it is queried on the event loop (the default `_run`).
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        super().__init__()
+        self._add_message_key()
+        self.fts = self._create_fts()
+
+    def _connect(self):
+        return nullcontext(self.connection)
+
+    def close(self):
+        self.connection.close()
+
+    def _add_message_key(self):
+        """
+        Rebuild a messages table from before the explicit `pk` key, along with
+        its indexes; _create_fts then reindexes it.
+        """
+        with self._transaction():
+            columns = [row[1] for row in self._execute("PRAGMA table_info(messages)")]
+            if "pk" in columns:
+                return
+            for trigger in ("insert", "delete", "update"):
+                self._execute(f"DROP TRIGGER IF EXISTS messages_fts_{trigger}")
+            self._execute("DROP TABLE IF EXISTS messages_fts")
+            self._execute("ALTER TABLE messages RENAME TO messages_old")
+            for statement in self.schema:
+                self._execute(statement)
+            self._execute(f"INSERT INTO messages ({MESSAGE_COLUMNS}) SELECT {MESSAGE_COLUMNS} FROM messages_old")
+            self._execute("DROP TABLE messages_old")
+            # The old indexes kept their names until the old table was dropped.
+            for statement in self.schema:
+                self._execute(statement)
+
+    def _create_fts(self) -> bool:
+        with self._transaction():
+            exists = self._execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+            ).fetchone()
+        if exists:
+            return True
+        try:
+            with self._transaction():
+                for statement in FTS_SCHEMA:
+                    self._execute(statement)
+        except sqlite3.OperationalError:
+            # No FTS5 in this SQLite build; search falls back to LIKE.
+            return False
+        return True
+
+    def search(self, account: str, query: SearchQuery, limit: int = 50) -> List[EmailRecord]:
+        terms = [f"from_ : {fts_phrase(query.sender)}*" if query.sender else None,
+                 f"subject : {fts_phrase(query.subject)}*" if query.subject else None]
+        terms += [f"{fts_phrase(word)}*" for word in (query.text or "").split()]
+        terms = [term for term in terms if term]
+        if not self.fts or not terms:
+            return super().search(account, query, limit)
+        where = ["account = ?",
+                 "pk IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)"]
+        return self._search(where, [account, " AND ".join(terms)], query, limit)
+
+
+def fts_phrase(text: str) -> str:
+    """
+    Quote `text` as an FTS5 phrase so user input cannot inject query syntax.
+    """
+    return '"' + text.replace('"', '""') + '"'
+
+
+class PostgresMessageStore(MessageStore):
+    """
+    Postgres backend for the docker-compose database. Requires `psycopg` and
+    `psycopg_pool`.
+
+    Each transaction takes a connection from a pool and runs in a worker
+    thread, so queries neither block the event loop nor wait on each other.
+    """
+
+    def __init__(self, dsn: str, pool_size: int = DEFAULT_POOL_SIZE):
+        try:
+            from psycopg_pool import ConnectionPool
+        except ImportError as error:
+            raise ImportError(
+                "PostgresMessageStore requires psycopg_pool: pip install 'psycopg[binary,pool]'"
+            ) from error
+        self.pool = ConnectionPool(dsn, min_size=1, max_size=pool_size, open=True)
+        super().__init__()
+
+    def _connect(self):
+        return self.pool.connection()
+
+    async def _run(self, method, *args, **kwargs):
+        # psycopg's blocking API; keep the event loop free while it queries.
+        return await asyncio.to_thread(method, *args, **kwargs)
+
+    def _sql(self, query: str) -> str:
+        return query.replace("?", "%s")
+
+    def close(self):
+        self.pool.close()
+
+
+def open_store(url: str) -> Optional[MessageStore]:
+    """
+    Open a store from a cache URL, or return None when caching is disabled.
+    """
+    if not url:
+        return None
+    scheme = urlsplit(url).scheme
+    if scheme == "sqlite":
+        path = url[len("sqlite:///"):] or ":memory:"
+        return SQLiteMessageStore(path)
+    if scheme in ("postgres", "postgresql"):
+        return PostgresMessageStore(url)
+    raise ValueError(f"Unsupported cache URL: {url!r}")
+
+
+_stores: Dict[str, Optional[MessageStore]] = {}
+
+
+def get_store() -> Optional[MessageStore]:
+    """
+    The process-wide store configured by GMAIL_CACHE_URL, opened on first use.
+    """
+    url = os.environ.get(CACHE_URL_ENV, DEFAULT_CACHE_URL)
+    if url not in _stores:
+        _stores[url] = open_store(url)
+    return _stores[url]
@@ -0,0 +1,196 @@
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from . import gmail_api
+from .archive import ARCHIVE_URL_ENV, get_archive
+from .model import EmailRecord
+from .scheduler import QUOTA_UNITS, get_scheduler
+from .store import HIDDEN_LABELS, MessageRow, MessageStore, SyncState
+
+RECENT_WINDOW_MS = 24 * 60 * 60 * 1000
+HISTORY_TYPES = ("messagesAdded", "messagesDeleted", "labelsAdded", "labelsRemoved")
+
+logger = logging.getLogger(__name__)
+
+# Monotonic time each account was last brought up to date, per store.
+_synced_at: Dict[Tuple[MessageStore, str], float] = {}
+
+
+def synced_within(store: MessageStore, account: str, seconds: float) -> bool:
+    """
+    Whether the account was synced into `store` in the last `seconds`, with no
+    change notified since.
+    """
+    synced_at = _synced_at.get((store, account))
+    return synced_at is not None and time.monotonic() - synced_at <= seconds
+
+
+def mark_stale(account: str):
+    """
+    Forget when the account was synced, e.g. after a push notification, so
+    the next caller reads its history.
+    """
+    for key in [key for key in _synced_at if key[1] == account]:
+        del _synced_at[key]
+
+
+class HistoryExpired(Exception):
+    """
+    The stored historyId is too old for users.history.list; a full sync is needed.
+    """
+
+
+async def list_history_async(access_token: str, start_history_id: str) -> Tuple[Set[str], Set[str], str]:
+    """
+    Read users.history.list from `start_history_id`.
+
+    Returns the IDs of threads that changed, the IDs of deleted messages, and
+    the mailbox's current historyId.
+    """
+    url = f"{gmail_api.BASE_URL}/users/me/history"
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    changed_threads: Set[str] = set()
+    deleted_messages: Set[str] = set()
+    history_id = start_history_id
+    page_token = None
+    while True:
+        params = {"startHistoryId": start_history_id, "maxResults": gmail_api.MAX_PAGE_SIZE}
+        if page_token:
+            params["pageToken"] = page_token
+
+        response = await get_scheduler().request(access_token, "GET", url,
+                                                 QUOTA_UNITS["history.list"],
+                                                 headers=headers, params=params)
+        if response.status_code == 404:
+            raise HistoryExpired(start_history_id)
+        response.raise_for_status()
+
+        data = response.json()
+        for record in data.get("history", []):
+            for kind in HISTORY_TYPES:
+                for item in record.get(kind, []):
+                    message = item["message"]
+                    changed_threads.add(message["threadId"])
+                    if kind == "messagesDeleted":
+                        deleted_messages.add(message["id"])
+        history_id = data.get("historyId", history_id)
+
+        page_token = data.get("nextPageToken")
+        if not page_token:
+            return changed_threads, deleted_messages, history_id
+
+
+def message_rows(threads: List[Dict]) -> List[MessageRow]:
+    """
+    Flatten raw threads into store rows, skipping trashed and spam messages.
+    """
+    rows = []
+    for thread in threads:
+        for message in thread.get("messages", []):
+            if HIDDEN_LABELS.intersection(message.get("labelIds", [])):
+                continue
+            from_email, subject = gmail_api.extract_from_and_subject(message)
+            rows.append(MessageRow(
+                id=message["id"],
+                thread_id=message["threadId"],
+                internal_date=int(message.get("internalDate", 0)),
+                from_=from_email,
+                subject=subject,
+                snippet=message["snippet"],
+                history_id=thread.get("historyId"),
+            ))
+    return rows
+
+
+def sync_fetch_mode() -> str:
+    """
+    Threads.get format for syncs: the archive stores every header, so fetch
+    them all when one is configured.
+    """
+    return "headers" if os.environ.get(ARCHIVE_URL_ENV) else "metadata"
+
+
+async def archive_threads(account: str, threads: List[Dict], deleted_ids: Iterable[str] = ()):
+    """
+    Persist fetched threads to the Postgres archive, if one is configured.
+    The cache is already updated, so a failing archive is logged, not raised.
+    """
+    try:
+        # Opening the archive fails too when psycopg is missing or the URL is bad.
+        archive = get_archive()
+        if archive is None:
+            return
+        await archive.ingest_async(account, threads, deleted_ids)
+    except Exception as error:
+        logger.warning(f"Archiving {len(threads)} threads for {account} failed: {error}")
+
+
+async def full_sync(access_token: str, store: MessageStore, account: str,
+                    max_threads: Optional[int]):
+    # Take the historyId before listing so changes made while we fetch are
+    # picked up by the next incremental sync.
+    history_id = (await gmail_api.get_profile_async(access_token))["historyId"]
+    window_start = int(time.time() * 1000) - RECENT_WINDOW_MS
+    listed = await gmail_api.get_recent_thread_ids_async(access_token, max_threads)
+    threads = await gmail_api.get_threads_async(access_token, [t["id"] for t in listed],
+                                                fetch_mode=sync_fetch_mode())
+    # Only a sync of every recent thread makes the window searchable locally.
+    indexed_since = window_start if max_threads is None else None
+    await store.replace_all_async(account, message_rows(threads), history_id, max_threads, indexed_since)
+    _synced_at[(store, account)] = time.monotonic()
+    await archive_threads(account, threads)
+
+
+async def incremental_sync(access_token: str, store: MessageStore, account: str,
+                           history_id: str) -> int:
+    """
+    Apply changes since `history_id`. Returns the number of threads refetched.
+    """
+    changed, deleted, latest = await list_history_async(access_token, history_id)
+    if latest == history_id and not changed:
+        return 0
+    threads = await gmail_api.get_threads_async(access_token, sorted(changed),
+                                                fetch_mode=sync_fetch_mode()) if changed else []
+    await store.apply_changes_async(account, changed, message_rows(threads), deleted, latest)
+    await archive_threads(account, threads, deleted)
+    return len(changed)
+
+
+async def refresh(access_token: str, store: MessageStore, account: str, state: SyncState):
+    """
+    Apply changes since the last sync, resyncing from scratch if the history
+    is too old to replay.
+    """
+    try:
+        await incremental_sync(access_token, store, account, state.history_id)
+        _synced_at[(store, account)] = time.monotonic()
+    except HistoryExpired:
+        await full_sync(access_token, store, account, state.depth)
+
+
+async def sync_recent_emails(access_token: str, store: MessageStore,
+                             max_threads: Optional[int] = 30) -> List[EmailRecord]:
+    """
+    Bring the cache up to date and answer from it.
+
+    The first call for an account (or one asking for more threads than were
+    synced) does a full sync. Later calls read users.history.list and refetch
+    only the threads that changed; when nothing changed this is a single small
+    request plus a local query.
+    """
+    account = await gmail_api.get_account_async(access_token)
+    state = await store.get_sync_state_async(account)
+
+    covered = state is not None and (
+        state.depth is None or (max_threads is not None and max_threads <= state.depth)
+    )
+    if not covered:
+        await full_sync(access_token, store, account, max_threads)
+    else:
+        await refresh(access_token, store, account, state)
+
+    since = int(time.time() * 1000) - RECENT_WINDOW_MS
+    return await store.recent_messages_async(account, since, max_threads)
@@ -6,4 +6,24 @@ AVAILABLE_TOOLS = [
         description="Fetch the emails recieved in the last 24 hours from the user's inbox.",
         requires_auth=True
     ),
+    Tool(
+        name="fetch_recent_emails_many",
+        description="Fetch the recent emails from several inboxes at once, merged newest first.",
+        requires_auth=True
+    ),
+    Tool(
+        name="search_emails",
+        description="Search the user's emails by keywords, sender, subject and date.",
+        requires_auth=True
+    ),
+    Tool(
+        name="prefetch_recent_emails",
+        description="Keep the user's recent emails synced in the background for instant answers.",
+        requires_auth=True
+    ),
+    Tool(
+        name="server_stats",
+        description="Report cache hit/miss counters for monitoring the server.",
+        requires_auth=False
+    ),
 ]
\ No newline at end of file
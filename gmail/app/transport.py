@@ -0,0 +1,114 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from .ratelimit import current_limiter
+
+# Pool sizing for the shared client. Gmail is served from a single host, so the
+# per-host cap is what actually bounds concurrency against the API.
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+MAX_CONNECTIONS_PER_HOST = 20
+KEEPALIVE_EXPIRY = 30.0
+TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+
+def http2_available() -> bool:
+    """
+    HTTP/2 needs the optional `h2` package; fall back to HTTP/1.1 keep-alive without it.
+    """
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class AsyncTransport:
+    """
+    A pooled httpx.AsyncClient plus per-host concurrency limits.
+
+    httpx clients and asyncio primitives are bound to the event loop they were
+    first used on, so one transport is kept per running loop.
+    """
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None,
+                 max_per_host: int = MAX_CONNECTIONS_PER_HOST):
+        self.client = client or httpx.AsyncClient(
+            http2=http2_available(),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            timeout=TIMEOUT,
+        )
+        self.max_per_host = max_per_host
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_limits[host]
+
+    async def _throttle(self):
+        limiter = current_limiter.get()
+        if limiter is not None:
+            await limiter.acquire()
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        await self._throttle()
+        async with self._host_limit(url):
+            return await self.client.request(method, url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """
+        Like `request`, but the body is read incrementally by the caller.
+        The host slot is held until the body has been consumed.
+        """
+        await self._throttle()
+        async with self._host_limit(url):
+            async with self.client.stream(method, url, **kwargs) as response:
+                yield response
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_transports: Dict[asyncio.AbstractEventLoop, AsyncTransport] = {}
+
+
+def get_transport() -> AsyncTransport:
+    """
+    Return the shared transport for the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    for other in [l for l in _transports if l.is_closed()]:
+        del _transports[other]
+
+    transport = _transports.get(loop)
+    if transport is None or transport.client.is_closed:
+        transport = AsyncTransport()
+        _transports[loop] = transport
+    return transport
+
+
+def set_transport(transport: AsyncTransport):
+    """
+    Install a transport for the running event loop (used by tests and benchmarks).
+    """
+    _transports[asyncio.get_running_loop()] = transport
+
+
+async def aclose_transport():
+    """
+    Close the shared transport for the running event loop, if any.
+    """
+    transport = _transports.pop(asyncio.get_running_loop(), None)
+    if transport is not None:
+        await transport.aclose()
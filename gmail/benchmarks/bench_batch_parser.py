@@ -0,0 +1,98 @@
+"""
+Micro-benchmark: streaming batch parser versus the original split-based parser.
+
+Builds a synthetic 100-part format=full batch response and reports time per parse
+and peak traced memory (excluding the input itself).
+
+    cd gmail && python -m benchmarks.bench_batch_parser --parts 100 --part-kb 32
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from app.batch import iter_batch_parts
+from app.gmail_api import threads_from_parts
+from tests.fake_gmail import make_thread
+
+BOUNDARY = "batch_bench"
+CHUNK_SIZE = 64 * 1024
+
+
+def legacy_parse(raw: bytes, boundary: str):
+    """
+    The parser this module replaced: decode, split, substring search, slice, loads.
+    """
+    threads = []
+    for part in raw.decode().split(f"--{boundary}"):
+        part = part.strip()
+        if not part or part == "--":
+            continue
+        if "HTTP/1.1 200" not in part:
+            continue
+        try:
+            threads.append(json.loads(part[part.index("{"):]))
+        except Exception:
+            continue
+    return threads
+
+
+def streaming_parse(raw: bytes, boundary: str):
+    chunks = (raw[i:i + CHUNK_SIZE] for i in range(0, len(raw), CHUNK_SIZE))
+    return list(threads_from_parts(iter_batch_parts(chunks, boundary)))
+
+
+def streaming_consume(raw: bytes, boundary: str):
+    # A consumer that handles each thread as it arrives (e.g. extraction) and
+    # does not keep the raw thread around.
+    chunks = (raw[i:i + CHUNK_SIZE] for i in range(0, len(raw), CHUNK_SIZE))
+    return [thread["id"] for thread in threads_from_parts(iter_batch_parts(chunks, boundary))]
+
+
+def build_batch(parts: int, part_kb: int) -> bytes:
+    out = []
+    for index in range(parts):
+        thread = make_thread(f"thread_{index}", messages_per_thread=4)
+        # Pad with a body-sized payload, as format=full responses carry MIME bodies.
+        thread["messages"][0]["payload"]["body"] = {"data": "x" * (part_kb * 1024)}
+        out.append(
+            f"--{BOUNDARY}\r\nContent-Type: application/http\r\n"
+            f"Content-ID: <response-request-{index}>\r\n\r\n"
+            "HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n"
+            f"{json.dumps(thread)}\r\n"
+        )
+    out.append(f"--{BOUNDARY}--\r\n")
+    return "".join(out).encode()
+
+
+def measure(name: str, parse, raw: bytes, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = parse(raw, BOUNDARY)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    parse(raw, BOUNDARY)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name:>9}: {elapsed * 1000:8.2f} ms/parse  peak={peak / 1024 / 1024:7.2f} MiB  "
+          f"threads={len(result)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--parts", type=int, default=100)
+    parser.add_argument("--part-kb", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    raw = build_batch(args.parts, args.part_kb)
+    print(f"batch: {args.parts} parts, {len(raw) / 1024 / 1024:.2f} MiB")
+    measure("legacy", legacy_parse, raw, args.repeat)
+    measure("streaming", streaming_parse, raw, args.repeat)
+    measure("consume", streaming_consume, raw, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Measure body extraction on large multi-part format=full messages.
+
+Compares:
+  previews  extract_email_content without bodies (what preview callers pay)
+  lazy      bodies attached, but only one page of them read
+  all       every body read
+  eager     decode every part, attachments included, as a naive walker would
+
+Reports time per run and peak traced memory.
+
+    cd gmail && python -m benchmarks.bench_body_decode --messages 200 --paragraphs 200
+"""
+import argparse
+import base64
+import time
+import tracemalloc
+
+from app.gmail_api import extract_email_content
+from app.mime import iter_leaf_parts
+from tests.fake_gmail import make_message
+
+
+def build_threads(messages: int, paragraphs: int, attachment_kb: int):
+    threads = []
+    for index in range(messages):
+        message = make_message(f"thread_{index}", 0, body_paragraphs=paragraphs)
+        # Small attachments are sent inline, so their data is in the response.
+        attachment = message["payload"]["parts"][1]
+        data = base64.urlsafe_b64encode(b"%PDF" + b"\0" * (attachment_kb * 1024)).decode()
+        attachment["body"] = {"size": attachment_kb * 1024, "data": data}
+        threads.append({"id": message["threadId"], "messages": [message]})
+    return threads
+
+
+def eager_decode_all(threads):
+    # Walks attachments as well and decodes everything it finds.
+    decoded = []
+    for thread in threads:
+        for message in thread["messages"]:
+            stack = [message["payload"]]
+            while stack:
+                part = stack.pop()
+                stack.extend(part.get("parts", []))
+                data = part.get("body", {}).get("data")
+                if data:
+                    decoded.append(base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)))
+    return decoded
+
+
+def previews(threads):
+    return extract_email_content(threads)
+
+
+def lazy_page(threads, page_size: int = 10):
+    records = extract_email_content(threads, include_body=True)
+    return [record.body.text for record in records[:page_size]]
+
+
+def all_bodies(threads):
+    return [record.body.text for record in extract_email_content(threads, include_body=True)]
+
+
+def measure(name: str, run, threads, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        run(threads)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    run(threads)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>9}: {elapsed * 1000:8.2f} ms  peak={peak / 1024 / 1024:7.2f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=200)
+    parser.add_argument("--attachment-kb", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    threads = build_threads(args.messages, args.paragraphs, args.attachment_kb)
+    text_parts = sum(1 for t in threads for m in t["messages"] for _ in iter_leaf_parts(m["payload"]))
+    print(f"{args.messages} messages, {text_parts} text parts, "
+          f"{args.attachment_kb} KiB inline attachment each")
+    measure("previews", previews, threads, args.repeat)
+    measure("lazy", lazy_page, threads, args.repeat)
+    measure("all", all_bodies, threads, args.repeat)
+    measure("eager", eager_decode_all, threads, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
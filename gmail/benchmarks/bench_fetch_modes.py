@@ -0,0 +1,42 @@
+"""
+Compare batch payload size and parse/extract time for format=full versus the
+metadata + fields-mask fetch mode.
+
+    cd gmail && python -m benchmarks.bench_fetch_modes --threads 100 --messages 3
+"""
+import argparse
+import time
+from unittest.mock import Mock
+
+from app.gmail_api import FETCH_MODES, build_threads_batch, extract_email_content, parse_gmail_batch_response
+from tests.fake_gmail import FakeGmail
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    fake = FakeGmail(num_threads=args.threads, messages_per_thread=args.messages)
+    threads = [{"id": thread_id} for thread_id in fake.threads]
+
+    for mode in FETCH_MODES:
+        headers, body = build_threads_batch("token", threads, fetch_mode=mode)
+        _, response_headers, payload = fake.handle(
+            "POST", "/batch/gmail/v1", {"content-type": headers["Content-Type"]}, body
+        )
+        response = Mock(headers=response_headers, text=payload.decode())
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            emails = extract_email_content(parse_gmail_batch_response(response))
+        elapsed = (time.perf_counter() - start) / args.repeat
+
+        print(f"{mode:>8}: {len(payload) / 1024:9.1f} KiB  "
+              f"parse+extract={elapsed * 1000:7.2f} ms  emails={len(emails)}")
+
+
+if __name__ == "__main__":
+    main()
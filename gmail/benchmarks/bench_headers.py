@@ -0,0 +1,66 @@
+"""
+Micro-benchmark: From/Subject lookup with the full header dict versus the
+early-exit scan, over messages with a realistic number of headers.
+
+    cd gmail && python -m benchmarks.bench_headers --messages 10000 --headers 60
+"""
+import argparse
+import timeit
+
+from app.gmail_api import METADATA_HEADERS, extract_from_and_subject, extract_headers
+from app.headers import message_headers
+from tests.fake_gmail import make_message
+
+
+def build_messages(count: int, total_headers: int):
+    messages = []
+    for index in range(count):
+        message = make_message(f"thread_{index}", index, body_paragraphs=0)
+        headers = message["payload"]["headers"]
+        # Gmail keeps the original order: relay and authentication headers
+        # first, then the author's headers, then list/tracking headers.
+        extra = max(total_headers - len(headers), 0)
+        relay = [{"name": f"X-Received-{hop}", "value": f"by 10.0.0.{hop} with SMTP"}
+                 for hop in range(extra * 2 // 3)]
+        trailing = [{"name": f"X-Tracking-{hop}", "value": "opaque"}
+                    for hop in range(extra - len(relay))]
+        message["payload"]["headers"] = relay + headers + trailing
+        messages.append(message)
+    return messages
+
+
+def dict_lookup(messages):
+    # The original extract_from_and_subject: build a dict of every header.
+    out = []
+    for message in messages:
+        header_map = extract_headers(message)
+        out.append((header_map.get("From"), header_map.get("Subject")))
+    return out
+
+
+def scan_lookup(messages):
+    return [message_headers(message, METADATA_HEADERS) for message in messages]
+
+
+def scan_and_decode(messages):
+    return [extract_from_and_subject(message) for message in messages]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--headers", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    messages = build_messages(args.messages, args.headers)
+    assert [tuple(v) for v in scan_lookup(messages)] == dict_lookup(messages)
+    print(f"{args.messages} messages, {len(messages[0]['payload']['headers'])} headers each")
+
+    for name, run in (("dict", dict_lookup), ("scan", scan_lookup), ("scan+2047", scan_and_decode)):
+        seconds = min(timeit.repeat(lambda: run(messages), number=1, repeat=args.repeat))
+        print(f"{name:>10}: {seconds * 1000:8.2f} ms  ({seconds / args.messages * 1e6:.2f} µs/message)")
+
+
+if __name__ == "__main__":
+    main()
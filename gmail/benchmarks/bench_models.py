@@ -0,0 +1,58 @@
+"""
+Per-message construction and serialization cost for 10k messages: validated
+EmailPreview models per message versus EmailRecord tuples validated once at the
+tool boundary.
+
+    cd gmail && python -m benchmarks.bench_models --messages 10000
+"""
+import argparse
+import timeit
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app.model import EmailPreview, EmailRecord, FetchRecentEmailsResponse
+
+
+def timed(name: str, count: int, fn, repeat: int = 5):
+    best = min(timeit.repeat(fn, number=1, repeat=repeat))
+    print(f"{name:>40}: {best * 1e6 / count:6.2f} us/message  ({best * 1000:7.1f} ms total)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10000)
+    args = parser.parse_args()
+    n = args.messages
+
+    values = [
+        (f"msg_{i}", f"thread_{i // 3}", "Lorem ipsum dolor sit amet " * 4,
+         f"Sender {i} <sender{i}@example.com>", f"Subject {i}")
+        for i in range(n)
+    ]
+    previews = [EmailPreview(id=a, thread_id=b, snippet=c, from_=d, subject=e) for a, b, c, d, e in values]
+    records = [EmailRecord(*v) for v in values]
+
+    print("construction")
+    timed("EmailPreview(...) per message", n, lambda: [
+        EmailPreview(id=a, thread_id=b, snippet=c, from_=d, subject=e) for a, b, c, d, e in values
+    ])
+    timed("EmailPreview.model_construct", n, lambda: [
+        EmailPreview.model_construct(id=a, thread_id=b, snippet=c, from_=d, subject=e)
+        for a, b, c, d, e in values
+    ])
+    timed("EmailRecord(...) per message", n, lambda: [EmailRecord(*v) for v in values])
+
+    print("response")
+    timed("Response(emails=previews)", n, lambda: FetchRecentEmailsResponse(emails=previews))
+    timed("Response.from_records(records)", n, lambda: FetchRecentEmailsResponse.from_records(records))
+
+    print("serialization")
+    response = FetchRecentEmailsResponse.from_records(records)
+    timed("Response.model_dump_json", n, response.model_dump_json)
+    records_adapter = TypeAdapter(List[EmailRecord])
+    timed("TypeAdapter(List[EmailRecord]).dump_json", n, lambda: records_adapter.dump_json(records))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Time from "client wants an answer" to the first tool result, per session:
+
+  stdio  spawn a server process per session, as mcpclient.py does for a script path
+  warm   attach to one long-running streamable-http server
+
+Each session connects, initializes, lists tools and calls fetch_recent_emails
+against a local fake Gmail server. Warm sessions after the first also reuse the
+server's connection pool and response cache, as real clients of one server do.
+
+    cd gmail && python -m benchmarks.bench_startup --sessions 10 --latency 0.02
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+
+from benchmarks.stats import percentile
+from tests.fake_gmail import FakeGmail, serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def server_env(api_root: str) -> dict:
+    # Run from a scratch directory so the server's log file lands there, and
+    # disable the on-disk message store so every session measures the same work.
+    return {**os.environ, "PYTHONPATH": ROOT, "GMAIL_API_ROOT": api_root, "GMAIL_CACHE_URL": ""}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def first_result(streams) -> None:
+    read, write = streams[0], streams[1]
+    async with ClientSession(read, write) as session:
+        await session.initialize()
+        await session.list_tools()
+        result = await session.call_tool("fetch_recent_emails", {"access_token": "token"})
+        assert not result.isError, result
+
+
+async def stdio_session(env: dict, cwd: str) -> float:
+    params = StdioServerParameters(command=sys.executable, args=["-m", "app.main"], env=env, cwd=cwd)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as errlog:
+        async with stdio_client(params, errlog=errlog) as streams:
+            await first_result(streams)
+    return time.perf_counter() - start
+
+
+async def warm_session(url: str) -> float:
+    start = time.perf_counter()
+    async with streamablehttp_client(url) as streams:
+        await first_result(streams)
+    return time.perf_counter() - start
+
+
+@asynccontextmanager
+async def warm_server(env: dict, cwd: str, port: int):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app.main", "--transport", "streamable-http", "--port", str(port)],
+        env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        async with httpx.AsyncClient() as client:
+            for _ in range(200):
+                try:
+                    await client.get(f"http://127.0.0.1:{port}/mcp")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.05)
+        yield f"http://127.0.0.1:{port}/mcp"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def report(name: str, latencies):
+    ordered = sorted(latencies)
+    p95 = percentile(ordered, 0.95)
+    print(f"{name:>6}: first={latencies[0] * 1000:8.1f}ms p50={statistics.median(ordered) * 1000:8.1f}ms "
+          f"p95={p95 * 1000:8.1f}ms")
+
+
+async def run(sessions: int, latency: float):
+    fake = serve(FakeGmail(num_threads=20, latency=latency))
+    env = server_env(f"http://127.0.0.1:{fake.server_address[1]}")
+    try:
+        with tempfile.TemporaryDirectory() as cwd:
+            report("stdio", [await stdio_session(env, cwd) for _ in range(sessions)])
+            async with warm_server(env, cwd, free_port()) as url:
+                report("warm", [await warm_session(url) for _ in range(sessions)])
+    finally:
+        fake.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="fake Gmail latency per HTTP request, in seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args.sessions, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark N concurrent fetch_recent_emails calls against a local fake Gmail server.
+
+Compares the blocking `requests` pipeline (each call runs to completion before the
+next, as a sync tool does on the FastMCP event loop) with the pooled async pipeline.
+
+    cd gmail && python -m benchmarks.bench_transport --calls 50 --latency 0.02
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from app import gmail_api
+from app.main import fetch_recent_emails
+from benchmarks.stats import percentile
+from tests.fake_gmail import FakeGmail, serve
+
+
+def report(name: str, latencies, elapsed: float):
+    latencies = sorted(latencies)
+    p95 = percentile(latencies, 0.95)
+    print(f"{name:>6}: p50={statistics.median(latencies) * 1000:8.1f}ms "
+          f"p95={p95 * 1000:8.1f}ms total={elapsed:6.2f}s "
+          f"throughput={len(latencies) / elapsed:7.1f} calls/s")
+
+
+def run_sync(calls: int):
+    # A blocking tool serializes the burst, so each caller's latency includes
+    # the time spent queued behind the calls before it.
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(calls):
+        gmail_api.get_all_threads("token", max_threads=20)
+        latencies.append(time.perf_counter() - start)
+    return latencies, time.perf_counter() - start
+
+
+async def run_async(calls: int):
+    async def one():
+        t0 = time.perf_counter()
+        await fetch_recent_emails("token")
+        return time.perf_counter() - t0
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*[one() for _ in range(calls)])
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="server-side latency per HTTP request, in seconds")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    server = serve(FakeGmail(num_threads=20, latency=args.latency))
+    root = f"http://127.0.0.1:{server.server_address[1]}"
+    gmail_api.BASE_URL = f"{root}/gmail/v1"
+    gmail_api.BATCH_BASE_URL = f"{root}/batch/gmail/v1"
+
+    try:
+        report("sync", *run_sync(args.calls))
+        report("async", *asyncio.run(run_async(args.calls)))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
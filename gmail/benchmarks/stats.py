@@ -0,0 +1,16 @@
+"""
+Summary statistics shared by the benchmarks.
+"""
+import math
+from typing import Sequence
+
+
+def percentile(ordered: Sequence[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of sorted samples: the smallest sample with at
+    least `fraction` of the samples at or below it. For small samples the p95
+    is the maximum, never something below the median.
+    """
+    if not ordered:
+        raise ValueError("percentile of no samples")
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
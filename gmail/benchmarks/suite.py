@@ -0,0 +1,244 @@
+"""
+End-to-end benchmark suite for the fetch pipeline, against a local fake Gmail
+server with a generated mailbox, keeping results across commits.
+
+Cases:
+
+  sync_http     get_all_threads (blocking `requests`) over real HTTP
+  async_http    get_all_threads_async over real HTTP
+  async_errors  get_all_threads_async while --error-rate of requests and batch
+                parts fail with 429/5xx and are retried
+  mcp_stdio     fetch_recent_emails called through a `python -m app.main`
+                stdio session, as mcpclient.py runs the server
+
+Each case runs --warmup untimed and --repeats timed iterations. Every run
+appends one JSON line per case to .benchmarks/results.jsonl, tagged with the
+git commit, so runs on different commits can be compared:
+
+    cd gmail && python -m benchmarks.suite --threads 500 --latency 0.02
+    cd gmail && python -m benchmarks.suite --cases async_http --compare HEAD~1
+    cd gmail && python -m benchmarks.suite --compare-only    # last two commits on file
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+# The benchmark measures the pipeline, not Gmail's quota: set before the
+# scheduler is first built.
+os.environ.setdefault("GMAIL_USER_QUOTA_PER_SECOND", "0")
+
+from mcp import ClientSession, StdioServerParameters  # noqa: E402
+from mcp.client.stdio import stdio_client  # noqa: E402
+
+from app import gmail_api  # noqa: E402
+from app.metrics import metrics  # noqa: E402
+from benchmarks.bench_startup import ROOT, server_env  # noqa: E402
+from benchmarks.stats import percentile  # noqa: E402
+from tests.fake_gmail import FakeGmail, serve  # noqa: E402
+
+RESULTS_PATH = Path(ROOT) / ".benchmarks" / "results.jsonl"
+CASES = ("sync_http", "async_http", "async_errors", "mcp_stdio")
+
+
+def git(*args: str) -> str:
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def point_at(server) -> str:
+    root = f"http://127.0.0.1:{server.server_address[1]}"
+    gmail_api.BASE_URL = f"{root}/gmail/v1"
+    gmail_api.BATCH_BASE_URL = f"{root}/batch/gmail/v1"
+    return root
+
+
+@asynccontextmanager
+async def sync_http(args):
+    server = serve(FakeGmail.realistic(args.threads, seed=args.seed, latency=args.latency))
+    point_at(server)
+
+    async def run():
+        gmail_api.get_all_threads("token", max_threads=args.threads)
+
+    try:
+        yield run
+    finally:
+        server.shutdown()
+
+
+@asynccontextmanager
+async def async_http(args, error_rate: float = 0.0):
+    server = serve(FakeGmail.realistic(args.threads, seed=args.seed, latency=args.latency,
+                                       error_rate=error_rate))
+    point_at(server)
+
+    async def run():
+        await gmail_api.get_all_threads_async("token", max_threads=args.threads)
+
+    try:
+        yield run
+    finally:
+        server.shutdown()
+
+
+@asynccontextmanager
+async def async_errors(args):
+    async with async_http(args, error_rate=args.error_rate) as run:
+        yield run
+
+
+@asynccontextmanager
+async def mcp_stdio(args):
+    server = serve(FakeGmail.realistic(args.threads, seed=args.seed, latency=args.latency))
+    # Every call goes to the fake Gmail server: no response cache, message store or quota.
+    env = {**server_env(point_at(server)), "GMAIL_RESPONSE_CACHE_TTL": "0",
+           "GMAIL_USER_QUOTA_PER_SECOND": "0"}
+    try:
+        with tempfile.TemporaryDirectory() as cwd, open(os.devnull, "w") as errlog:
+            params = StdioServerParameters(command=sys.executable, args=["-m", "app.main"],
+                                           env=env, cwd=cwd)
+            async with stdio_client(params, errlog=errlog) as (read, write), \
+                    ClientSession(read, write) as session:
+                await session.initialize()
+
+                async def run():
+                    result = await session.call_tool("fetch_recent_emails",
+                                                     {"access_token": "token", "max_threads": args.threads})
+                    assert not result.isError, result
+
+                yield run
+    finally:
+        server.shutdown()
+
+
+async def measure(case: str, args) -> Dict:
+    """
+    Time one case. Stage timings come from the in-process metrics, so they are
+    empty for mcp_stdio, whose pipeline runs in the server process.
+    """
+    async with globals()[case](args) as run:
+        for _ in range(args.warmup):
+            await run()
+        metrics.reset()
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            await run()
+            timings.append(time.perf_counter() - start)
+    ordered = sorted(timings)
+    stages = {name: stage["mean_ms"] for name, stage in metrics.snapshot()["stages"].items()}
+    return {
+        "case": case,
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "stage_mean_ms": stages,
+    }
+
+
+def load_results(path: Path = RESULTS_PATH) -> List[Dict]:
+    if not path.exists():
+        return []
+    with path.open() as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def latest_by_case(results: List[Dict], commit: str, params: Dict) -> Dict[str, Dict]:
+    """
+    The most recent result per case for `commit`, among runs with the same mailbox and server settings.
+    """
+    latest = {}
+    for result in results:
+        if result["commit"] == commit and result["params"] == params:
+            latest[result["case"]] = result
+    return latest
+
+
+def compare(before: Dict[str, Dict], after: Dict[str, Dict], base: str, head: str):
+    if not before or not after:
+        print(f"No results to compare for {base[:10]} and {head[:10]} with these parameters")
+        return
+    print(f"{'case':>14}  {base[:10]:>12}  {head[:10]:>12}  change")
+    for case in CASES:
+        if case in before and case in after:
+            old, new = before[case]["median_ms"], after[case]["median_ms"]
+            print(f"{case:>14}  {old:10.1f}ms  {new:10.1f}ms  {(new - old) / old:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--threads", type=int, default=200, help="threads in the generated mailbox")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.01,
+                        help="fake Gmail latency per HTTP request, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.02,
+                        help="failure rate for the async_errors case")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--compare", metavar="REF",
+                        help="compare this run with the latest results recorded for REF")
+    parser.add_argument("--compare-only", action="store_true",
+                        help="do not run; compare the last two commits in the results file")
+    parser.add_argument("--results", type=Path, default=RESULTS_PATH)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    params = {"threads": args.threads, "seed": args.seed, "latency": args.latency,
+              "error_rate": args.error_rate, "repeats": args.repeats}
+    results = load_results(args.results)
+    if args.compare_only:
+        commits = list(dict.fromkeys(r["commit"] for r in reversed(results) if r["params"] == params))
+        if len(commits) < 2:
+            print("Need results from two commits with these parameters")
+            return
+        compare(latest_by_case(results, commits[1], params), latest_by_case(results, commits[0], params),
+                commits[1], commits[0])
+        return
+
+    run_info = {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+    }
+    new = []
+    for case in args.cases:
+        result = {**run_info, **asyncio.run(measure(case, args))}
+        new.append(result)
+        print(f"{case:>14}: median={result['median_ms']:8.1f}ms p95={result['p95_ms']:8.1f}ms "
+              f"min={result['min_ms']:8.1f}ms")
+
+    args.results.parent.mkdir(parents=True, exist_ok=True)
+    with args.results.open("a") as file:
+        for result in new:
+            file.write(json.dumps(result) + "\n")
+
+    if args.compare:
+        base = git("rev-parse", args.compare)
+        if not base:
+            sys.exit(f"Unknown git ref {args.compare!r}")
+        # Against earlier runs only, so --compare HEAD shows the effect of uncommitted changes.
+        compare(latest_by_case(results, base, params), {result["case"]: result for result in new},
+                base, run_info["commit"])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
 # conftest.py
+import httpx
 import pytest
+from app import gmail_api
+from app.scheduler import RetryPolicy, Scheduler
+from app.store import SQLiteMessageStore
+from app.transport import AsyncTransport
+from tests.fake_gmail import FakeGmail
 
 pytest_plugins = ["pytest_mock"]
 
@@ -9,4 +15,69 @@ def mock_access_token():
     """
     Fixture providing a mock access token.
     """
-    return "test_access_token_12345"
\ No newline at end of file
+    return "test_access_token_12345"
+
+
+@pytest.fixture(autouse=True)
+def no_message_cache(monkeypatch):
+    """
+    Keep tests off the on-disk message cache unless they opt in.
+    """
+    monkeypatch.setenv("GMAIL_CACHE_URL", "")
+
+
+@pytest.fixture(autouse=True)
+def no_quota_limit(monkeypatch):
+    """
+    Do not hold requests back for Gmail's per-user quota unless a test opts in.
+    """
+    monkeypatch.setenv("GMAIL_USER_QUOTA_PER_SECOND", "0")
+
+
+@pytest.fixture(autouse=True)
+def no_response_cache(monkeypatch):
+    """
+    Disable the in-memory tool response cache unless a test opts in.
+    """
+    from app.main import response_cache
+    monkeypatch.setattr(response_cache, "ttl", 0)
+
+
+@pytest.fixture
+def fake_gmail(request, mocker):
+    """
+    A fake Gmail mailbox wired into the shared async transport.
+
+    A `fake_gmail` mark sets FakeGmail options (5 threads of 2 messages by
+    default); `realistic=<threads>` builds FakeGmail.realistic instead. With
+    `max_attempts`, Gmail calls go through a scheduler that retries that often
+    without sleeping or enforcing quota (see gmail_api.get_scheduler()).
+    """
+    marker = request.node.get_closest_marker("fake_gmail")
+    options = dict(marker.kwargs) if marker else {}
+    max_attempts = options.pop("max_attempts", None)
+    realistic = options.pop("realistic", None)
+    if realistic is not None:
+        fake = FakeGmail.realistic(realistic, **options)
+    else:
+        fake = FakeGmail(**{"num_threads": 5, "messages_per_thread": 2, **options})
+    client = httpx.AsyncClient(transport=httpx.MockTransport(fake.httpx_handler))
+    mocker.patch("app.transport.get_transport", return_value=AsyncTransport(client))
+    mocker.patch.dict(gmail_api._accounts, clear=True)
+    if max_attempts is not None:
+        async def no_sleep(delay):
+            pass
+
+        scheduler = Scheduler(RetryPolicy(max_attempts=max_attempts), units_per_second=0, sleep=no_sleep)
+        mocker.patch("app.gmail_api.get_scheduler", return_value=scheduler)
+    return fake
+
+
+@pytest.fixture
+def store():
+    """
+    An in-memory SQLite message store.
+    """
+    store = SQLiteMessageStore(":memory:")
+    yield store
+    store.close()
@@ -0,0 +1,490 @@
+"""
+A small in-process fake of the Gmail REST API.
+
+FakeGmail answers the endpoints the server uses (threads.list, threads.get via
+the batch endpoint, users.getProfile, users.history.list and users.watch) and
+records history as messages are added or deleted. It can be mounted on an
+httpx.MockTransport for unit tests, or served over real HTTP with `serve()` for
+benchmarks. Run as a module to serve a generated mailbox on a local port:
+
+    cd gmail && python -m tests.fake_gmail --threads 500 --latency 0.02 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import re
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+Response = Tuple[int, Dict[str, str], bytes]
+
+DAY_MS = 24 * 60 * 60 * 1000
+# Statuses injected at random by `error_rate`; all of them are retryable.
+RANDOM_FAULTS = (429, 500, 503)
+
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip("=")
+
+
+def fault(status: int) -> Response:
+    """
+    An error response as Gmail sends it; 429s and rate-limit 403s carry Retry-After.
+    """
+    reason = "rateLimitExceeded" if status in (403, 429) else "backendError"
+    body = {"error": {"code": status, "message": HTTPStatus(status).phrase,
+                      "errors": [{"reason": reason}]}}
+    headers = {"Content-Type": "application/json"}
+    if status in (403, 429):
+        headers["Retry-After"] = "0"
+    return status, headers, json.dumps(body).encode()
+
+
+def make_message(thread_id: str, index: int, body_paragraphs: int = 4,
+                 internal_date: Optional[int] = None) -> Dict:
+    """
+    Build a message shaped like a format=full response: transport headers,
+    a multipart/alternative body and an attachment stub.
+    """
+    text = "\n\n".join(
+        f"Paragraph {p} of message {index} in {thread_id}. " * 6 for p in range(body_paragraphs)
+    )
+    html = "".join(f"<p>{line}</p>" for line in text.split("\n\n"))
+    headers = [
+        {"name": "Delivered-To", "value": "recipient@example.com"},
+        *[{"name": "Received", "value": f"from mx{hop}.example.net by mx.google.com "
+                                        f"with ESMTPS id {thread_id}{index}{hop}"}
+          for hop in range(6)],
+        {"name": "ARC-Seal", "value": "i=1; a=rsa-sha256; t=1704110400; cv=none; d=google.com; s=arc-20160816; b=" + "A" * 340},
+        {"name": "DKIM-Signature", "value": "v=1; a=rsa-sha256; c=relaxed/relaxed; d=example.com; s=s1; b=" + "B" * 340},
+        {"name": "MIME-Version", "value": "1.0"},
+        {"name": "From", "value": f"Sender {index} <sender{index}@example.com>"},
+        {"name": "To", "value": "recipient@example.com"},
+        {"name": "Subject", "value": f"Subject for {thread_id}"},
+        {"name": "Date", "value": "Mon, 1 Jan 2024 12:00:00 +0000"},
+        {"name": "Message-ID", "value": f"<{thread_id}.{index}@example.com>"},
+        {"name": "Content-Type", "value": 'multipart/mixed; boundary="000000000000abcdef"'},
+    ]
+    return {
+        "id": f"{thread_id}_msg_{index}",
+        "threadId": thread_id,
+        "labelIds": ["INBOX", "UNREAD"],
+        "snippet": f"Snippet {index} of {thread_id}",
+        "historyId": "1",
+        "internalDate": str(internal_date or int(time.time() * 1000)),
+        "sizeEstimate": len(text) + len(html),
+        "payload": {
+            "partId": "",
+            "mimeType": "multipart/mixed",
+            "filename": "",
+            "headers": headers,
+            "body": {"size": 0},
+            "parts": [
+                {
+                    "partId": "0",
+                    "mimeType": "multipart/alternative",
+                    "filename": "",
+                    "headers": [{"name": "Content-Type", "value": "multipart/alternative"}],
+                    "body": {"size": 0},
+                    "parts": [
+                        {"partId": "0.0", "mimeType": "text/plain", "filename": "",
+                         "headers": [{"name": "Content-Type", "value": "text/plain; charset=UTF-8"}],
+                         "body": {"size": len(text), "data": _b64(text)}},
+                        {"partId": "0.1", "mimeType": "text/html", "filename": "",
+                         "headers": [{"name": "Content-Type", "value": "text/html; charset=UTF-8"}],
+                         "body": {"size": len(html), "data": _b64(html)}},
+                    ],
+                },
+                {"partId": "1", "mimeType": "application/pdf", "filename": "report.pdf",
+                 "headers": [{"name": "Content-Type", "value": "application/pdf"}],
+                 "body": {"size": 120000, "attachmentId": f"att_{thread_id}_{index}"}},
+            ],
+        },
+    }
+
+
+def make_thread(thread_id: str, messages_per_thread: int = 2) -> Dict:
+    """
+    Build a thread resource shaped like a format=full threads.get response.
+    """
+    messages = [make_message(thread_id, index) for index in range(messages_per_thread)]
+    return {"id": thread_id, "historyId": "1", "messages": messages}
+
+
+def to_metadata(thread: Dict, metadata_headers: List[str]) -> Dict:
+    """
+    Reduce a format=full thread to what format=metadata returns: no bodies or
+    parts, and only the requested headers (all headers when none are requested).
+    """
+    wanted = {name.lower() for name in metadata_headers}
+    messages = []
+    for message in thread["messages"]:
+        payload = message["payload"]
+        headers = [h for h in payload["headers"] if not wanted or h["name"].lower() in wanted]
+        messages.append({
+            **{k: v for k, v in message.items() if k != "payload"},
+            "payload": {"mimeType": payload["mimeType"], "headers": headers},
+        })
+    return {**thread, "messages": messages}
+
+
+def _parse_fields(mask: str) -> Dict:
+    """
+    Parse a partial-response mask like `id,messages(id,payload/headers)` into
+    a nested dict; an empty dict means "the whole value".
+    """
+    tree: Dict = {}
+    stack = [tree]
+    token = ""
+
+    def flush():
+        nonlocal token
+        if token:
+            node = stack[-1]
+            for name in token.split("/"):
+                node = node.setdefault(name, {})
+            stack[-1]["__last__"] = node
+        token = ""
+
+    for char in mask:
+        if char == ",":
+            flush()
+        elif char == "(":
+            flush()
+            stack.append(stack[-1].pop("__last__"))
+        elif char == ")":
+            flush()
+            stack[-1].pop("__last__", None)
+            stack.pop()
+        else:
+            token += char.strip()
+    flush()
+    tree.pop("__last__", None)
+    return tree
+
+
+def apply_fields(value, tree: Dict):
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [apply_fields(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {k: apply_fields(value[k], sub) for k, sub in tree.items() if k in value}
+    return value
+
+
+class FakeGmail:
+    """
+    Fake mailbox with `num_threads` threads and optional per-request latency.
+
+    Faults can be injected: `request_faults` holds statuses to answer the next
+    top-level requests with, and `part_faults` maps a thread ID to statuses for
+    its next threads.get sub-requests inside a batch. With `error_rate`, that
+    fraction of requests and batch parts fails at random (reproducibly for a
+    given `seed`).
+    """
+
+    def __init__(self, num_threads: int = 20, messages_per_thread: int = 2,
+                 latency: float = 0.0, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.threads = {
+            f"thread_{i}": make_thread(f"thread_{i}", messages_per_thread)
+            for i in range(num_threads)
+        }
+        self.requests: List[Tuple[str, str]] = []
+        self.email_address = "me@example.com"
+        self.history_id = 1000
+        # users.history.list only serves records newer than this.
+        self.oldest_history_id = self.history_id
+        self.history: List[Dict] = []
+        self.request_faults: List[int] = []
+        self.part_faults: Dict[str, List[int]] = {}
+        # The `q` parameter of each threads.list call.
+        self.searches: List[str] = []
+        # The topicName of each users.watch call.
+        self.watches: List[str] = []
+
+    @classmethod
+    def realistic(cls, num_threads: int, seed: int = 0, latency: float = 0.0,
+                  error_rate: float = 0.0, max_messages_per_thread: int = 12) -> "FakeGmail":
+        """
+        A mailbox shaped like a real inbox: mostly short threads with a few long
+        ones, bodies of varying length, and activity spread over the last day,
+        newest thread first. The same `seed` gives the same mailbox.
+        """
+        fake = cls(num_threads=0, latency=latency, error_rate=error_rate, seed=seed)
+        rng = fake.random
+        now = int(time.time() * 1000)
+        threads = []
+        for i in range(num_threads):
+            thread_id = f"thread_{i}"
+            count = min(1 + int(rng.expovariate(0.6)), max_messages_per_thread)
+            last = now - int(rng.random() * DAY_MS)
+            messages = [make_message(thread_id, index, body_paragraphs=rng.randint(1, 12),
+                                     internal_date=last - (count - 1 - index) * rng.randint(60_000, 3_600_000))
+                        for index in range(count)]
+            threads.append({"id": thread_id, "historyId": "1", "messages": messages})
+        threads.sort(key=lambda thread: -int(thread["messages"][-1]["internalDate"]))
+        fake.threads = {thread["id"]: thread for thread in threads}
+        return fake
+
+    def random_fault(self) -> Optional[Response]:
+        if self.error_rate and self.random.random() < self.error_rate:
+            return fault(self.random.choice(RANDOM_FAULTS))
+        return None
+
+    def _record(self, kind: str, message: Dict):
+        self.history_id += 1
+        self.history.append({
+            "id": str(self.history_id),
+            "messages": [{"id": message["id"], "threadId": message["threadId"]}],
+            kind: [{"message": {"id": message["id"], "threadId": message["threadId"],
+                                "labelIds": message["labelIds"]}}],
+        })
+        thread = self.threads.get(message["threadId"])
+        if thread is not None:
+            thread["historyId"] = str(self.history_id)
+
+    def add_message(self, thread_id: str) -> Dict:
+        """
+        Deliver a new message, creating the thread if needed, and record it in history.
+        """
+        thread = self.threads.setdefault(thread_id, {"id": thread_id, "historyId": "1", "messages": []})
+        message = make_message(thread_id, len(thread["messages"]))
+        thread["messages"].append(message)
+        self._record("messagesAdded", message)
+        return message
+
+    def delete_message(self, message_id: str):
+        for thread_id, thread in list(self.threads.items()):
+            for message in thread["messages"]:
+                if message["id"] == message_id:
+                    thread["messages"].remove(message)
+                    if not thread["messages"]:
+                        del self.threads[thread_id]
+                    self._record("messagesDeleted", message)
+                    return
+        raise KeyError(message_id)
+
+    def expire_history(self):
+        """
+        Drop all history records, as Gmail does after about a week.
+        """
+        self.history.clear()
+        self.oldest_history_id = self.history_id
+
+    def handle(self, method: str, url: str, headers: Dict[str, str], body: bytes,
+               top_level: bool = True) -> Response:
+        parts = urlsplit(url)
+        multi_query = parse_qs(parts.query)
+        query = {k: v[0] for k, v in multi_query.items()}
+        query["metadataHeaders"] = multi_query.get("metadataHeaders", [])
+        self.requests.append((method, parts.path))
+        if top_level and self.request_faults:
+            return fault(self.request_faults.pop(0))
+        injected = self.random_fault() if top_level else None
+        if injected is not None:
+            return injected
+        return self.route(method, parts.path, query, headers, body)
+
+    def route(self, method: str, path: str, query: Dict, headers: Dict[str, str],
+              body: bytes) -> Response:
+        if method == "GET" and path == "/gmail/v1/users/me/threads":
+            return self.list_threads(query)
+        if method == "GET" and path == "/gmail/v1/users/me/profile":
+            return self.profile()
+        if method == "GET" and path == "/gmail/v1/users/me/history":
+            return self.list_history(query)
+        if method == "POST" and path == "/gmail/v1/users/me/watch":
+            return self.watch(body)
+        if method == "POST" and path == "/batch/gmail/v1":
+            return self.batch(headers.get("content-type", ""), body)
+        if method == "GET" and path.startswith("/gmail/v1/users/me/threads/"):
+            return self.get_thread(path.rsplit("/", 1)[1], query)
+        return 404, {"Content-Type": "application/json"}, b'{"error": "not found"}'
+
+    def list_threads(self, query: Dict[str, str]) -> Response:
+        ids = list(self.threads)
+        if "q" in query:
+            self.searches.append(query["q"])
+            ids = [thread_id for thread_id in ids if self._matches(thread_id, query["q"])]
+        max_results = int(query.get("maxResults", 100))
+        start = int(query.get("pageToken", 0))
+        page = ids[start:start + max_results]
+
+        data = {"threads": [{"id": thread_id} for thread_id in page],
+                "resultSizeEstimate": len(page)}
+        if start + max_results < len(ids):
+            data["nextPageToken"] = str(start + max_results)
+        return 200, {"Content-Type": "application/json"}, json.dumps(data).encode()
+
+    def _matches(self, thread_id: str, q: str) -> bool:
+        """
+        Evaluate the `after:` and `before:` operators (epoch seconds) of a
+        search; other terms are ignored.
+        """
+        dates = [int(m["internalDate"]) // 1000 for m in self.threads[thread_id]["messages"]]
+        for term in q.split():
+            operator, _, value = term.partition(":")
+            if operator == "after" and not any(date > int(value) for date in dates):
+                return False
+            if operator == "before" and not any(date < int(value) for date in dates):
+                return False
+        return True
+
+    def profile(self) -> Response:
+        data = {"emailAddress": self.email_address, "historyId": str(self.history_id),
+                "messagesTotal": sum(len(t["messages"]) for t in self.threads.values()),
+                "threadsTotal": len(self.threads)}
+        return 200, {"Content-Type": "application/json"}, json.dumps(data).encode()
+
+    def watch(self, body: bytes) -> Response:
+        self.watches.append(json.loads(body)["topicName"])
+        expiration = int(time.time() * 1000) + 7 * 24 * 60 * 60 * 1000
+        data = {"historyId": str(self.history_id), "expiration": str(expiration)}
+        return 200, {"Content-Type": "application/json"}, json.dumps(data).encode()
+
+    def list_history(self, query: Dict) -> Response:
+        start_history_id = int(query["startHistoryId"])
+        if start_history_id < self.oldest_history_id:
+            return 404, {"Content-Type": "application/json"}, b'{"error": {"code": 404}}'
+
+        records = [r for r in self.history if int(r["id"]) > start_history_id]
+        max_results = int(query.get("maxResults", 100))
+        start = int(query.get("pageToken", 0))
+        data = {"historyId": str(self.history_id)}
+        if records[start:start + max_results]:
+            data["history"] = records[start:start + max_results]
+        if start + max_results < len(records):
+            data["nextPageToken"] = str(start + max_results)
+        return 200, {"Content-Type": "application/json"}, json.dumps(data).encode()
+
+    def get_thread(self, thread_id: str, query: Dict) -> Response:
+        thread = self.threads.get(thread_id)
+        if thread is None:
+            return 404, {"Content-Type": "application/json"}, b'{"error": "not found"}'
+        if query.get("format") == "metadata":
+            thread = to_metadata(thread, query["metadataHeaders"])
+        if "fields" in query:
+            thread = apply_fields(thread, _parse_fields(query["fields"]))
+        return 200, {"Content-Type": "application/json"}, json.dumps(thread).encode()
+
+    def batch(self, content_type: str, body: bytes) -> Response:
+        boundary = re.search(r"boundary=([^\s;]+)", content_type).group(1)
+        out = []
+        for part in body.decode().split(f"--{boundary}"):
+            match = re.search(r"^(GET|POST) (\S+) HTTP/1\.1", part, re.MULTILINE)
+            if not match:
+                continue
+            content_id = re.search(r"Content-ID: <([^>]+)>", part)
+            method, url = match.group(1), match.group(2)
+            faults = self.part_faults.get(urlsplit(url).path.rsplit("/", 1)[1])
+            injected = fault(faults.pop(0)) if faults else self.random_fault()
+            if injected is not None:
+                status, headers, payload = injected
+            else:
+                status, headers, payload = self.handle(method, url, {}, b"", top_level=False)
+            extra = "".join(f"{k}: {v}\r\n" for k, v in headers.items() if k != "Content-Type")
+            out.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id.group(1) if content_id else ''}>\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: application/json\r\n{extra}\r\n"
+                f"{payload.decode()}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        return (200, {"Content-Type": f"multipart/mixed; boundary={boundary}"},
+                "".join(out).encode())
+
+    async def httpx_handler(self, request: httpx.Request) -> httpx.Response:
+        """
+        Handler for httpx.MockTransport.
+        """
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        status, headers, body = self.handle(
+            request.method, str(request.url), dict(request.headers), await request.aread()
+        )
+        return httpx.Response(status, headers=headers, content=body)
+
+
+def serve(fake: FakeGmail, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Serve `fake` over HTTP/1.1 with keep-alive on a background thread.
+    The caller is responsible for calling `shutdown()` on the returned server.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; with Nagle on, a kept-alive
+        # connection stalls on the client's delayed ACK (~40ms) every response.
+        disable_nagle_algorithm = True
+
+        def _dispatch(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length) if length else b""
+            if fake.latency:
+                time.sleep(fake.latency)
+            headers = {k.lower(): v for k, v in self.headers.items()}
+            status, out_headers, payload = fake.handle(self.command, self.path, headers, body)
+            self.send_response(status)
+            for name, value in out_headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = _dispatch
+        do_POST = _dispatch
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        # The default backlog of 5 drops SYNs when a connection pool opens many
+        # sockets at once, which shows up as one-second connect stalls.
+        request_queue_size = 128
+
+    server = Server((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a generated fake Gmail mailbox.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--threads", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="server-side latency per HTTP request, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests and batch parts that fail with 429/5xx")
+    args = parser.parse_args()
+
+    fake = FakeGmail.realistic(args.threads, seed=args.seed, latency=args.latency,
+                               error_rate=args.error_rate)
+    server = serve(fake, args.host, args.port)
+    messages = sum(len(thread["messages"]) for thread in fake.threads.values())
+    print(f"Serving {len(fake.threads)} threads, {messages} messages at "
+          f"http://{args.host}:{server.server_address[1]} (use it as GMAIL_API_ROOT)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
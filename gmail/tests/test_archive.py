@@ -0,0 +1,143 @@
+import os
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from app.archive import HEADER_COLUMNS, MESSAGE_COLUMNS, THREAD_COLUMNS, archive_rows
+from app.store import SQLiteMessageStore
+from app.sync import sync_recent_emails
+from tests.fake_gmail import make_thread, to_metadata
+
+
+@pytest.fixture
+def archive(mocker):
+    archive = Mock(ingest_async=AsyncMock(return_value=0))
+    mocker.patch("app.sync.get_archive", return_value=archive)
+    return archive
+
+
+def test_archive_rows_flatten_threads_messages_and_headers():
+    """
+    Test that rows follow the COPY column order and hidden messages are skipped.
+    """
+    # Arrange
+    thread = to_metadata(make_thread("t1", messages_per_thread=3), [])
+    thread["historyId"] = "42"
+    thread["messages"][2]["labelIds"] = ["TRASH"]
+    dates = [int(m["internalDate"]) for m in thread["messages"][:2]]
+
+    # Act
+    threads, messages, headers = archive_rows("me@example.com", [thread])
+
+    # Assert
+    assert threads == [("me@example.com", "t1", "42", "Subject for t1", 2, min(dates), max(dates))]
+    assert [len(row) for row in (threads[0], messages[0], headers[0])] == \
+        [len(THREAD_COLUMNS), len(MESSAGE_COLUMNS), len(HEADER_COLUMNS)]
+    row = dict(zip(MESSAGE_COLUMNS, messages[1]))
+    assert row["id"] == "t1_msg_1"
+    assert row["sender"] == "sender1@example.com"
+    assert row["label_ids"] == ["INBOX", "UNREAD"]
+    assert len(headers) == 2 * len(thread["messages"][0]["payload"]["headers"])
+    assert headers[0][:4] == ("me@example.com", "t1_msg_0", 0, "Delivered-To")
+
+
+async def test_sync_archives_fetched_threads_and_deletions(fake_gmail, archive, mock_access_token):
+    """
+    Test that full and incremental syncs hand what they fetched to the archive.
+    """
+    # Arrange
+    store = SQLiteMessageStore(":memory:")
+    await sync_recent_emails(mock_access_token, store, max_threads=10)
+    fake_gmail.add_message("thread_1")
+    fake_gmail.delete_message("thread_3_msg_0")
+
+    # Act
+    await sync_recent_emails(mock_access_token, store, max_threads=10)
+
+    # Assert
+    (full, incremental) = archive.ingest_async.await_args_list
+    assert full.args[0] == "me@example.com"
+    assert {t["id"] for t in full.args[1]} == set(fake_gmail.threads)
+    assert {t["id"] for t in incremental.args[1]} == {"thread_1", "thread_3"}
+    assert set(incremental.args[2]) == {"thread_3_msg_0"}
+
+
+async def test_sync_fetches_every_header_for_the_archive(fake_gmail, archive, monkeypatch,
+                                                         mock_access_token):
+    """
+    Test that synced threads carry all their headers into the archive rows, not
+    just the From and Subject the cache needs.
+    """
+    # Arrange
+    monkeypatch.setenv("GMAIL_ARCHIVE_URL", "postgresql://archive")
+    store = SQLiteMessageStore(":memory:")
+
+    # Act
+    result = await sync_recent_emails(mock_access_token, store, max_threads=10)
+
+    # Assert
+    account, threads, _ = archive.ingest_async.await_args.args
+    _, _, headers = archive_rows(account, threads)
+    names = {row[3] for row in headers}
+    assert {"From", "Subject", "Delivered-To"} <= names
+    assert {e.subject for e in result} == {f"Subject for {t}" for t in fake_gmail.threads}
+
+
+async def test_archive_failure_does_not_fail_the_sync(fake_gmail, archive, mock_access_token):
+    """
+    Test that the cache still answers when the archive is down.
+    """
+    # Arrange
+    archive.ingest_async.side_effect = ConnectionError("connection refused")
+
+    # Act
+    result = await sync_recent_emails(mock_access_token, SQLiteMessageStore(":memory:"), max_threads=10)
+
+    # Assert
+    assert len(result) == 10
+
+
+async def test_archive_that_cannot_open_does_not_fail_the_sync(fake_gmail, mocker, mock_access_token):
+    """
+    Test that a configured archive without psycopg installed is logged, not raised.
+    """
+    # Arrange
+    mocker.patch("app.sync.get_archive", side_effect=ImportError("No module named 'psycopg_pool'"))
+
+    # Act
+    result = await sync_recent_emails(mock_access_token, SQLiteMessageStore(":memory:"), max_threads=10)
+
+    # Assert
+    assert len(result) == 10
+
+
+@pytest.mark.skipif(not os.environ.get("GMAIL_TEST_ARCHIVE_URL"),
+                    reason="set GMAIL_TEST_ARCHIVE_URL to a scratch Postgres database")
+def test_ingest_round_trips_through_postgres():
+    """
+    Test COPY + upsert against a real database, including re-ingesting changed threads.
+    """
+    # Arrange
+    from app.archive import PostgresArchive
+    archive = PostgresArchive(os.environ["GMAIL_TEST_ARCHIVE_URL"], batch_size=2)
+    archive.create_schema()
+    threads = [to_metadata(make_thread(f"t{i}", messages_per_thread=2), []) for i in range(5)]
+    account = "archive-test@example.com"
+
+    # Act
+    written = archive.ingest(account, threads)
+    threads[0]["messages"].pop()
+    archive.ingest(account, threads[:1], deleted_ids=["t0_msg_1"])
+
+    # Assert
+    with archive.pool.connection() as connection:
+        messages = connection.execute("SELECT COUNT(*) FROM archive_messages WHERE account = %s",
+                                      (account,)).fetchone()[0]
+        thread = connection.execute("SELECT message_count FROM archive_threads WHERE account = %s AND id = 't0'",
+                                    (account,)).fetchone()[0]
+        orphans = connection.execute("SELECT COUNT(*) FROM archive_headers WHERE account = %s AND message_id = 't0_msg_1'",
+                                     (account,)).fetchone()[0]
+        for table in ("archive_headers", "archive_messages", "archive_threads"):
+            connection.execute(f"DELETE FROM {table} WHERE account = %s", (account,))
+    archive.close()
+    assert written == 10
+    assert (messages, thread, orphans) == (9, 1, 0)
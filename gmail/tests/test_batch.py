@@ -0,0 +1,150 @@
+import json
+from pathlib import Path
+import pytest
+from app.batch import BatchRequest, BatchResponseParser, iter_batch_parts, aiter_batch_parts
+from app.gmail_api import extract_boundary
+from tests.fake_gmail import FakeGmail
+
+MOCK_BATCH_PATH = Path(__file__).parent / "fixtures" / "mock_batch_response.json"
+
+BOUNDARY = "batch_abc"
+BATCH_TEXT = (
+    "--batch_abc\r\n"
+    "Content-Type: application/http\r\n"
+    "Content-ID: <response-request-1>\r\n\r\n"
+    "HTTP/1.1 200 OK\r\n"
+    "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+    '{"id": "thread_1", "snippet": "not a delimiter: --batch_abc"}\r\n'
+    "--batch_abc\r\n"
+    "Content-Type: application/http\r\n"
+    "Content-ID: <response-request-2>\r\n\r\n"
+    "HTTP/1.1 404 Not Found\r\n"
+    "Content-Type: application/json\r\n\r\n"
+    '{"error": {"code": 404}}\r\n'
+    "--batch_abc--\r\n"
+).encode()
+
+
+def test_iter_batch_parts_parses_status_headers_and_content_id():
+    """
+    Test that each part's status line, headers and Content-ID are parsed.
+    """
+    # Act
+    parts = list(iter_batch_parts([BATCH_TEXT], BOUNDARY))
+
+    # Assert
+    assert len(parts) == 2
+    assert parts[0].status == 200
+    assert parts[0].request_id == "request-1"
+    assert parts[0].headers["content-type"] == "application/json; charset=UTF-8"
+    assert parts[0].json()["snippet"] == "not a delimiter: --batch_abc"
+    assert parts[1].status == 404
+    assert not parts[1].ok
+    assert parts[1].request_id == "request-2"
+
+
+def test_parser_handles_arbitrary_chunk_boundaries():
+    """
+    Test that splitting the stream at every possible byte offset gives the same parts.
+    """
+    expected = list(iter_batch_parts([BATCH_TEXT], BOUNDARY))
+
+    for size in (1, 2, 3, 7, 64):
+        chunks = [BATCH_TEXT[i:i + size] for i in range(0, len(BATCH_TEXT), size)]
+        assert list(iter_batch_parts(chunks, BOUNDARY)) == expected
+
+
+def test_parser_yields_parts_before_stream_ends():
+    """
+    Test that a part is emitted as soon as the next delimiter arrives.
+    """
+    # Arrange
+    parser = BatchResponseParser(BOUNDARY)
+    split = BATCH_TEXT.index(b"--batch_abc\r\nContent-Type", 10) + len(b"--batch_abc\r\n")
+
+    # Act
+    first = parser.feed(BATCH_TEXT[:split])
+    rest = parser.feed(BATCH_TEXT[split:])
+
+    # Assert
+    assert [p.request_id for p in first] == ["request-1"]
+    assert [p.request_id for p in rest] == ["request-2"]
+    assert parser.done
+
+
+def test_parser_matches_fixture_with_lf_line_endings():
+    """
+    Test parsing the recorded fixture, which uses bare LF line endings.
+    """
+    # Arrange
+    with open(MOCK_BATCH_PATH, "r") as f:
+        batch_json = json.load(f)
+
+    # Act
+    parts = list(iter_batch_parts([batch_json["response_text"].encode()], batch_json["boundary"]))
+
+    # Assert
+    assert [p.request_id for p in parts] == ["1", "2", "3"]
+    assert [p.json()["id"] for p in parts] == ["thread_1", "thread_2", "thread_3"]
+
+
+async def test_aiter_batch_parts():
+    """
+    Test the async variant over an async byte stream.
+    """
+    async def chunks():
+        for i in range(0, len(BATCH_TEXT), 16):
+            yield BATCH_TEXT[i:i + 16]
+
+    parts = [part async for part in aiter_batch_parts(chunks(), BOUNDARY)]
+
+    assert [p.status for p in parts] == [200, 404]
+
+
+def test_batch_request_content_ids_round_trip():
+    """
+    Test that sub-requests of any kind are answered under the Content-ID they were sent with.
+    """
+    # Arrange
+    fake = FakeGmail(num_threads=2, messages_per_thread=1)
+    batch = BatchRequest()
+    thread_id = batch.add("GET", "/gmail/v1/users/me/threads/thread_0?format=metadata",
+                          content_id="thread_0")
+    message_id = batch.add("GET", "/gmail/v1/users/me/messages/thread_0_msg_0")
+    label_id = batch.add("POST", "/gmail/v1/users/me/labels", body={"name": "Later"})
+
+    # Act
+    _, headers, payload = fake.handle("POST", "/batch/gmail/v1",
+                                      {"content-type": batch.content_type}, batch.to_bytes())
+    parts = list(iter_batch_parts([payload], extract_boundary(headers["Content-Type"])))
+
+    # Assert
+    assert [thread_id, message_id, label_id] == ["thread_0", "item-2", "item-3"]
+    assert [part.request_id for part in parts] == batch.content_ids
+    assert parts[0].json()["id"] == "thread_0"
+
+
+def test_batch_request_body_and_boundaries():
+    # Arrange
+    first, second = BatchRequest(), BatchRequest()
+    second.add("POST", "/gmail/v1/users/me/labels", body='{"name": "Later"}')
+
+    # Act
+    body = second.to_bytes()
+
+    # Assert
+    assert first.boundary != second.boundary
+    assert body.startswith(f"--{second.boundary}\r\n".encode())
+    assert body.endswith(f"\r\n--{second.boundary}--\r\n".encode())
+    assert b"Content-Length: 17\r\n\r\n{\"name\": \"Later\"}" in body
+    assert b"".join(second.iter_bytes()) == body
+
+
+def test_batch_request_rejects_header_injection():
+    batch = BatchRequest()
+
+    with pytest.raises(ValueError):
+        batch.add("GET", "/gmail/v1/users/me/threads/x HTTP/1.1\r\nX-Evil: 1")
+    with pytest.raises(ValueError):
+        batch.add("GET", "gmail/v1/users/me/threads")
+    assert len(batch) == 0
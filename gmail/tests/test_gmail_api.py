@@ -1,7 +1,22 @@
+import asyncio
 import pytest
 from unittest.mock import Mock, patch
 import requests
-from app.gmail_api import batch_get_threads, get_recent_thread_ids, get_all_threads
+import httpx
+from app.gmail_api import (
+    batch_get_threads,
+    build_threads_batch,
+    get_recent_thread_ids,
+    get_all_threads,
+    get_all_threads_async,
+    get_many_accounts_async,
+    IncompleteFetch,
+    get_recent_thread_ids_async,
+)
+from app import gmail_api
+from app.model import EmailRecord
+from app.transport import AsyncTransport
+from tests.fake_gmail import FakeGmail
 
 
 def test_get_recent_thread_ids_success(mocker):
@@ -360,5 +375,333 @@ def test_get_all_threads_max_threads_limit(mocker):
     batch_body = batch_call_args.kwargs["data"]
     
     # Count the number of thread requests in the batch body
-    thread_count = batch_body.count("GET /gmail/v1/users/me/threads/")
-    assert thread_count == max_threads
\ No newline at end of file
+    thread_count = batch_body.count(b"GET /gmail/v1/users/me/threads/")
+    assert thread_count == max_threads
+
+async def test_get_all_threads_async_success(mocker):
+    """
+    Test the async pipeline end to end against an in-memory transport.
+    """
+    # Arrange
+    access_token = "test_access_token_12345"
+    boundary = "batch_1234567890"
+    batch_text = (
+        f"--{boundary}\n"
+        "Content-Type: application/http\n"
+        "Content-ID: <response-1>\n\n"
+        "HTTP/1.1 200 OK\n"
+        "Content-Type: application/json\n\n"
+        '{"id": "thread_1", "messages": ['
+        '{"id": "msg_1", "threadId": "thread_1", "snippet": "Test snippet 1", '
+        '"payload": {"headers": [{"name": "From", "value": "sender1@example.com"}, '
+        '{"name": "Subject", "value": "Test Subject 1"}]}}]}\n'
+        f"--{boundary}--\n"
+    )
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        if request.method == "GET":
+            return httpx.Response(200, json={"threads": [{"id": "thread_1"}]})
+        return httpx.Response(
+            200,
+            headers={"Content-Type": f"multipart/mixed; boundary={boundary}"},
+            text=batch_text,
+        )
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    mocker.patch("app.transport.get_transport", return_value=AsyncTransport(client))
+
+    # Act
+    result = await get_all_threads_async(access_token, max_threads=5)
+
+    # Assert
+    assert len(result) == 1
+    assert result[0].id == "msg_1"
+    assert result[0].from_ == "sender1@example.com"
+
+    assert [r.method for r in seen] == ["GET", "POST"]
+    assert seen[0].url.params["q"] == "newer_than:1d"
+    assert seen[0].url.params["maxResults"] == "5"
+    assert seen[0].headers["Authorization"] == f"Bearer {access_token}"
+    assert b"GET /gmail/v1/users/me/threads/thread_1?format=metadata" in seen[1].content
+    assert b"metadataHeaders=From&metadataHeaders=Subject" in seen[1].content
+
+
+async def test_get_recent_thread_ids_async_invalid_token(mocker):
+    """
+    Test that the async list call surfaces HTTP errors.
+    """
+    # Arrange
+    client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(401))
+    )
+    mocker.patch("app.transport.get_transport", return_value=AsyncTransport(client))
+
+    # Act & Assert
+    with pytest.raises(httpx.HTTPStatusError):
+        await get_recent_thread_ids_async("invalid_access_token_12345")
+
+
+def test_get_recent_thread_ids_follows_page_tokens(mocker):
+    """
+    Test that listing keeps requesting pages until max_results threads are collected.
+    """
+    # Arrange
+    pages = [
+        {"threads": [{"id": "thread_1"}, {"id": "thread_2"}], "nextPageToken": "page_2"},
+        {"threads": [{"id": "thread_3"}], "nextPageToken": "page_3"},
+    ]
+    responses = []
+    for page in pages:
+        mock_response = Mock()
+        mock_response.json.return_value = page
+        responses.append(mock_response)
+
+    mock_get = mocker.patch("app.gmail_api.requests.get", side_effect=responses)
+
+    # Act
+    result = get_recent_thread_ids("test_access_token_12345", max_results=3)
+
+    # Assert
+    assert [t["id"] for t in result] == ["thread_1", "thread_2", "thread_3"]
+    assert mock_get.call_count == 2
+    second_params = mock_get.call_args_list[1].kwargs["params"]
+    assert second_params["pageToken"] == "page_2"
+    assert second_params["maxResults"] == 1
+
+
+async def test_get_all_threads_async_paginates_and_chunks(mocker):
+    """
+    Test that a large mailbox is listed across pages and fetched in bounded,
+    concurrently dispatched batches.
+    """
+    # Arrange
+    fake = FakeGmail(num_threads=1200, messages_per_thread=1, latency=0.01)
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            return await fake.httpx_handler(request)
+        finally:
+            in_flight -= 1
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    mocker.patch("app.transport.get_transport", return_value=AsyncTransport(client))
+
+    # Act
+    result = await get_all_threads_async(
+        "test_access_token_12345", max_threads=None, batch_size=100, max_concurrency=3
+    )
+
+    # Assert
+    assert len(result) == 1200
+    assert result[0].thread_id == "thread_0"
+    assert result[-1].thread_id == "thread_1199"
+
+    list_calls = [r for r in fake.requests if r[1] == "/gmail/v1/users/me/threads"]
+    batch_calls = [r for r in fake.requests if r[1] == "/batch/gmail/v1"]
+    assert len(list_calls) == 3
+    assert len(batch_calls) == 12
+    assert peak <= 3 + 1  # batch cap plus the page listing running alongside
+
+
+async def test_get_all_threads_async_rejects_oversized_batches():
+    """
+    Test that batch sizes above Gmail's per-batch limit are refused.
+    """
+    with pytest.raises(ValueError):
+        await get_all_threads_async("test_access_token_12345", batch_size=101)
+
+
+def test_build_threads_batch_fetch_modes():
+    """
+    Test that metadata mode sends a header list and fields mask, and full mode does not.
+    """
+    # Arrange
+    threads = [{"id": "thread_1"}]
+
+    # Act
+    _, metadata_body = build_threads_batch("token", threads, fetch_mode="metadata")
+    _, full_body = build_threads_batch("token", threads, fetch_mode="full")
+
+    # Assert
+    assert (
+        b"GET /gmail/v1/users/me/threads/thread_1?format=metadata"
+        b"&metadataHeaders=From&metadataHeaders=Subject"
+        b"&fields=id,historyId,messages(id,threadId,labelIds,snippet,internalDate,payload/headers) HTTP/1.1"
+    ) in metadata_body
+    assert b"GET /gmail/v1/users/me/threads/thread_1?format=full HTTP/1.1" in full_body
+
+    with pytest.raises(ValueError):
+        build_threads_batch("token", threads, fetch_mode="raw")
+
+
+async def test_get_many_accounts_async_merges_and_reports_errors(mocker):
+    """
+    Test that accounts are fetched concurrently, merged newest first, and that a
+    failing account is reported without failing the others.
+    """
+    # Arrange
+    mailboxes = {}
+    for name, offset in (("alice", 0), ("bob", 30_000)):
+        fake = FakeGmail(num_threads=2, messages_per_thread=1)
+        fake.email_address = f"{name}@example.com"
+        for thread in fake.threads.values():
+            for message in thread["messages"]:
+                message["internalDate"] = str(int(message["internalDate"]) + offset)
+        mailboxes[f"Bearer {name}_token"] = fake
+
+    async def handler(request):
+        fake = mailboxes.get(request.headers["Authorization"])
+        if fake is None:
+            return httpx.Response(401)
+        return await fake.httpx_handler(request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    mocker.patch("app.transport.get_transport", return_value=AsyncTransport(client))
+    mocker.patch.dict(gmail_api._accounts, clear=True)
+
+    # Act
+    emails, errors = await get_many_accounts_async(
+        ["alice_token", "expired_token", "bob_token", "alice_token"], max_threads=10
+    )
+
+    # Assert
+    assert [account for account, _ in emails] == ["bob@example.com"] * 2 + ["alice@example.com"] * 2
+    dates = [record.internal_date for _, record in emails]
+    assert dates == sorted(dates, reverse=True)
+    assert list(errors) == ["account[1]"]
+    assert "401" in errors["account[1]"]
+
+
+async def test_get_many_accounts_async_fetches_each_account_once(mocker):
+    """
+    Test that two different tokens for the same mailbox load it only once.
+    """
+    # Arrange
+    async def account(access_token):
+        return "alice@example.com"
+
+    async def load(access_token):
+        return [EmailRecord(f"{access_token}_1", "t1", "Hi", None, None, 1000)]
+
+    mocker.patch("app.gmail_api.get_account_async", side_effect=account)
+
+    # Act
+    emails, errors = await get_many_accounts_async(["old_token", "new_token"], load=load)
+
+    # Assert
+    assert [account for account, _ in emails] == ["alice@example.com"]
+    assert errors == {}
+
+
+async def test_get_many_accounts_async_caps_concurrency():
+    """
+    Test that no more than max_concurrency accounts are loaded at once.
+    """
+    # Arrange
+    in_flight = 0
+    peak = 0
+
+    async def load(access_token):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return []
+
+    tokens = [f"token_{i}" for i in range(10)]
+    gmail_api._accounts.update({token: f"{token}@example.com" for token in tokens})
+
+    # Act
+    emails, errors = await get_many_accounts_async(tokens, max_concurrency=3, load=load)
+
+    # Assert
+    assert emails == [] and errors == {}
+    assert peak == 3
+
+
+@pytest.mark.fake_gmail(messages_per_thread=1, max_attempts=3)
+async def test_get_all_threads_async_retries_failed_batch_parts(fake_gmail):
+    """
+    Test that rate-limited and failed parts are retried on their own, and that
+    threads failing every attempt are reported as dropped.
+    """
+    # Arrange
+    fake = fake_gmail
+    fake.request_faults = [429]  # threads.list is rate limited once
+    fake.part_faults = {
+        "thread_1": [429],
+        "thread_2": [503, 500],
+        "thread_3": [500, 500, 500],
+        "thread_4": [400],
+    }
+    dropped = []
+
+    # Act
+    result = await get_all_threads_async("test_access_token_12345", max_threads=10,
+                                         dropped=dropped)
+
+    # Assert
+    assert [email.thread_id for email in result] == ["thread_0", "thread_1", "thread_2"]
+    assert sorted(dropped) == ["thread_3", "thread_4"]
+    batch_calls = [r for r in fake.requests if r[1] == "/batch/gmail/v1"]
+    assert len(batch_calls) == 3
+    assert gmail_api.get_scheduler().retries == 1 + 2
+
+
+@pytest.mark.fake_gmail(messages_per_thread=1, max_attempts=3)
+async def test_get_all_threads_async_raises_for_dropped_threads(fake_gmail):
+    # Arrange
+    fake = fake_gmail
+    fake.part_faults = {"thread_0": [500] * 3}
+
+    # Act & Assert
+    with pytest.raises(IncompleteFetch) as error:
+        await get_all_threads_async("test_access_token_12345", max_threads=10)
+    assert error.value.thread_ids == ["thread_0"]
+
+
+@pytest.mark.fake_gmail(messages_per_thread=1, max_attempts=3)
+async def test_get_all_threads_async_skips_deleted_threads(fake_gmail):
+    """
+    Test that threads deleted between listing and fetching are not reported as dropped.
+    """
+    # Arrange
+    fake = fake_gmail
+    fake.part_faults = {"thread_2": [404]}
+    dropped = []
+
+    # Act
+    result = await get_all_threads_async("test_access_token_12345", max_threads=10,
+                                         dropped=dropped)
+
+    # Assert
+    assert len(result) == 4
+    assert dropped == []
+
+
+@pytest.mark.fake_gmail(realistic=40, seed=1, error_rate=0.1, max_attempts=6)
+async def test_get_all_threads_async_recovers_from_random_errors(fake_gmail):
+    """
+    Test a generated mailbox served with random 429/5xx errors: every message
+    arrives once the failed requests and parts are retried.
+    """
+    # Arrange
+    fake = fake_gmail
+    messages = sum(len(thread["messages"]) for thread in fake.threads.values())
+
+    # Act
+    result = await get_all_threads_async("test_access_token_12345", max_threads=None,
+                                         batch_size=10)
+
+    # Assert
+    assert len(result) == messages > 40
+    assert list(dict.fromkeys(email.thread_id for email in result)) == list(fake.threads)
+    assert gmail_api.get_scheduler().retries > 0
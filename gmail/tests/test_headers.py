@@ -0,0 +1,67 @@
+from app.gmail_api import extract_from_and_subject
+from app.headers import Address, decode_words, find_headers, parse_address
+
+
+def test_find_headers_is_case_insensitive_and_first_wins():
+    """
+    Test that header names match regardless of case and the first occurrence is used.
+    """
+    # Arrange
+    headers = [
+        {"name": "Received", "value": "from mx1"},
+        {"name": "SUBJECT", "value": "First"},
+        {"name": "from", "value": "a@example.com"},
+        {"name": "Subject", "value": "Second"},
+    ]
+
+    # Act
+    values = find_headers(headers, ("From", "Subject", "Date"))
+
+    # Assert
+    assert values == ["a@example.com", "First", None]
+
+
+def test_find_headers_stops_once_all_are_found():
+    # Arrange
+    class Headers(list):
+        read = 0
+
+        def __iter__(self):
+            for header in super().__iter__():
+                Headers.read += 1
+                yield header
+
+    headers = Headers([{"name": "From", "value": "a@example.com"},
+                       {"name": "Subject", "value": "Hi"}]
+                      + [{"name": "X-Filler", "value": "x"}] * 50)
+
+    # Act
+    find_headers(headers, ("From", "Subject"))
+
+    # Assert
+    assert Headers.read == 2
+
+
+def test_decode_words_rfc2047():
+    assert decode_words("=?UTF-8?B?SGVsbG8gd8O2cmxk?=") == "Hello wörld"
+    assert decode_words("=?ISO-8859-1?Q?Caf=E9?= menu") == "Café menu"
+    assert decode_words("plain") == "plain"
+    assert decode_words(None) is None
+
+
+def test_parse_address_splits_name_and_address():
+    assert parse_address('"Doe, Jane" <jane@example.com>') == Address("Doe, Jane", "jane@example.com")
+    assert parse_address("=?UTF-8?Q?J=C3=BCrgen?= <j@example.com>") == Address("Jürgen", "j@example.com")
+    assert parse_address("bare@example.com") == Address(None, "bare@example.com")
+    assert parse_address(None) == Address(None, None)
+
+
+def test_extract_from_and_subject_decodes_encoded_words():
+    # Arrange
+    message = {"payload": {"headers": [
+        {"name": "from", "value": "=?UTF-8?Q?J=C3=BCrgen?= <j@example.com>"},
+        {"name": "Subject", "value": "=?UTF-8?B?R3LDvMOfZQ==?="},
+    ]}}
+
+    # Act & Assert
+    assert extract_from_and_subject(message) == ("Jürgen <j@example.com>", "Grüße")
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+
+# Import cost of the server's own modules on top of FastMCP, which the server
+# cannot start without. Generous so a slow CI machine does not flake; raise
+# GMAIL_IMPORT_BUDGET_MS locally to investigate a regression.
+IMPORT_BUDGET_MS = float(os.environ.get("GMAIL_IMPORT_BUDGET_MS", 150))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(tmp_path, statement: str):
+    """
+    Run `statement` in a fresh interpreter with -X importtime, from a scratch
+    directory. Returns cumulative microseconds by module name.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=tmp_path, env={**os.environ, "PYTHONPATH": ROOT},
+        capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_server_import_is_lazy(tmp_path):
+    """
+    Test that importing the server skips deferred dependencies and side effects.
+    """
+    # Act
+    times = import_times(tmp_path, "import app.main")
+
+    # Assert
+    assert "app.main" in times
+    assert "requests" not in times
+    assert not (tmp_path / "gmail_mcp_server.log").exists()
+
+
+def test_server_import_budget(tmp_path):
+    """
+    Test that the server's own modules stay within the import-time budget.
+    """
+    # Act
+    times = import_times(tmp_path, "import mcp.server.fastmcp; import app.main")
+
+    # Assert
+    assert times["app.main"] / 1000 < IMPORT_BUDGET_MS
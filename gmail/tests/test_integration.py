@@ -10,6 +10,7 @@ dotenv.load_dotenv()
 PARENT_DIR = Path(__file__).parent
 MOCK_THREADS_PATH = PARENT_DIR / "fixtures" / "mock_threads_response.json"
 MOCK_BATCH_PATH = PARENT_DIR / "fixtures" / "mock_batch_response.json"
+MOCK_METADATA_BATCH_PATH = PARENT_DIR / "fixtures" / "mock_metadata_batch_response.json"
 
 def test_get_all_threads_integration(mocker):
     """
@@ -56,4 +57,42 @@ def test_get_all_threads_integration(mocker):
         assert result[i].snippet == expected_email["snippet"]
         assert result[i].from_ == expected_email["from_"]
         assert result[i].subject == expected_email["subject"]
-    
\ No newline at end of file
+
+
+def test_get_all_threads_metadata_integration(mocker):
+    """
+    Test get_all_threads against a format=metadata batch response.
+    """
+    # Arrange
+    access_token = "test_access_token_12345"
+
+    with open(MOCK_THREADS_PATH, 'r') as f:
+        thread_json = json.load(f)
+
+    with open(MOCK_METADATA_BATCH_PATH, 'r') as f:
+        batch_json = json.load(f)
+
+    mock_get_recent_thread_ids = mocker.patch("app.gmail_api.get_recent_thread_ids")
+    mock_get_recent_thread_ids.return_value = thread_json["threads"]
+
+    mock_response = Mock()
+    mock_response.headers = batch_json["headers"]
+    mock_response.text = batch_json["response_text"]
+    mock_response.raise_for_status = Mock()
+
+    mock_batch_get_threads = mocker.patch("app.gmail_api.batch_get_threads")
+    mock_batch_get_threads.return_value = mock_response
+
+    # Act
+    result = get_all_threads(access_token, 30, fetch_mode="metadata")
+
+    # Assert
+    batch_body = mock_batch_get_threads.call_args.args[2]
+    assert batch_body.count(b"format=metadata") == len(thread_json["threads"])
+    assert b"format=full" not in batch_body
+
+    assert len(result) == len(batch_json["expected_emails"])
+    for i, expected_email in enumerate(batch_json["expected_emails"]):
+        assert result[i].id == expected_email["id"]
+        assert result[i].from_ == expected_email["from_"]
+        assert result[i].subject == expected_email["subject"]
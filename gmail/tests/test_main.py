@@ -1,9 +1,11 @@
+import httpx
 import pytest
 from unittest.mock import Mock
-from app.main import fetch_recent_emails
-from app.model import EmailPreview, FetchRecentEmailsRequest, FetchRecentEmailsResponse
+from app.main import fetch_recent_emails, fetch_recent_emails_many, main, mcp, search_emails, server_stats
+from app.model import EmailPreview, EmailRecord, FetchRecentEmailsRequest, FetchRecentEmailsResponse
+from app.response_cache import ResponseCache
 
-def test_fetch_recent_emails_success(mocker):
+async def test_fetch_recent_emails_success(mocker):
     """
     Test successful email retrieval with valid access token.
     """
@@ -28,11 +30,11 @@ def test_fetch_recent_emails_success(mocker):
         ),
     ]
     
-    mock_get = mocker.patch("app.main.get_all_threads")
+    mock_get = mocker.patch("app.main.get_all_threads_async")
     mock_get.return_value = mock_emails
     
     # Act
-    result = fetch_recent_emails(access_token)
+    result = await fetch_recent_emails(access_token)
     
     # Assert    
     # Assert: Verify return type
@@ -48,10 +50,243 @@ def test_fetch_recent_emails_success(mocker):
     assert result.emails[1].from_ == "test2@example.com"
     assert result.emails[1].subject == "Subject 2"
     
-    # Verify get_all_threads was called with correct parameters
+    # Verify get_all_threads_async was called with correct parameters
     mock_get.assert_called_once()
     call_args = mock_get.call_args
     # access_token is passed as positional argument (first arg)
     assert call_args.args[0] == access_token
     # max_threads is passed as keyword argument
-    assert call_args.kwargs["max_threads"] == 20
\ No newline at end of file
+    assert call_args.kwargs["max_threads"] == 20
+
+async def test_fetch_recent_emails_uses_cache(mocker):
+    """
+    Test that metadata fetches are served through the synced message cache.
+    """
+    # Arrange
+    access_token = "test_access_token_12345"
+    store = Mock()
+    mocker.patch("app.main.get_store", return_value=store)
+    mock_sync = mocker.patch("app.main.sync_recent_emails")
+    mock_sync.return_value = [
+        EmailPreview(id="email_1", thread_id="thread_1", snippet="Test email 1",
+                     from_="test1@example.com", subject="Subject 1"),
+    ]
+    mock_get = mocker.patch("app.main.get_all_threads_async")
+
+    # Act
+    result = await fetch_recent_emails(access_token)
+
+    # Assert
+    assert [e.id for e in result.emails] == ["email_1"]
+    mock_sync.assert_called_once_with(access_token, store, max_threads=20)
+    mock_get.assert_not_called()
+
+
+async def test_fetch_recent_emails_repeated_calls_hit_response_cache(mocker):
+    """
+    Test that identical calls for one account are served from the response cache.
+    """
+    # Arrange
+    access_token = "test_access_token_12345"
+    cache = ResponseCache(ttl=60)
+    mocker.patch("app.main.response_cache", cache)
+    mocker.patch("app.main.get_account_async", return_value="me@example.com")
+    mock_get = mocker.patch("app.main.get_all_threads_async")
+    mock_get.return_value = [
+        EmailPreview(id="email_1", thread_id="thread_1", snippet="Test email 1",
+                     from_="test1@example.com", subject="Subject 1"),
+    ]
+
+    # Act
+    first = await fetch_recent_emails(access_token)
+    second = await fetch_recent_emails(access_token)
+    other_mode = await fetch_recent_emails(access_token, fetch_mode="full")
+
+    # Assert
+    assert first == second == other_mode
+    assert mock_get.call_count == 2
+    assert server_stats()["response_cache"]["hits"] == 1
+
+
+async def test_fetch_recent_emails_pages_with_cursor(mocker):
+    """
+    Test that large results are split into pages linked by next_cursor.
+    """
+    # Arrange
+    access_token = "test_access_token_12345"
+    mock_get = mocker.patch("app.main.get_all_threads_async")
+    mock_get.return_value = [
+        EmailPreview(id=f"email_{i}", thread_id=f"thread_{i}", snippet="Test email " * 20,
+                     from_=f"test{i}@example.com", subject=None)
+        for i in range(20)
+    ]
+
+    # Act
+    first = await fetch_recent_emails(access_token, max_bytes=1000)
+    second = await fetch_recent_emails(access_token, max_bytes=1000, cursor=first.next_cursor)
+
+    # Assert
+    assert first.total == 20
+    assert 0 < len(first.emails) < 20
+    assert second.emails[0].id == f"email_{len(first.emails)}"
+    assert '"subject"' not in first.model_dump_json()
+
+
+async def test_fetch_recent_emails_many_returns_partial_results(mocker):
+    """
+    Test that the multi-account tool merges accounts and lists failures.
+    """
+    # Arrange
+    records = {
+        "alice_token": [EmailRecord("a1", "t1", "Hi from Alice", "alice@example.com", None, 1000)],
+        "bob_token": [EmailRecord("b1", "t2", "Hi from Bob", "bob@example.com", "Hello", 2000)],
+    }
+
+    async def load(access_token, max_threads, fetch_mode, include_body=False):
+        if access_token not in records:
+            raise httpx.HTTPStatusError("401 Unauthorized", request=None, response=None)
+        return records[access_token], []
+
+    async def account(access_token):
+        return access_token.removesuffix("_token") + "@example.com"
+
+    mocker.patch("app.main.load_recent_emails", side_effect=load)
+    mocker.patch("app.gmail_api.get_account_async", side_effect=account)
+
+    # Act
+    result = await fetch_recent_emails_many(["alice_token", "bob_token", "carol_token"])
+
+    # Assert
+    assert [(e.account, e.id) for e in result.emails] == [
+        ("bob@example.com", "b1"), ("alice@example.com", "a1"),
+    ]
+    assert [(e.account, e.error) for e in result.errors] == [
+        ("carol@example.com", "HTTPStatusError: 401 Unauthorized"),
+    ]
+
+
+async def test_fetch_recent_emails_many_pages_within_budget(mocker):
+    """
+    Test that the multi-account tool returns pages that fit max_bytes and keep their accounts.
+    """
+    # Arrange
+    records = {
+        f"{name}_token": [EmailRecord(f"{name}{i}", f"t{i}", "x" * 100, None, None, offset + i)
+                          for i in range(5)]
+        for name, offset in (("alice", 0), ("bob", 1000))
+    }
+
+    async def load(access_token, max_threads, fetch_mode, include_body=False):
+        return records[access_token], []
+
+    async def account(access_token):
+        return access_token.removesuffix("_token") + "@example.com"
+
+    mocker.patch("app.main.load_recent_emails", side_effect=load)
+    mocker.patch("app.gmail_api.get_account_async", side_effect=account)
+
+    # Act
+    pages = [await fetch_recent_emails_many(["alice_token", "bob_token"], max_bytes=600)]
+    while pages[-1].next_cursor:
+        pages.append(await fetch_recent_emails_many(["alice_token", "bob_token"], max_bytes=600,
+                                                    cursor=pages[-1].next_cursor))
+
+    # Assert
+    assert len(pages) > 1
+    assert all(len(page.model_dump_json(by_alias=True)) < 800 for page in pages)
+    emails = [(e.account, e.id) for page in pages for e in page.emails]
+    assert emails == [("bob@example.com", f"bob{i}") for i in reversed(range(5))] + \
+        [("alice@example.com", f"alice{i}") for i in reversed(range(5))]
+    assert pages[0].total == 10
+
+
+async def test_fetch_recent_emails_reports_dropped_threads(mocker):
+    """
+    Test that threads lost after retries are reported and the partial result is not cached.
+    """
+    # Arrange
+    access_token = "test_access_token_12345"
+    mocker.patch("app.main.response_cache", ResponseCache(ttl=60))
+    mocker.patch("app.main.get_account_async", return_value="me@example.com")
+
+    async def fetch(access_token, max_threads, fetch_mode, dropped, include_body):
+        dropped.append("thread_2")
+        return [EmailRecord("email_1", "thread_1", "Test email 1", None, None)]
+
+    mock_get = mocker.patch("app.main.get_all_threads_async", side_effect=fetch)
+
+    # Act
+    first = await fetch_recent_emails(access_token)
+    second = await fetch_recent_emails(access_token)
+
+    # Assert
+    assert first.dropped_thread_ids == ["thread_2"]
+    assert '"dropped_thread_ids":["thread_2"]' in first.model_dump_json()
+    assert second == first
+    assert mock_get.call_count == 2
+
+
+@pytest.mark.fake_gmail(num_threads=2, messages_per_thread=1)
+async def test_fetch_recent_emails_include_body(fake_gmail):
+    """
+    Test that bodies are fetched in full mode, decoded and truncated only when asked for.
+    """
+    # Act
+    previews = await fetch_recent_emails("test_access_token_12345")
+    with_bodies = await fetch_recent_emails("test_access_token_12345", include_body=True,
+                                            body_chars=40)
+
+    # Assert
+    assert all(email.body is None for email in previews.emails)
+    assert '"body"' not in previews.model_dump_json()
+    body = with_bodies.emails[0].body
+    assert body.startswith("Paragraph 0 of message 0 in thread_0.")
+    assert len(body) == 40 and body.endswith("…")
+
+
+async def test_search_emails_builds_query(mocker):
+    """
+    Test that tool arguments become a SearchQuery and results are paged.
+    """
+    # Arrange
+    records = [EmailRecord(f"email_{i}", f"thread_{i}", "Invoice attached", "bob@example.com",
+                           "Invoice", 1_714_600_000_000 - i) for i in range(3)]
+    mocker.patch("app.main.get_store", return_value=None)
+    mock_search = mocker.patch("app.main.run_search", return_value=(records, "gmail"))
+
+    # Act
+    response = await search_emails("test_access_token_12345", query="invoice",
+                                   sender="bob", after="2024-05-01", before="2024-05-02T12:00:00+02:00")
+
+    # Assert
+    query = mock_search.call_args.args[2]
+    assert (query.text, query.sender, query.subject) == ("invoice", "bob", None)
+    assert query.since_ms == 1_714_521_600_000
+    assert query.until_ms == 1_714_644_000_000
+    assert response.source == "gmail"
+    assert response.total == 3
+    assert [email.id for email in response.emails] == ["email_0", "email_1", "email_2"]
+
+
+def test_main_runs_selected_transport(mocker, monkeypatch):
+    """
+    Test that main serves stdio by default and HTTP on the requested address,
+    stopping the prefetch workers when the server stops.
+    """
+    # Arrange
+    stdio = mocker.patch.object(mcp, "run_stdio_async")
+    http = mocker.patch.object(mcp, "run_streamable_http_async")
+    aclose_prefetchers = mocker.patch("app.main.aclose_prefetchers")
+    mocker.patch("app.main.configure_logging")
+    mocker.patch.object(mcp.settings, "host", mcp.settings.host)
+    mocker.patch.object(mcp.settings, "port", mcp.settings.port)
+    monkeypatch.delenv("GMAIL_MCP_TRANSPORT", raising=False)
+
+    # Act
+    main([])
+    main(["--transport", "streamable-http", "--host", "0.0.0.0", "--port", "9100"])
+
+    # Assert
+    assert (stdio.await_count, http.await_count) == (1, 1)
+    assert aclose_prefetchers.await_count == 2
+    assert (mcp.settings.host, mcp.settings.port) == ("0.0.0.0", 9100)
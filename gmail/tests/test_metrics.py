@@ -0,0 +1,119 @@
+from contextlib import contextmanager
+
+import httpx
+import pytest
+from app.gmail_api import get_all_threads_async
+from app.main import METRICS_PATH, mcp, server_stats
+from app.metrics import Histogram, Metrics, metrics
+
+# Fetches go through a scheduler that neither sleeps nor enforces quota.
+pytestmark = pytest.mark.fake_gmail(max_attempts=2)
+
+
+@pytest.fixture
+def fresh_metrics():
+    metrics.reset()
+    yield metrics
+    metrics.reset()
+
+
+def test_histogram_buckets_and_quantiles():
+    """
+    Test cumulative bucket counts and the bucket-bound quantile estimate.
+    """
+    # Arrange
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+
+    # Act
+    for value in (0.005, 0.05, 0.05, 0.5, 3.0):
+        histogram.observe(value)
+
+    # Assert
+    assert list(histogram.cumulative()) == [("0.01", 1), ("0.1", 3), ("1.0", 4), ("+Inf", 5)]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.99) == 3.0
+    assert histogram.sum == pytest.approx(3.605)
+
+
+async def test_fetch_records_every_pipeline_stage(fake_gmail, fresh_metrics):
+    """
+    Test that one fetch observes each stage and counts bytes both ways.
+    """
+    # Act
+    emails = await get_all_threads_async("token", max_threads=5)
+
+    # Assert
+    snapshot = fresh_metrics.snapshot()
+    stages = snapshot["stages"]
+    assert {"list", "batch_build", "batch_http", "parse", "decode", "extract"} <= set(stages)
+    assert stages["extract"]["count"] == 5
+    assert stages["batch_http"]["count"] == 1
+    counters = snapshot["counters"]
+    assert counters["bytes_sent"]["kind=batch"] > 0
+    assert counters["bytes_received"]["kind=batch"] > counters["bytes_received"]["kind=list"] > 0
+    assert len(emails) == 10
+
+
+async def test_gmail_errors_are_counted_by_status(fake_gmail, fresh_metrics):
+    """
+    Test that failed requests and failed batch parts are counted separately.
+    """
+    # Arrange
+    fake_gmail.request_faults = [503]
+    fake_gmail.part_faults = {"thread_1": [404]}
+
+    # Act
+    await get_all_threads_async("token", max_threads=5)
+
+    # Assert
+    errors = fresh_metrics.snapshot()["counters"]["api_errors"]
+    assert errors == {"scope=request,status=503": 1, "scope=part,status=404": 1}
+
+
+async def test_metrics_endpoint_serves_openmetrics(fake_gmail, fresh_metrics):
+    """
+    Test the scrape endpoint's format and that server_stats carries the same data.
+    """
+    # Arrange
+    await get_all_threads_async("token", max_threads=5)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mcp.streamable_http_app()),
+                               base_url="http://testserver")
+
+    # Act
+    response = await client.get(METRICS_PATH)
+
+    # Assert
+    assert response.headers["content-type"].startswith("application/openmetrics-text")
+    lines = response.text.splitlines()
+    assert "# TYPE gmail_stage_seconds histogram" in lines
+    assert 'gmail_stage_seconds_bucket{stage="extract",le="+Inf"} 5' in lines
+    assert 'gmail_stage_seconds_count{stage="list"} 1' in lines
+    assert any(line.startswith('gmail_bytes_received_total{kind="batch"} ') for line in lines)
+    assert any(line.startswith("gmail_response_cache_hits ") for line in lines)
+    assert lines[-1] == "# EOF"
+    assert server_stats()["pipeline"]["stages"]["extract"]["count"] == 5
+
+
+def test_stages_become_spans_when_tracing():
+    """
+    Test that each stage opens a span, without needing OpenTelemetry installed.
+    """
+    # Arrange
+    spans = []
+
+    class FakeTracer:
+        @contextmanager
+        def start_as_current_span(self, name, attributes=None):
+            spans.append((name, attributes))
+            yield
+
+    registry = Metrics(tracing=False)
+    registry._tracer = FakeTracer()
+
+    # Act
+    with registry.stage("batch_http", threads=5):
+        pass
+
+    # Assert
+    assert spans == [("batch_http", {"threads": 5})]
+    assert registry.stages["batch_http"].count == 1
@@ -0,0 +1,98 @@
+import base64
+
+from app.gmail_api import extract_email_content
+from app.mime import LazyBody, find_body_part, html_to_text, lazy_body
+from tests.fake_gmail import make_message
+
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def html_message(html: str) -> dict:
+    return {
+        "id": "msg_1", "threadId": "thread_1", "snippet": "",
+        "payload": {
+            "mimeType": "multipart/mixed",
+            "parts": [
+                {"mimeType": "text/html", "filename": "",
+                 "headers": [{"name": "Content-Type", "value": "text/html; charset=UTF-8"}],
+                 "body": {"data": b64(html.encode())}},
+                # Not valid base64: decoding it would raise.
+                {"mimeType": "text/plain", "filename": "notes.txt", "body": {"data": "!!!"}},
+            ],
+        },
+    }
+
+
+def test_find_body_part_prefers_plain_text():
+    """
+    Test that text/plain wins over text/html inside multipart/alternative.
+    """
+    # Arrange
+    message = make_message("thread_1", 0)
+
+    # Act
+    part = find_body_part(message["payload"])
+
+    # Assert
+    assert part["partId"] == "0.0"
+    assert str(lazy_body(message)).startswith("Paragraph 0 of message 0 in thread_1.")
+
+
+def test_html_fallback_is_stripped_and_attachments_are_skipped():
+    """
+    Test that an HTML-only message is returned as text and attachment data is not decoded.
+    """
+    # Arrange
+    message = html_message(
+        "<html><head><style>p {color: red}</style></head><body>"
+        "<p>Hello&nbsp;<b>there</b> &amp; welcome</p><script>alert(1)</script>"
+        "<div>Second   line</div></body></html>"
+    )
+
+    # Act
+    body = lazy_body(message)
+
+    # Assert
+    assert body.text == "Hello\xa0there & welcome\n\nSecond line"
+
+
+def test_lazy_body_decodes_once(mocker):
+    # Arrange
+    part_text = mocker.patch("app.mime.part_text", return_value="decoded")
+    body = lazy_body(make_message("thread_1", 0))
+
+    # Act
+    first, second = body.text, str(body)
+
+    # Assert
+    assert first == second == "decoded"
+    part_text.assert_called_once()
+
+
+def test_body_charset_is_honoured():
+    # Arrange
+    message = {"payload": {"mimeType": "text/plain", "filename": "",
+                           "headers": [{"name": "Content-Type", "value": 'text/plain; charset="iso-8859-1"'}],
+                           "body": {"data": b64("Café".encode("latin-1"))}}}
+
+    # Act & Assert
+    assert lazy_body(message).text == "Café"
+
+
+def test_extract_email_content_bodies_are_opt_in():
+    # Arrange
+    thread = {"messages": [make_message("thread_1", 0)]}
+
+    # Act
+    previews = extract_email_content([thread])
+    with_bodies = extract_email_content([thread], include_body=True)
+
+    # Assert
+    assert previews[0].body is None
+    assert isinstance(with_bodies[0].body, LazyBody)
+
+
+def test_html_to_text_keeps_block_breaks():
+    assert html_to_text("<ul><li>one</li><li>two</li></ul>") == "one\n\ntwo"
@@ -0,0 +1,34 @@
+from app.model import EmailPreview, EmailRecord, FetchRecentEmailsResponse
+
+FIELDS = dict(id="msg_1", thread_id="thread_1", snippet="Test snippet",
+              from_="sender@example.com", subject=None)
+
+
+def test_from_records_matches_validated_response():
+    """
+    Test that a response built from records equals one built from previews.
+    """
+    # Arrange
+    records = [EmailRecord(**FIELDS), EmailRecord(**{**FIELDS, "id": "msg_2"})]
+
+    # Act
+    response = FetchRecentEmailsResponse.from_records(records)
+
+    # Assert
+    expected = FetchRecentEmailsResponse(emails=[
+        EmailPreview(**FIELDS), EmailPreview(**{**FIELDS, "id": "msg_2"})
+    ])
+    assert response == expected
+    assert all(isinstance(email, EmailPreview) for email in response.emails)
+    assert response.model_dump_json() == expected.model_dump_json()
+
+
+def test_from_records_accepts_previews():
+    """
+    Test that already-validated previews pass through unchanged.
+    """
+    preview = EmailPreview(**FIELDS)
+
+    response = FetchRecentEmailsResponse.from_records([preview, EmailRecord(**FIELDS)])
+
+    assert response.emails == [preview, preview]
@@ -0,0 +1,90 @@
+import pytest
+from app.model import EmailRecord
+from app.pagination import compact_size, decode_cursor, encode_cursor, paginate, truncate
+
+
+def make_records(count, snippet="Test snippet " * 10):
+    return [
+        EmailRecord(id=f"msg_{i}", thread_id=f"thread_{i}", snippet=snippet,
+                    from_=f"sender{i}@example.com", subject=None)
+        for i in range(count)
+    ]
+
+
+def test_pages_cover_all_records_within_budget():
+    """
+    Test that following cursors visits every record once, each page within budget.
+    """
+    # Arrange
+    records = make_records(50)
+    budget = 1000
+
+    # Act
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        page, cursor = paginate(records, cursor, max_bytes=budget)
+        pages += 1
+        assert sum(compact_size(r) for r in page) <= budget
+        seen.extend(r.id for r in page)
+        if cursor is None:
+            break
+
+    # Assert
+    assert seen == [r.id for r in records]
+    assert pages > 1
+
+
+def test_token_budget_and_snippet_truncation():
+    """
+    Test that max_tokens tightens the budget and long snippets are truncated.
+    """
+    # Arrange
+    records = make_records(10, snippet="x" * 500)
+
+    # Act
+    page, cursor = paginate(records, max_bytes=None, max_tokens=100, snippet_chars=50)
+
+    # Assert
+    assert all(len(r.snippet) == 50 and r.snippet.endswith("…") for r in page)
+    assert sum(compact_size(r) for r in page) <= 400
+    assert cursor is not None
+
+
+def test_oversized_record_still_makes_progress():
+    """
+    Test that a page holds at least one record even when it exceeds the budget.
+    """
+    page, cursor = paginate(make_records(2), max_bytes=1)
+
+    assert [r.id for r in page] == ["msg_0"]
+    assert cursor is not None
+
+
+def test_cursor_resumes_after_same_message_when_new_mail_arrives():
+    """
+    Test that records inserted at the top between pages do not shift the next page.
+    """
+    # Arrange
+    records = make_records(10)
+    first, cursor = paginate(records, max_bytes=300)
+
+    # Act
+    newer = [EmailRecord("msg_new", "thread_new", "new", None, None)] + records
+    second, _ = paginate(newer, cursor, max_bytes=300)
+
+    # Assert
+    assert second[0].id == records[len(first)].id
+
+
+def test_cursor_round_trip_and_invalid_cursor():
+    assert decode_cursor(encode_cursor("msg_3", 4)) == ("msg_3", 4)
+    with pytest.raises(ValueError):
+        paginate(make_records(2), cursor="not-a-cursor")
+
+
+def test_compact_size_drops_nulls():
+    record = EmailRecord("m", "t", "s", None, None)
+    assert compact_size(record) == len('{"id":"m","thread_id":"t","snippet":"s"}') + 1
+    assert truncate("short", 10) == "short"
@@ -0,0 +1,202 @@
+import asyncio
+
+import httpx
+import pytest
+from app import main
+from app.main import fetch_recent_emails, mcp
+from app.prefetch import PrefetchWorker, parse_push, push_envelope
+from app.response_cache import ResponseCache
+
+
+@pytest.fixture
+async def worker(store):
+    worker = PrefetchWorker(store, interval=60)
+    yield worker
+    await worker.aclose()
+
+
+async def wait_for(condition, timeout: float = 2.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+async def test_registered_account_is_answered_without_gmail(fake_gmail, worker, mock_access_token):
+    """
+    Test that after the background sync, recent messages come from the store alone.
+    """
+    # Arrange
+    account = await worker.register(mock_access_token, max_threads=10)
+    await wait_for(lambda: worker.syncs == 1)
+    fake_gmail.requests.clear()
+
+    # Act
+    emails = await worker.recent_messages(mock_access_token, account, max_threads=10)
+
+    # Assert
+    assert account == "me@example.com"
+    assert len(emails) == 10
+    assert fake_gmail.requests == []
+    assert await worker.recent_messages(mock_access_token, account, max_threads=20) is None
+
+
+async def test_notification_triggers_a_resync(fake_gmail, worker, mock_access_token):
+    """
+    Test that a push notification marks the account stale and syncs the new mail.
+    """
+    # Arrange
+    account = await worker.register(mock_access_token, max_threads=10)
+    await wait_for(lambda: worker.syncs == 1)
+    fake_gmail.add_message("thread_new")
+
+    # Act
+    known = worker.notify(account)
+    stale = await worker.recent_messages(mock_access_token, account, max_threads=10)
+    await wait_for(lambda: worker.syncs == 2)
+
+    # Assert
+    assert known and stale is None
+    emails = await worker.recent_messages(mock_access_token, account, max_threads=10)
+    assert "thread_new" in {e.thread_id for e in emails}
+    assert not worker.notify("someone@example.com")
+
+
+async def test_expired_token_waits_for_a_new_one(fake_gmail, worker, mock_access_token):
+    """
+    Test that a 401 parks the account until a tool call brings a fresh token.
+    """
+    # Arrange
+    account = await worker.register(mock_access_token, max_threads=10)
+    await wait_for(lambda: worker.syncs == 1)
+    fake_gmail.request_faults.append(401)
+    worker.notify(account)
+    await wait_for(lambda: worker.stats()["failing"] == [account])
+    fake_gmail.requests.clear()
+
+    # Act
+    await asyncio.sleep(0.05)
+    idle = list(fake_gmail.requests)
+    await worker.recent_messages("new_token", account, max_threads=10)
+    await wait_for(lambda: worker.syncs == 2)
+
+    # Assert
+    assert idle == []
+    assert worker.accounts[account].access_token == "new_token"
+    assert worker.stats()["failing"] == []
+
+
+async def test_watch_is_registered_with_a_topic(fake_gmail, store, mock_access_token):
+    """
+    Test that users.watch is called once per account when a Pub/Sub topic is set.
+    """
+    # Arrange
+    worker = PrefetchWorker(store, interval=60, topic="projects/p/topics/gmail")
+
+    # Act
+    account = await worker.register(mock_access_token, max_threads=10)
+    await wait_for(lambda: worker.syncs == 1)
+    worker.notify(account)
+    await wait_for(lambda: worker.syncs == 2)
+    await worker.aclose()
+
+    # Assert
+    assert fake_gmail.watches == ["projects/p/topics/gmail"]
+    assert worker.accounts[account].watch_expires_ms is not None
+
+
+async def test_failing_watch_does_not_stop_polling(fake_gmail, store, mock_access_token):
+    """
+    Test that a rejected users.watch is reported and retried while the account still syncs.
+    """
+    # Arrange
+    worker = PrefetchWorker(store, interval=60, topic="projects/p/topics/missing")
+
+    # Act
+    account = await worker.register(mock_access_token, max_threads=10)
+    fake_gmail.request_faults.append(400)  # the watch call comes first
+    await wait_for(lambda: worker.syncs == 1)
+    failing = worker.stats()
+    worker.notify(account)
+    await wait_for(lambda: worker.syncs == 2)
+    await worker.aclose()
+
+    # Assert
+    assert failing["failing"] == [] and failing["watch_failing"] == [account]
+    assert await worker.recent_messages(mock_access_token, account, max_threads=10) is not None
+    assert fake_gmail.watches == ["projects/p/topics/missing"]
+    assert worker.stats()["watch_failing"] == []
+
+
+def test_push_envelope_round_trips():
+    """
+    Test that a Pub/Sub push body decodes to its account and historyId.
+    """
+    # Act / Assert
+    assert parse_push(push_envelope("me@example.com", "1234")) == ("me@example.com", "1234")
+    with pytest.raises(ValueError):
+        parse_push(b'{"message": {}}')
+
+
+async def test_fetch_and_push_route_use_the_prefetcher(mocker, fake_gmail, worker, mock_access_token):
+    """
+    Test the tool fast path and that the push webhook wakes the worker.
+    """
+    # Arrange
+    mocker.patch("app.main.get_store", return_value=worker.store)
+    mocker.patch("app.main.get_prefetcher", return_value=worker)
+    mocker.patch("app.main.response_cache", ResponseCache(ttl=0))
+    mocker.patch.dict("os.environ", {main.PUSH_TOKEN_ENV: "secret"})
+    await main.prefetch_recent_emails(mock_access_token, max_threads=10)
+    await wait_for(lambda: worker.syncs == 1)
+    fake_gmail.requests.clear()
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mcp.streamable_http_app()),
+                               base_url="http://testserver")
+
+    # Act
+    response = await fetch_recent_emails(mock_access_token, max_threads=10)
+    gmail_calls = list(fake_gmail.requests)
+    pushed = await client.post(f"{main.PUSH_PATH}?token=secret",
+                               content=push_envelope("me@example.com", "2000"))
+    forbidden = await client.post(main.PUSH_PATH, content=push_envelope("me@example.com", "2000"))
+    bad = await client.post(f"{main.PUSH_PATH}?token=secret", content=b"not json")
+
+    # Assert
+    assert response.total == 10
+    assert gmail_calls == []
+    assert (pushed.status_code, forbidden.status_code, bad.status_code) == (204, 403, 400)
+    await wait_for(lambda: worker.syncs == 2)
+
+
+async def test_push_and_changed_syncs_clear_cached_responses(mocker, fake_gmail, worker,
+                                                            mock_access_token):
+    """
+    Test that a push, and a background sync that picked up new mail, drop the
+    account's cached tool responses instead of serving them until the TTL.
+    """
+    # Arrange
+    cache = ResponseCache(ttl=60)
+    mocker.patch("app.main.get_store", return_value=worker.store)
+    mocker.patch("app.main.get_prefetcher", return_value=worker)
+    mocker.patch("app.main.response_cache", cache)
+    account = await worker.register(mock_access_token, max_threads=10)
+    await wait_for(lambda: worker.syncs == 1)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mcp.streamable_http_app()),
+                               base_url="http://testserver")
+    await fetch_recent_emails(mock_access_token, max_threads=10)
+    cached = len(cache._entries)
+
+    # Act
+    await client.post(main.PUSH_PATH, content=push_envelope(account, "2000"))
+    after_push = len(cache._entries)
+    await wait_for(lambda: worker.syncs == 2)
+    await fetch_recent_emails(mock_access_token, max_threads=10)
+    fake_gmail.add_message("thread_new")
+    worker.notify(account)
+    await wait_for(lambda: worker.syncs == 3)
+    response = await fetch_recent_emails(mock_access_token, max_threads=10)
+
+    # Assert
+    assert (cached, after_push) == (1, 0)
+    assert "thread_new" in {e.thread_id for e in response.emails}
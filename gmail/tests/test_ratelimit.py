@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from app.ratelimit import RateLimiter, current_limiter, get_limiter
+from app.transport import AsyncTransport
+
+
+async def test_rate_limiter_allows_burst_then_throttles():
+    """
+    Test that requests beyond the burst wait for tokens to refill.
+    """
+    # Arrange
+    limiter = RateLimiter(rate=100, burst=2)
+
+    # Act
+    start = time.monotonic()
+    for _ in range(4):
+        await limiter.acquire()
+    elapsed = time.monotonic() - start
+
+    # Assert
+    assert elapsed >= 0.015
+    assert limiter.waited > 0
+
+
+def test_rate_limiter_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        RateLimiter(rate=0)
+
+
+def test_get_limiter_is_shared_per_token():
+    assert get_limiter("token_a") is get_limiter("token_a")
+    assert get_limiter("token_a") is not get_limiter("token_b")
+
+
+async def test_transport_throttles_with_current_limiter():
+    """
+    Test that requests made while a limiter is set draw from it.
+    """
+    # Arrange
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+    transport = AsyncTransport(client)
+    limiter = RateLimiter(rate=1, burst=3)
+
+    async def fetch():
+        current_limiter.set(limiter)
+        for _ in range(2):
+            await transport.request("GET", "https://gmail.example/ping")
+
+    # Act
+    await asyncio.create_task(fetch())
+    await transport.request("GET", "https://gmail.example/ping")
+
+    # Assert
+    assert current_limiter.get() is None
+    assert limiter.tokens == pytest.approx(1, abs=0.01)
@@ -0,0 +1,154 @@
+import asyncio
+from app.response_cache import ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def test_hit_within_ttl_and_miss_after_expiry():
+    """
+    Test that values are served until their TTL passes.
+    """
+    # Arrange
+    clock = FakeClock()
+    cache = ResponseCache(ttl=10, clock=clock)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return len(calls)
+
+    # Act
+    first = await cache.get_or_load("key", load)
+    clock.now = 9
+    second = await cache.get_or_load("key", load)
+    clock.now = 11
+    third = await cache.get_or_load("key", load)
+
+    # Assert
+    assert (first, second, third) == (1, 1, 2)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+async def test_lru_eviction():
+    """
+    Test that the least recently used entry is evicted when full.
+    """
+    # Arrange
+    cache = ResponseCache(max_entries=2, ttl=60)
+
+    async def value(v):
+        return v
+
+    await cache.get_or_load("a", lambda: value("a"))
+    await cache.get_or_load("b", lambda: value("b"))
+    await cache.get_or_load("a", lambda: value("a"))  # "b" is now least recent
+
+    # Act
+    await cache.get_or_load("c", lambda: value("c"))
+
+    # Assert
+    assert await cache.get_or_load("a", lambda: value("reloaded")) == "a"
+    assert await cache.get_or_load("b", lambda: value("reloaded")) == "reloaded"
+    assert cache.stats()["evictions"] == 2
+
+
+async def test_concurrent_identical_requests_share_one_load():
+    """
+    Test single-flight deduplication of concurrent misses.
+    """
+    # Arrange
+    cache = ResponseCache(ttl=60)
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "emails"
+
+    # Act
+    results = await asyncio.gather(*[cache.get_or_load("key", load) for _ in range(10)])
+
+    # Assert
+    assert results == ["emails"] * 10
+    assert calls == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["coalesced"] == 9
+
+
+async def test_failed_load_is_shared_but_not_cached():
+    """
+    Test that a failing load propagates to waiters and is retried next time.
+    """
+    # Arrange
+    cache = ResponseCache(ttl=60)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("gmail down")
+
+    async def succeed():
+        return "ok"
+
+    # Act
+    results = await asyncio.gather(
+        cache.get_or_load("key", fail), cache.get_or_load("key", fail),
+        return_exceptions=True,
+    )
+
+    # Assert
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert await cache.get_or_load("key", succeed) == "ok"
+
+
+async def test_cancelled_caller_does_not_cancel_the_shared_load():
+    """
+    Test that waiters still get the value when the caller that started the load is cancelled.
+    """
+    # Arrange
+    cache = ResponseCache(ttl=60)
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return "emails"
+
+    leader = asyncio.create_task(cache.get_or_load("key", load))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(cache.get_or_load("key", load)) for _ in range(3)]
+    await asyncio.sleep(0)
+
+    # Act
+    leader.cancel()
+    results = await asyncio.gather(*waiters)
+
+    # Assert
+    assert leader.cancelled()
+    assert results == ["emails"] * 3
+    assert calls == 1
+    assert await cache.get_or_load("key", load) == "emails"
+
+
+async def test_disabled_cache_always_loads():
+    """
+    Test that ttl=0 bypasses caching entirely.
+    """
+    cache = ResponseCache(ttl=0)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return len(calls)
+
+    assert await cache.get_or_load("key", load) == 1
+    assert await cache.get_or_load("key", load) == 2
+    assert cache.stats()["size"] == 0
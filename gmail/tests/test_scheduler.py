@@ -0,0 +1,99 @@
+import email.utils
+import time
+
+import pytest
+from app.scheduler import RetryPolicy, Scheduler, is_retryable, parse_retry_after
+
+
+async def no_sleep(delay):
+    no_sleep.delays.append(delay)
+
+
+@pytest.fixture(autouse=True)
+def reset_delays():
+    no_sleep.delays = []
+
+
+def test_retry_policy_backs_off_exponentially_with_cap():
+    """
+    Test that the jitter ceiling doubles per attempt up to max_delay.
+    """
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+
+    assert [policy.delay(attempt, rand=lambda: 1.0) for attempt in range(4)] == [1.0, 2.0, 4.0, 5.0]
+    assert policy.delay(3, rand=lambda: 0.0) == 0.0
+
+
+def test_retry_policy_honours_retry_after():
+    policy = RetryPolicy(base_delay=1.0, max_delay=60.0)
+
+    assert policy.delay(0, retry_after=7.0, rand=lambda: 0.5) == 7.0
+
+
+def test_parse_retry_after_formats():
+    future = email.utils.formatdate(time.time() + 30, usegmt=True)
+
+    assert parse_retry_after("12") == 12.0
+    assert 25 < parse_retry_after(future) <= 30
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_rate_limit_403_is_retryable():
+    rate_limited = b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}'
+    forbidden = b'{"error": {"errors": [{"reason": "forbidden"}]}}'
+
+    assert is_retryable(429)
+    assert is_retryable(403, rate_limited)
+    assert not is_retryable(403, forbidden)
+    assert not is_retryable(404)
+
+
+async def test_request_retries_rate_limits_and_server_errors(fake_gmail):
+    """
+    Test that 429 and 5xx answers are retried until the request succeeds.
+    """
+    # Arrange
+    fake_gmail.request_faults = [429, 503]
+    scheduler = Scheduler(units_per_second=0, sleep=no_sleep)
+
+    # Act
+    response = await scheduler.request("token", "GET", "https://gmail.googleapis.com/gmail/v1/users/me/profile", 1)
+
+    # Assert
+    assert response.status_code == 200
+    assert scheduler.retries == 2
+    assert len(no_sleep.delays) == 2
+    assert no_sleep.delays[0] >= 0  # Retry-After: 0 on the 429
+    assert scheduler.units["token"] == 3
+
+
+async def test_request_gives_up_after_max_attempts(fake_gmail):
+    # Arrange
+    fake_gmail.request_faults = [500] * 5
+    scheduler = Scheduler(RetryPolicy(max_attempts=3), units_per_second=0, sleep=no_sleep)
+
+    # Act
+    response = await scheduler.request("token", "GET", "https://gmail.googleapis.com/gmail/v1/users/me/profile", 1)
+
+    # Assert
+    assert response.status_code == 500
+    assert scheduler.retries == 2
+
+
+async def test_charge_waits_for_quota():
+    """
+    Test that spending beyond the user's quota budget waits for it to refill.
+    """
+    # Arrange
+    scheduler = Scheduler(units_per_second=1000)
+    quota = scheduler._quota("token")
+    quota.tokens = 0
+
+    # Act
+    start = time.monotonic()
+    await scheduler.charge("token", 20)
+
+    # Assert
+    assert time.monotonic() - start >= 0.015
+    assert scheduler.units["token"] == 20
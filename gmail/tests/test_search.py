@@ -0,0 +1,234 @@
+import sqlite3
+import time
+
+import pytest
+from app.search import DAY_MS, gmail_query, search_emails
+from app.store import MessageRow, SearchQuery, SQLiteMessageStore
+from app.sync import mark_stale
+from tests.fake_gmail import make_message
+
+NOW = int(time.time() * 1000)
+
+
+def rows():
+    return [
+        MessageRow("m1", "t1", NOW - 3 * DAY_MS, "Alice <alice@example.com>", "Quarterly report", "Numbers attached"),
+        MessageRow("m2", "t2", NOW - 2 * DAY_MS, "Bob <bob@example.com>", "Lunch?", "Pizza at noon"),
+        MessageRow("m3", "t3", NOW - DAY_MS, "Alice <alice@example.com>", "Re: Lunch?", "Reporting for pizza"),
+    ]
+
+
+@pytest.mark.parametrize("fts", [True, False])
+def test_store_search(store, fts):
+    """
+    Test keyword, sender, subject and date filters, with and without FTS5.
+    """
+    # Arrange
+    store.fts = fts
+    store.add_messages("me", rows())
+
+    def ids(**query):
+        return [record.id for record in store.search("me", SearchQuery(**query))]
+
+    # Act / Assert
+    assert ids(text="pizza") == ["m3", "m2"]
+    assert ids(text="report") == ["m3", "m1"]
+    assert ids(sender="alice") == ["m3", "m1"]
+    assert ids(subject="lunch") == ["m3", "m2"]
+    assert ids(sender="alice", text="pizza") == ["m3"]
+    assert ids(since_ms=NOW - 2 * DAY_MS) == ["m3", "m2"]
+    assert ids(until_ms=NOW - 2 * DAY_MS) == ["m1"]
+    assert ids(text="nothing") == []
+
+
+def test_store_search_quotes_query_syntax(store):
+    """
+    Test that FTS5 operators in user input are searched for, not evaluated.
+    """
+    # Arrange
+    store.add_messages("me", rows())
+
+    # Act / Assert
+    for text in ['"pizza', "pizza OR numbers", "NEAR(pizza", "from_:alice", "*"]:
+        store.search("me", SearchQuery(text=text))
+    assert store.search("me", SearchQuery(text="pizza OR numbers")) == []
+
+
+def test_store_index_follows_changes(store):
+    """
+    Test that updated and deleted messages are reflected in the search index.
+    """
+    # Arrange
+    store.add_messages("me", rows())
+
+    # Act
+    store.apply_changes("me", ["t2"], [], [], "2")
+    store.add_messages("me", [rows()[0]._replace(snippet="Budget attached")])
+
+    # Assert
+    assert [r.id for r in store.search("me", SearchQuery(text="pizza"))] == ["m3"]
+    assert store.search("me", SearchQuery(text="numbers")) == []
+    assert [r.id for r in store.search("me", SearchQuery(text="budget"))] == ["m1"]
+
+
+def test_store_migrates_old_sync_state(tmp_path):
+    """
+    Test that a cache created before indexed_since existed is upgraded and indexed.
+    """
+    # Arrange
+    path = str(tmp_path / "cache.db")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE sync_state (account TEXT PRIMARY KEY, history_id TEXT NOT NULL, depth INTEGER)")
+    connection.execute("INSERT INTO sync_state VALUES ('me', '5', 10)")
+    connection.commit()
+    connection.close()
+
+    # Act
+    store = SQLiteMessageStore(path)
+    store.add_messages("me", rows())
+
+    # Assert
+    assert store.get_sync_state("me").indexed_since is None
+    assert [r.id for r in store.search("me", SearchQuery(text="pizza"))] == ["m3", "m2"]
+    store.close()
+
+
+def test_store_rekeys_old_messages_table(tmp_path):
+    """
+    Test that a cache indexed by implicit rowids gets an explicit key, keeps
+    its messages and indexes, and stays searchable across a VACUUM.
+    """
+    # Arrange
+    path = str(tmp_path / "cache.db")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE messages (account TEXT NOT NULL, id TEXT NOT NULL, thread_id TEXT NOT NULL, "
+                       "internal_date BIGINT NOT NULL, from_ TEXT, subject TEXT, snippet TEXT NOT NULL, "
+                       "history_id TEXT, PRIMARY KEY (account, id))")
+    connection.execute("CREATE INDEX messages_by_date ON messages (account, internal_date)")
+    connection.executemany("INSERT INTO messages VALUES ('me', ?, ?, ?, ?, ?, ?, ?)", rows())
+    connection.commit()
+    connection.close()
+
+    # Act
+    store = SQLiteMessageStore(path)
+    store.apply_changes("me", ["t1"], [], [], "2")
+    store.connection.execute("VACUUM")
+
+    # Assert
+    columns = [row[1] for row in store.connection.execute("PRAGMA table_info(messages)")]
+    indexes = {row[1] for row in store.connection.execute("PRAGMA index_list(messages)")}
+    assert columns[0] == "pk"
+    assert {"messages_by_date", "messages_by_thread"} <= indexes
+    assert [r.id for r in store.search("me", SearchQuery(text="pizza"))] == ["m3", "m2"]
+    assert [r.id for r in store.search("me", SearchQuery(sender="bob"))] == ["m2"]
+    store.close()
+
+
+def test_gmail_query():
+    """
+    Test the Gmail search string built for a fallback query.
+    """
+    query = SearchQuery(text="invoice", sender="bob@example.com", subject="Q3 report",
+                        since_ms=1_700_000_000_000, until_ms=1_700_086_400_500)
+    assert gmail_query(query) == ('from:"bob@example.com" subject:"Q3 report" invoice '
+                                  'after:1700000000 before:1700086401')
+
+
+async def test_recent_search_is_answered_from_index(fake_gmail, store, mock_access_token):
+    """
+    Test that the first search backfills the range once and repeats are local.
+    """
+    # Arrange
+    old = make_message("thread_old", 0, internal_date=NOW - 10 * DAY_MS)
+    fake_gmail.threads["thread_old"] = {"id": "thread_old", "historyId": "1", "messages": [old]}
+    query = SearchQuery(text="snippet", since_ms=NOW - 30 * DAY_MS)
+
+    # Act
+    first, first_source = await search_emails(mock_access_token, store, query)
+    fake_gmail.requests.clear()
+    second, second_source = await search_emails(mock_access_token, store, query)
+
+    # Assert
+    assert (first_source, second_source) == ("index", "index")
+    assert len(first) == 11
+    assert first[-1].id == old["id"]
+    assert second == first
+    assert fake_gmail.requests == []
+    assert store.get_sync_state("me@example.com").indexed_since <= query.since_ms
+
+
+async def test_search_after_the_freshness_window_reads_history(fake_gmail, store, monkeypatch,
+                                                              mock_access_token):
+    """
+    Test that the history check is skipped only within the window, and that a
+    push notification ends it early.
+    """
+    # Arrange
+    query = SearchQuery(text="snippet", since_ms=NOW - DAY_MS)
+    await search_emails(mock_access_token, store, query)
+    fake_gmail.requests.clear()
+
+    # Act
+    monkeypatch.setenv("GMAIL_SEARCH_FRESHNESS", "0")
+    await search_emails(mock_access_token, store, query)
+    expired = list(fake_gmail.requests)
+    monkeypatch.delenv("GMAIL_SEARCH_FRESHNESS")
+    fake_gmail.requests.clear()
+    await search_emails(mock_access_token, store, query)
+    fresh = list(fake_gmail.requests)
+    mark_stale("me@example.com")
+    await search_emails(mock_access_token, store, query)
+
+    # Assert
+    assert expired == [("GET", "/gmail/v1/users/me/history")]
+    assert fresh == []
+    assert fake_gmail.requests == [("GET", "/gmail/v1/users/me/history")]
+
+
+async def test_new_mail_is_searchable_after_refresh(fake_gmail, store, mock_access_token):
+    """
+    Test that messages delivered after the backfill are found through history.
+    """
+    # Arrange
+    query = SearchQuery(sender="sender", since_ms=NOW - 7 * DAY_MS)
+    await search_emails(mock_access_token, store, query)
+    message = fake_gmail.add_message("thread_new")
+    mark_stale("me@example.com")
+
+    # Act
+    result, source = await search_emails(mock_access_token, store, query)
+
+    # Assert
+    assert source == "index"
+    assert message["id"] in {record.id for record in result}
+
+
+async def test_old_range_falls_back_to_gmail(fake_gmail, store, mock_access_token):
+    """
+    Test that ranges beyond the backfill limit are searched with Gmail's q.
+    """
+    # Arrange
+    query = SearchQuery(sender="Sender 1", since_ms=NOW - 365 * DAY_MS)
+
+    # Act
+    result, source = await search_emails(mock_access_token, store, query, limit=3)
+
+    # Assert
+    assert source == "gmail"
+    assert fake_gmail.searches[-1] == gmail_query(query)
+    assert len(result) == 3
+    assert all(record.from_.startswith("Sender 1") for record in result)
+
+
+async def test_search_without_store_uses_gmail(fake_gmail, mock_access_token):
+    """
+    Test that a disabled cache sends every search to Gmail.
+    """
+    # Act
+    result, source = await search_emails(mock_access_token, None,
+                                         SearchQuery(since_ms=NOW - DAY_MS), limit=4)
+
+    # Assert
+    assert source == "gmail"
+    assert len(result) == 4
+    assert not any(path.endswith("/history") for _, path in fake_gmail.requests)
@@ -0,0 +1,182 @@
+import os
+import time
+
+import pytest
+from app.gmail_api import get_all_threads_async
+from app.store import MessageRow, SQLiteMessageStore, open_store
+from app.sync import sync_recent_emails
+
+
+def batch_calls(fake):
+    return [r for r in fake.requests if r[1] == "/batch/gmail/v1"]
+
+
+async def test_first_call_does_full_sync(fake_gmail, store, mock_access_token):
+    """
+    Test that an empty cache is filled from a full list + batch fetch.
+    """
+    # Act
+    result = await sync_recent_emails(mock_access_token, store, max_threads=10)
+
+    # Assert
+    assert len(result) == 10
+    assert {e.thread_id for e in result} == set(fake_gmail.threads)
+    assert len(batch_calls(fake_gmail)) == 1
+    assert store.get_sync_state("me@example.com").history_id == "1000"
+
+
+async def test_unchanged_mailbox_is_answered_from_cache(fake_gmail, store, mock_access_token):
+    """
+    Test that a repeat call with no history costs one history.list request.
+    """
+    # Arrange
+    first = await sync_recent_emails(mock_access_token, store, max_threads=10)
+    fake_gmail.requests.clear()
+
+    # Act
+    second = await sync_recent_emails(mock_access_token, store, max_threads=10)
+
+    # Assert
+    assert second == first
+    assert fake_gmail.requests == [("GET", "/gmail/v1/users/me/history")]
+
+
+async def test_history_refetches_only_changed_threads(fake_gmail, store, mock_access_token):
+    """
+    Test that added and deleted messages are applied from history records.
+    """
+    # Arrange
+    await sync_recent_emails(mock_access_token, store, max_threads=10)
+    fake_gmail.requests.clear()
+    added = fake_gmail.add_message("thread_2")
+    fake_gmail.add_message("thread_new")
+    fake_gmail.delete_message("thread_4_msg_0")
+
+    # Act
+    result = await sync_recent_emails(mock_access_token, store, max_threads=10)
+
+    # Assert
+    ids = {e.id for e in result}
+    assert added["id"] in ids
+    assert "thread_new_msg_0" in ids
+    assert "thread_4_msg_0" not in ids
+    assert "thread_4_msg_1" in ids
+
+    fetched = [path for _, path in fake_gmail.requests if path.startswith("/gmail/v1/users/me/threads/")]
+    assert sorted(p.rsplit("/", 1)[1] for p in fetched) == ["thread_2", "thread_4", "thread_new"]
+    assert store.get_sync_state("me@example.com").history_id == str(fake_gmail.history_id)
+
+
+async def test_records_carry_the_thread_history_id(fake_gmail, store, mock_access_token):
+    """
+    Test that only the threads that changed get a new history_id.
+    """
+    # Arrange
+    await sync_recent_emails(mock_access_token, store, max_threads=10)
+    fake_gmail.add_message("thread_2")
+
+    # Act
+    result = await sync_recent_emails(mock_access_token, store, max_threads=10)
+
+    # Assert
+    history_ids = {e.thread_id: e.history_id for e in result}
+    assert history_ids["thread_2"] == str(fake_gmail.history_id)
+    assert history_ids["thread_1"] == "1"
+
+
+async def test_expired_history_falls_back_to_full_sync(fake_gmail, store, mock_access_token):
+    """
+    Test that a 404 from history.list triggers a full resync.
+    """
+    # Arrange
+    await sync_recent_emails(mock_access_token, store, max_threads=10)
+    fake_gmail.add_message("thread_1")
+    fake_gmail.expire_history()
+    fake_gmail.requests.clear()
+
+    # Act
+    result = await sync_recent_emails(mock_access_token, store, max_threads=10)
+
+    # Assert
+    assert len(result) == 11
+    assert len(batch_calls(fake_gmail)) == 1
+
+
+async def test_larger_request_than_synced_does_full_sync(fake_gmail, store, mock_access_token):
+    """
+    Test that asking for more threads than the cache covers resyncs.
+    """
+    # Arrange
+    await sync_recent_emails(mock_access_token, store, max_threads=2)
+    fake_gmail.requests.clear()
+
+    # Act
+    result = await sync_recent_emails(mock_access_token, store, max_threads=5)
+
+    # Assert
+    assert len({e.thread_id for e in result}) == 5
+    assert len(batch_calls(fake_gmail)) == 1
+
+
+async def test_cache_and_direct_fetch_return_the_same_messages(fake_gmail, store, mock_access_token):
+    """
+    Test that an old message in a recently active thread is returned on both paths.
+    """
+    # Arrange
+    three_days_ago = int(time.time() * 1000) - 3 * 24 * 60 * 60 * 1000
+    fake_gmail.threads["thread_0"]["messages"][0]["internalDate"] = str(three_days_ago)
+
+    # Act
+    direct = await get_all_threads_async(mock_access_token, max_threads=10)
+    cached = await sync_recent_emails(mock_access_token, store, max_threads=10)
+
+    # Assert
+    assert len(cached) == len(direct) == 10
+    assert sorted(e.id for e in cached) == sorted(e.id for e in direct)
+    assert "thread_0_msg_0" in {e.id for e in cached}
+
+
+def test_open_store_urls(tmp_path):
+    """
+    Test cache URL parsing, including the disabled setting.
+    """
+    assert open_store("") is None
+    assert isinstance(open_store(f"sqlite:///{tmp_path / 'cache.db'}"), SQLiteMessageStore)
+    with pytest.raises(ValueError):
+        open_store("redis://localhost")
+
+
+def check_failed_write_rolls_back(store):
+    store.replace_all("me", [MessageRow("m1", "t1", 1000, None, "Hi", "Hello")], "1", None)
+    broken = MessageRow("m2", "t1", 2000, None, "Hi", None)
+
+    with pytest.raises(Exception):
+        store.apply_changes("me", ["t1"], [broken], [], "2")
+
+    assert store.get_sync_state("me").history_id == "1"
+    assert [r.id for r in store.recent_messages("me", 0)] == ["m1"]
+    store.apply_changes("me", ["t1"], [broken._replace(snippet="Again")], [], "2")
+    assert [r.id for r in store.recent_messages("me", 0)] == ["m2"]
+
+
+def test_failed_write_is_rolled_back(store):
+    """
+    Test that a failing statement undoes the whole write and leaves the store usable.
+    """
+    check_failed_write_rolls_back(store)
+
+
+@pytest.mark.skipif(not os.environ.get("GMAIL_TEST_CACHE_URL"),
+                    reason="set GMAIL_TEST_CACHE_URL to a scratch Postgres database")
+async def test_postgres_store_recovers_from_failed_write():
+    """
+    Test the rollback against Postgres, which refuses every later statement
+    on a connection left in a failed transaction.
+    """
+    store = open_store(os.environ["GMAIL_TEST_CACHE_URL"])
+    try:
+        check_failed_write_rolls_back(store)
+        assert await store.get_sync_state_async("me") is not None
+        await store.replace_all_async("me", [], "3", None)
+    finally:
+        store.close()
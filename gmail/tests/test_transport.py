@@ -0,0 +1,49 @@
+import asyncio
+import httpx
+from app import transport
+from app.transport import AsyncTransport, get_transport
+
+
+async def test_get_transport_is_shared_within_loop():
+    """
+    Test that repeated calls on one event loop reuse the same pooled client.
+    """
+    # Act
+    first = get_transport()
+    second = get_transport()
+
+    # Assert
+    assert first is second
+    assert not first.client.is_closed
+
+    await transport.aclose_transport()
+    assert first.client.is_closed
+
+
+async def test_per_host_limit_caps_concurrency():
+    """
+    Test that no more than max_per_host requests to one host are in flight.
+    """
+    # Arrange
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    pooled = AsyncTransport(client, max_per_host=3)
+
+    # Act
+    await asyncio.gather(*[
+        pooled.request("GET", "https://gmail.googleapis.com/x") for _ in range(10)
+    ])
+
+    # Assert
+    assert peak == 3
+    await pooled.aclose()
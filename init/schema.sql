@@ -0,0 +1,91 @@
+-- Schema for the postmaster_db Postgres database (docker-compose.yml runs this
+-- on first start). It holds the message cache (GMAIL_CACHE_URL, app/store.py)
+-- and, in separate archive_* tables, the mail archive (GMAIL_ARCHIVE_URL,
+-- app/archive.py). The cache replaces an account's rows on every full sync;
+-- the archive only ever adds or updates, so the two never share a table.
+-- Every statement is idempotent, so it can be applied to an existing database.
+
+-- Trigram indexes serve LOWER(column) LIKE '%term%' searches.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Message cache. The same tables app/store.py creates on open.
+
+-- Sync position of the message cache, per account.
+CREATE TABLE IF NOT EXISTS sync_state (
+    account TEXT PRIMARY KEY,
+    history_id TEXT NOT NULL,
+    depth BIGINT,
+    indexed_since BIGINT,
+    updated_at DOUBLE PRECISION NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    account TEXT NOT NULL,
+    id TEXT NOT NULL,
+    thread_id TEXT NOT NULL,
+    internal_date BIGINT NOT NULL,
+    from_ TEXT,
+    subject TEXT,
+    snippet TEXT NOT NULL,
+    history_id TEXT,
+    PRIMARY KEY (account, id)
+);
+
+CREATE INDEX IF NOT EXISTS messages_by_date ON messages (account, internal_date);
+CREATE INDEX IF NOT EXISTS messages_by_thread ON messages (account, thread_id);
+CREATE INDEX IF NOT EXISTS messages_from_trgm ON messages USING gin (LOWER(from_) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS messages_subject_trgm ON messages USING gin (LOWER(subject) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS messages_snippet_trgm ON messages USING gin (LOWER(snippet) gin_trgm_ops);
+
+-- Mail archive.
+
+CREATE TABLE IF NOT EXISTS archive_threads (
+    account TEXT NOT NULL,
+    id TEXT NOT NULL,
+    history_id TEXT,
+    subject TEXT,
+    message_count INTEGER NOT NULL,
+    first_date BIGINT NOT NULL,
+    last_date BIGINT NOT NULL,
+    PRIMARY KEY (account, id)
+);
+
+-- Most recently active threads first.
+CREATE INDEX IF NOT EXISTS archive_threads_by_last_date ON archive_threads (account, last_date DESC);
+
+CREATE TABLE IF NOT EXISTS archive_messages (
+    account TEXT NOT NULL,
+    id TEXT NOT NULL,
+    thread_id TEXT NOT NULL,
+    internal_date BIGINT NOT NULL,
+    from_ TEXT,
+    subject TEXT,
+    snippet TEXT NOT NULL,
+    history_id TEXT,
+    -- Lower-cased address from the From header, for exact sender lookups.
+    sender TEXT,
+    label_ids TEXT[] NOT NULL DEFAULT '{}',
+    PRIMARY KEY (account, id)
+);
+
+CREATE INDEX IF NOT EXISTS archive_messages_by_date ON archive_messages (account, internal_date);
+CREATE INDEX IF NOT EXISTS archive_messages_by_thread ON archive_messages (account, thread_id);
+CREATE INDEX IF NOT EXISTS archive_messages_by_sender
+    ON archive_messages (account, sender, internal_date DESC);
+CREATE INDEX IF NOT EXISTS archive_messages_subject_trgm
+    ON archive_messages USING gin (LOWER(subject) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS archive_messages_snippet_trgm
+    ON archive_messages USING gin (LOWER(snippet) gin_trgm_ops);
+
+-- Every header of an archived message, in order (names repeat, e.g. Received).
+CREATE TABLE IF NOT EXISTS archive_headers (
+    account TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    position SMALLINT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (account, message_id, position),
+    FOREIGN KEY (account, message_id) REFERENCES archive_messages (account, id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS archive_headers_by_name ON archive_headers (account, LOWER(name));